@@ -8,7 +8,7 @@ Create Date: 2024-01-01 00:00:00.000000
 from alembic import op
 import sqlalchemy as sa
 from sqlalchemy.dialects import postgresql
-import uuid
+from pgvector.sqlalchemy import Vector
 
 # revision identifiers, used by Alembic.
 revision = '001'
@@ -16,12 +16,46 @@ down_revision = None
 branch_labels = None
 depends_on = None
 
+# Number of hash partitions for the interactions table
+INTERACTION_PARTITIONS = 8
+
+# Time-ordered UUIDv7 generator: a random v4 UUID with the first 48 bits
+# overlaid by the millisecond epoch timestamp and the version nibble set to 7
+CREATE_UUIDV7_FN_SQL = """
+CREATE OR REPLACE FUNCTION gen_uuid_v7()
+RETURNS uuid
+AS $$
+BEGIN
+    RETURN encode(
+        set_bit(
+            set_bit(
+                overlay(
+                    uuid_send(gen_random_uuid())
+                    PLACING substring(int8send(floor(extract(epoch FROM clock_timestamp()) * 1000)::bigint) FROM 3)
+                    FROM 1 FOR 6
+                ),
+                52, 1
+            ),
+            53, 1
+        ),
+        'hex'
+    )::uuid;
+END
+$$
+LANGUAGE plpgsql
+VOLATILE;
+"""
+
 
 def upgrade() -> None:
+    op.execute(CREATE_UUIDV7_FN_SQL)
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute('CREATE EXTENSION IF NOT EXISTS vector')
+
     # Create repositories table
     op.create_table(
         'repositories',
-        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True, default=uuid.uuid4),
+        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True, server_default=sa.text('gen_uuid_v7()')),
         sa.Column('full_name', sa.String(255), nullable=False, unique=True),
         sa.Column('html_url', sa.String(512), nullable=False),
         sa.Column('default_branch', sa.String(100), default='main'),
@@ -31,29 +65,26 @@ def upgrade() -> None:
         sa.Column('last_scanned_at', sa.DateTime, nullable=True),
         sa.Column('created_at', sa.DateTime, nullable=False, server_default=sa.func.now()),
     )
-    op.create_index('ix_repositories_full_name', 'repositories', ['full_name'])
-    op.create_index('ix_repositories_owner', 'repositories', ['owner'])
 
     # Create services table
     op.create_table(
         'services',
-        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True, default=uuid.uuid4),
+        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True, server_default=sa.text('gen_uuid_v7()')),
         sa.Column('name', sa.String(255), nullable=False),
         sa.Column('repo_id', postgresql.UUID(as_uuid=True), nullable=False),
         sa.Column('language', sa.String(50), nullable=True),
         sa.Column('path_hint', sa.String(512), nullable=True),
         sa.Column('description', sa.Text, nullable=True),
         sa.Column('homepage', sa.String(512), nullable=True),
-        sa.Column('last_commit_sha', sa.String(40), nullable=True),
+        sa.Column('last_commit_sha', sa.LargeBinary(20), nullable=True),
+        sa.CheckConstraint('octet_length(last_commit_sha) = 20', name='ck_services_last_commit_sha_len'),
         sa.Column('created_at', sa.DateTime, nullable=False, server_default=sa.func.now()),
-        sa.ForeignKeyConstraint(['repo_id'], ['repositories.id'], ondelete='CASCADE'),
     )
-    op.create_index('ix_services_name', 'services', ['name'])
 
     # Create endpoints table
     op.create_table(
         'endpoints',
-        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True, default=uuid.uuid4),
+        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True, server_default=sa.text('gen_uuid_v7()')),
         sa.Column('service_id', postgresql.UUID(as_uuid=True), nullable=False),
         sa.Column('kind', sa.Enum('HTTP', 'Kafka', 'gRPC', 'Other', name='endpointkind'), nullable=False),
         sa.Column('method', sa.String(10), nullable=True),
@@ -63,40 +94,42 @@ def upgrade() -> None:
         sa.Column('protocol', sa.String(50), nullable=True),
         sa.Column('code_ref_file', sa.String(512), nullable=True),
         sa.Column('code_ref_line', sa.Integer, nullable=True),
-        sa.Column('example_payload_json', postgresql.JSON, nullable=True),
+        sa.Column('example_payload_json', postgresql.JSONB, nullable=True),
         sa.Column('created_at', sa.DateTime, nullable=False, server_default=sa.func.now()),
-        sa.ForeignKeyConstraint(['service_id'], ['services.id'], ondelete='CASCADE'),
     )
-    op.create_index('idx_endpoint_service_kind', 'endpoints', ['service_id', 'kind', 'url_path'])
-    op.create_index('idx_endpoint_topic', 'endpoints', ['topic'])
 
-    # Create interactions table
+    # Create interactions table, hash-partitioned by source service so per-service
+    # lookups prune to one partition (the partition key must be part of the PK)
     op.create_table(
         'interactions',
-        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True, default=uuid.uuid4),
-        sa.Column('source_service_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True, server_default=sa.text('gen_uuid_v7()')),
+        sa.Column('source_service_id', postgresql.UUID(as_uuid=True), primary_key=True),
         sa.Column('target_service_id', postgresql.UUID(as_uuid=True), nullable=False),
         sa.Column('edge_type', sa.Enum('HTTP', 'Kafka', 'gRPC', 'Other', name='edgetype'), nullable=False),
         sa.Column('http_method', sa.String(10), nullable=True),
         sa.Column('http_url', sa.String(512), nullable=True),
+        sa.Column('http_url_lower', sa.String(512), sa.Computed('lower(http_url)', persisted=True)),
         sa.Column('kafka_topic', sa.String(255), nullable=True),
         sa.Column('confidence', sa.Float, default=0.5),
         sa.Column('evidence', sa.Text, nullable=True),
-        sa.Column('source_repo_commit_sha', sa.String(40), nullable=True),
+        sa.Column('source_repo_commit_sha', sa.LargeBinary(20), nullable=True),
+        sa.CheckConstraint(
+            'octet_length(source_repo_commit_sha) = 20', name='ck_interactions_source_repo_commit_sha_len'
+        ),
         sa.Column('detected_at', sa.DateTime, nullable=False, server_default=sa.func.now()),
         sa.Column('detector_name', sa.String(100), nullable=True),
-        sa.ForeignKeyConstraint(['source_service_id'], ['services.id'], ondelete='CASCADE'),
-        sa.ForeignKeyConstraint(['target_service_id'], ['services.id'], ondelete='CASCADE'),
+        postgresql_partition_by='HASH (source_service_id)',
     )
-    op.create_index('idx_interaction_source', 'interactions', ['source_service_id'])
-    op.create_index('idx_interaction_target', 'interactions', ['target_service_id'])
-    op.create_index('idx_interaction_edge_type', 'interactions', ['edge_type', 'kafka_topic'])
-    op.create_index('idx_interaction_http', 'interactions', ['http_method', 'http_url'])
+    for remainder in range(INTERACTION_PARTITIONS):
+        op.execute(
+            f'CREATE TABLE interactions_p{remainder} PARTITION OF interactions '
+            f'FOR VALUES WITH (MODULUS {INTERACTION_PARTITIONS}, REMAINDER {remainder})'
+        )
 
     # Create scans table
     op.create_table(
         'scans',
-        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True, default=uuid.uuid4),
+        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True, server_default=sa.text('gen_uuid_v7()')),
         sa.Column('user_id', sa.String(255), nullable=False),
         sa.Column('status', sa.Enum('queued', 'running', 'success', 'error', name='scanstatus'), default='queued'),
         sa.Column('started_at', sa.DateTime, nullable=True),
@@ -104,72 +137,162 @@ def upgrade() -> None:
         sa.Column('error', sa.Text, nullable=True),
         sa.Column('created_at', sa.DateTime, nullable=False, server_default=sa.func.now()),
     )
-    op.create_index('ix_scans_user_id', 'scans', ['user_id'])
 
     # Create scan_targets table
     op.create_table(
         'scan_targets',
-        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True, default=uuid.uuid4),
+        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True, server_default=sa.text('gen_uuid_v7()')),
         sa.Column('scan_id', postgresql.UUID(as_uuid=True), nullable=False),
         sa.Column('repo_id', postgresql.UUID(as_uuid=True), nullable=False),
         sa.Column('branch', sa.String(100), default='main'),
-        sa.Column('commit_sha', sa.String(40), nullable=True),
+        sa.Column('commit_sha', sa.LargeBinary(20), nullable=True),
+        sa.CheckConstraint('octet_length(commit_sha) = 20', name='ck_scan_targets_commit_sha_len'),
         sa.Column('subpath', sa.String(512), nullable=True),
-        sa.ForeignKeyConstraint(['scan_id'], ['scans.id'], ondelete='CASCADE'),
-        sa.ForeignKeyConstraint(['repo_id'], ['repositories.id'], ondelete='CASCADE'),
     )
 
     # Create log_pastes table
     op.create_table(
         'log_pastes',
-        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True, default=uuid.uuid4),
+        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True, server_default=sa.text('gen_uuid_v7()')),
         sa.Column('user_id', sa.String(255), nullable=False),
         sa.Column('content', sa.Text, nullable=False),
         sa.Column('parsed_at', sa.DateTime, nullable=True),
         sa.Column('created_at', sa.DateTime, nullable=False, server_default=sa.func.now()),
     )
-    op.create_index('ix_log_pastes_user_id', 'log_pastes', ['user_id'])
 
     # Create implications table
     op.create_table(
         'implications',
-        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True, default=uuid.uuid4),
+        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True, server_default=sa.text('gen_uuid_v7()')),
         sa.Column('log_id', postgresql.UUID(as_uuid=True), nullable=False),
         sa.Column('service_id', postgresql.UUID(as_uuid=True), nullable=False),
         sa.Column('reason', sa.Text, nullable=True),
         sa.Column('confidence', sa.Float, default=0.5),
         sa.Column('created_at', sa.DateTime, nullable=False, server_default=sa.func.now()),
-        sa.ForeignKeyConstraint(['log_id'], ['log_pastes.id'], ondelete='CASCADE'),
-        sa.ForeignKeyConstraint(['service_id'], ['services.id'], ondelete='CASCADE'),
     )
 
     # Create doc_chunks table
     op.create_table(
         'doc_chunks',
-        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True, default=uuid.uuid4),
+        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True, server_default=sa.text('gen_uuid_v7()')),
         sa.Column('repo_id', postgresql.UUID(as_uuid=True), nullable=True),
         sa.Column('service_id', postgresql.UUID(as_uuid=True), nullable=True),
         sa.Column('file_path', sa.String(512), nullable=False),
         sa.Column('content', sa.Text, nullable=False),
-        sa.Column('sha', sa.String(40), nullable=True),
+        sa.Column('sha', sa.LargeBinary(20), nullable=True),
+        sa.CheckConstraint('octet_length(sha) = 20', name='ck_doc_chunks_sha_len'),
         sa.Column('chunk_index', sa.Integer, default=0),
-        sa.Column('embedding', sa.Text, nullable=True),  # JSON array for now
+        sa.Column('embedding', Vector(1536), nullable=True),  # text-embedding-ada-002
         sa.Column('created_at', sa.DateTime, nullable=False, server_default=sa.func.now()),
-        sa.ForeignKeyConstraint(['repo_id'], ['repositories.id'], ondelete='CASCADE'),
-        sa.ForeignKeyConstraint(['service_id'], ['services.id'], ondelete='CASCADE'),
     )
-    op.create_index('idx_doc_chunk_repo', 'doc_chunks', ['repo_id'])
-    op.create_index('idx_doc_chunk_service', 'doc_chunks', ['service_id'])
 
     # Create service_graph table
     op.create_table(
         'service_graph',
-        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True, default=uuid.uuid4),
+        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True, server_default=sa.text('gen_uuid_v7()')),
         sa.Column('service_id', postgresql.UUID(as_uuid=True), nullable=False, unique=True),
         sa.Column('in_degree', sa.Integer, default=0),
         sa.Column('out_degree', sa.Integer, default=0),
         sa.Column('last_computed_at', sa.DateTime, nullable=False, server_default=sa.func.now()),
-        sa.ForeignKeyConstraint(['service_id'], ['services.id'], ondelete='CASCADE'),
+    )
+
+    # Secondary indexes and foreign keys are added once every table exists (and
+    # after any backfill) so bulk loads skip per-row FK checks and index maintenance
+    op.create_index('ix_repositories_owner', 'repositories', ['owner'])
+    op.create_index('ix_services_name', 'services', ['name'])
+    op.create_index('idx_endpoint_service_kind', 'endpoints', ['service_id', 'kind', 'url_path'])
+    op.create_index('ix_scans_user_id', 'scans', ['user_id'])
+    op.create_index('ix_log_pastes_user_id', 'log_pastes', ['user_id'])
+    op.create_index('idx_doc_chunk_repo', 'doc_chunks', ['repo_id'])
+    op.create_index('idx_doc_chunk_service', 'doc_chunks', ['service_id'])
+    op.create_index('ix_doc_chunks_sha', 'doc_chunks', ['sha'])
+    op.create_index(
+        'idx_interaction_src_tgt', 'interactions', ['source_service_id', 'target_service_id'],
+        postgresql_include=['edge_type', 'kafka_topic', 'http_url'],
+    )
+    op.create_index(
+        'idx_interaction_tgt_src', 'interactions', ['target_service_id', 'source_service_id'],
+        postgresql_include=['edge_type', 'kafka_topic', 'http_url'],
+    )
+    op.execute(
+        "CREATE INDEX idx_interaction_kafka ON interactions (kafka_topic) "
+        "INCLUDE (source_service_id, target_service_id) "
+        "WHERE edge_type = 'Kafka'"
+    )
+    op.execute(
+        "CREATE INDEX idx_interaction_http ON interactions (http_url) "
+        "INCLUDE (source_service_id, target_service_id, http_method) "
+        "WHERE edge_type = 'HTTP'"
+    )
+    op.create_index(
+        'ix_interaction_url_lower', 'interactions', ['http_url_lower'],
+        postgresql_ops={'http_url_lower': 'text_pattern_ops'},
+    )
+
+    # Expression index for case-insensitive name equality and prefix lookups
+    op.create_index('ix_services_name_lower', 'services', [sa.text('lower(name) text_pattern_ops')])
+
+    # Trigram indexes back the '%...%' substring lookups done by the agents
+    op.create_index(
+        'ix_services_name_trgm', 'services', [sa.text('lower(name) gin_trgm_ops')],
+        postgresql_using='gin',
+    )
+    op.create_index(
+        'ix_interactions_http_url_trgm', 'interactions', ['http_url'],
+        postgresql_using='gin', postgresql_ops={'http_url': 'gin_trgm_ops'},
+    )
+
+    # Approximate nearest-neighbour index for doc chunk retrieval
+    op.create_index(
+        'ix_doc_chunks_embedding', 'doc_chunks', ['embedding'],
+        postgresql_using='ivfflat',
+        postgresql_ops={'embedding': 'vector_cosine_ops'},
+        postgresql_with={'lists': 100},
+    )
+
+    op.create_foreign_key(
+        'fk_services_repo_id', 'services', 'repositories', ['repo_id'], ['id'],
+        ondelete='CASCADE', deferrable=True, initially='DEFERRED',
+    )
+    op.create_foreign_key(
+        'fk_endpoints_service_id', 'endpoints', 'services', ['service_id'], ['id'],
+        ondelete='CASCADE', deferrable=True, initially='DEFERRED',
+    )
+    op.create_foreign_key(
+        'fk_interactions_source_service_id', 'interactions', 'services', ['source_service_id'], ['id'],
+        ondelete='CASCADE', deferrable=True, initially='DEFERRED',
+    )
+    op.create_foreign_key(
+        'fk_interactions_target_service_id', 'interactions', 'services', ['target_service_id'], ['id'],
+        ondelete='CASCADE', deferrable=True, initially='DEFERRED',
+    )
+    op.create_foreign_key(
+        'fk_scan_targets_scan_id', 'scan_targets', 'scans', ['scan_id'], ['id'],
+        ondelete='CASCADE', deferrable=True, initially='DEFERRED',
+    )
+    op.create_foreign_key(
+        'fk_scan_targets_repo_id', 'scan_targets', 'repositories', ['repo_id'], ['id'],
+        ondelete='CASCADE', deferrable=True, initially='DEFERRED',
+    )
+    op.create_foreign_key(
+        'fk_implications_log_id', 'implications', 'log_pastes', ['log_id'], ['id'],
+        ondelete='CASCADE', deferrable=True, initially='DEFERRED',
+    )
+    op.create_foreign_key(
+        'fk_implications_service_id', 'implications', 'services', ['service_id'], ['id'],
+        ondelete='CASCADE', deferrable=True, initially='DEFERRED',
+    )
+    op.create_foreign_key(
+        'fk_doc_chunks_repo_id', 'doc_chunks', 'repositories', ['repo_id'], ['id'],
+        ondelete='CASCADE', deferrable=True, initially='DEFERRED',
+    )
+    op.create_foreign_key(
+        'fk_doc_chunks_service_id', 'doc_chunks', 'services', ['service_id'], ['id'],
+        ondelete='CASCADE', deferrable=True, initially='DEFERRED',
+    )
+    op.create_foreign_key(
+        'fk_service_graph_service_id', 'service_graph', 'services', ['service_id'], ['id'],
+        ondelete='CASCADE', deferrable=True, initially='DEFERRED',
     )
 
 
@@ -191,3 +314,7 @@ def downgrade() -> None:
     op.execute('DROP TYPE IF EXISTS endpointkind')
     op.execute('DROP TYPE IF EXISTS direction')
 
+    op.execute('DROP FUNCTION IF EXISTS gen_uuid_v7()')
+    op.execute('DROP EXTENSION IF EXISTS pg_trgm')
+    op.execute('DROP EXTENSION IF EXISTS vector')
+
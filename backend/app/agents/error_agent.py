@@ -1,57 +1,108 @@
 """Error analyzer agent"""
 from crewai import Agent, Task, Crew
-from langchain_openai import ChatOpenAI
+from app.agents.llm import get_llm
 from app.config import settings
-from app.db.models import Service, Interaction, Repository
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from typing import Dict, Any, List, Set, Optional
+from app.db.invalidation import on_graph_change
+from app.db.models import Service, Interaction, Repository, EdgeType
+from app.services.code_fetch import CodeFetchService
+from app.services.detectors.kafka_python import PythonKafkaDetector
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy import Row, bindparam, func, select, or_
+from typing import Dict, Any, FrozenSet, Iterator, List, Set, Optional, Tuple
+import heapq
 import re
+import string
 import logging
 import asyncio
+import time
 import uuid
 from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from urllib.parse import urlparse
 
 logger = logging.getLogger(__name__)
 
+# Interaction columns needed to describe an edge; selecting them directly skips ORM hydration
+EDGE_COLUMNS = (
+    Interaction.source_service_id,
+    Interaction.target_service_id,
+    Interaction.edge_type,
+    Interaction.http_url,
+    Interaction.kafka_topic,
+)
+
+# Only the columns analyze() reads from the source service; rows skip ORM hydration
+SERVICE_LOOKUP_COLUMNS = (Service.id, Service.name, Service.repo_id)
+
+# Edge queries are streamed in batches of this many rows instead of being materialized at once
+EDGE_STREAM_BATCH_SIZE = 500
+
+# Hot lookups are built once with bound parameters: every call reuses the same statement object,
+# so SQLAlchemy's compiled cache and asyncpg's prepared statements are hit without rebuilding it
+_CONNECTIONS_STMT = select(*EDGE_COLUMNS).where(
+    or_(
+        Interaction.target_service_id == bindparam("service_id"),
+        Interaction.source_service_id == bindparam("service_id"),
+    )
+).execution_options(yield_per=EDGE_STREAM_BATCH_SIZE)
+# Case-insensitive name match, preferring the exact spelling if both exist
+_SERVICE_BY_NAME_STMT = (
+    select(*SERVICE_LOOKUP_COLUMNS)
+    .where(func.lower(Service.name) == bindparam("name_lower"))
+    .order_by((Service.name == bindparam("name")).desc())
+    .limit(1)
+)
+
+
+# Patterns used by clean_text_for_chat, compiled once at import time
+# Emoji ranges condensed into contiguous blocks (the enclosed-characters block already
+# spans dingbats, flags and the VS16 selector); ZWJ is added so joined sequences go too
+EMOJI_RE = re.compile(
+    "["
+    "\u200d"  # zero width joiner
+    "\u24c2-\U0001F251"  # enclosed characters, dingbats, VS16, flags
+    "\U0001F300-\U0001F64F"  # symbols & pictographs, emoticons
+    "\U0001F680-\U0001F6FF"  # transport & map symbols
+    "\U0001F900-\U0001FAFF"  # supplemental symbols, chess, extended-A
+    "]+"
+)
+TRIPLE_BACKTICK_RE = re.compile(r'```[a-z]*\n?')  # Also matches bare ```
+EMPHASIS_RUN_RE = re.compile(r'\*{2,}|_{2,}')  # Runs of asterisks or underscores
+NEWLINE_RE = re.compile(r'\n{3,}')
+SPACE_RE = re.compile(r' {2,}')
+# Anything the passes below would change, apart from leading/trailing whitespace:
+# fences, emphasis runs, blank-line runs, double spaces, tabs etc., or padded line ends
+NEEDS_CLEANING_RE = re.compile(r'```|\*\*|__|\n\n\n|  |[^\S \n]| \n|\n ')
+
+# Placeholders in templated URLs such as {SERVICE_URL}/items/{item_id}, used by _format_url
+_URL_TEMPLATE_PREFIX_RE = re.compile(r'^\{[^}]+\}')
+_URL_TEMPLATE_VAR_RE = re.compile(r'\{[^}]+\}')
+
 
 def clean_text_for_chat(text: str) -> str:
     """Remove emojis and extraneous characters to make text human-readable"""
     if not text:
         return text
     
-    # Remove emojis using regex (covers most Unicode emoji ranges)
-    emoji_pattern = re.compile(
-        "["
-        "\U0001F600-\U0001F64F"  # emoticons
-        "\U0001F300-\U0001F5FF"  # symbols & pictographs
-        "\U0001F680-\U0001F6FF"  # transport & map symbols
-        "\U0001F1E0-\U0001F1FF"  # flags
-        "\U00002702-\U000027B0"  # dingbats
-        "\U000024C2-\U0001F251"  # enclosed characters
-        "\U0001F900-\U0001F9FF"  # supplemental symbols
-        "\U0001FA00-\U0001FA6F"  # chess symbols
-        "\U0001FA70-\U0001FAFF"  # symbols and pictographs extended-A
-        "]+",
-        flags=re.UNICODE
-    )
-    text = emoji_pattern.sub('', text)
+    # Plain ASCII with nothing to clean (the usual case) only needs the outer strip
+    if text.isascii() and not NEEDS_CLEANING_RE.search(text):
+        return text.strip()
+    
+    # Remove emojis (covers most Unicode emoji ranges); pure ASCII text has none
+    if not text.isascii():
+        text = EMOJI_RE.sub('', text)
     
     # Remove excessive markdown formatting (keep basic structure)
     # Remove triple backticks (code blocks) but keep content
-    text = re.sub(r'```[a-z]*\n?', '', text)
-    text = re.sub(r'```', '', text)
-    
-    # Remove excessive asterisks/bold formatting (keep single asterisks for emphasis if needed)
-    # Replace multiple asterisks with single space
-    text = re.sub(r'\*{2,}', ' ', text)
+    text = TRIPLE_BACKTICK_RE.sub('', text)
     
-    # Remove excessive underscores
-    text = re.sub(r'_{2,}', ' ', text)
+    # Remove excessive asterisks/bold formatting and underscores (keep single ones for emphasis)
+    # Replace each run with a single space
+    text = EMPHASIS_RUN_RE.sub(' ', text)
     
     # Clean up excessive whitespace
-    text = re.sub(r'\n{3,}', '\n\n', text)  # Max 2 consecutive newlines
-    text = re.sub(r' {2,}', ' ', text)  # Max 1 space between words
+    text = NEWLINE_RE.sub('\n\n', text)  # Max 2 consecutive newlines
+    text = SPACE_RE.sub(' ', text)  # Max 1 space between words
     
     # Remove leading/trailing whitespace from each line
     lines = [line.strip() for line in text.split('\n')]
@@ -63,23 +114,187 @@ def clean_text_for_chat(text: str) -> str:
     return text
 
 
+def _like_escape(value: str) -> str:
+    """Escape LIKE wildcards in value so it matches literally (escape character is a backslash)"""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _like_contains(value: str) -> str:
+    """Build a LIKE pattern matching value as a literal substring"""
+    return f"%{_like_escape(value)}%"
+
+
+def _like_ends_with(value: str) -> str:
+    """Build a LIKE pattern matching strings that end with value"""
+    return f"%{_like_escape(value)}"
+
+
+def _format_url(url: str, max_length: int = 45) -> str:
+    """Format URL to fit in chat box"""
+    if not url:
+        return ""
+    # Extract path if it's a full URL
+    if url.startswith('http://') or url.startswith('https://'):
+        parsed = urlparse(url)
+        path = parsed.path
+        if path:
+            url = path
+    
+    # Handle template strings like {SERVICE_URL}/path/{variable}
+    if '{' in url:
+        # Extract path part after variable placeholders
+        # Example: {INVENTORY_SERVICE_URL}/inventory/{item.product_id}/reserve
+        # Result: /inventory/{item.product_id}/reserve
+        # Remove {VARIABLE} patterns at the start
+        url = _URL_TEMPLATE_PREFIX_RE.sub('', url)
+        # If URL doesn't start with /, add it
+        if url and not url.startswith('/'):
+            url = '/' + url
+        # Simplify variable placeholders in path
+        # Replace {variable} with {...} for readability
+        url = _URL_TEMPLATE_VAR_RE.sub('{...}', url)
+    
+    # Truncate if too long
+    if len(url) > max_length:
+        # Try to keep the beginning and end
+        if '/' in url:
+            parts = url.split('/')
+            if len(parts) > 2:
+                # Keep first and last part
+                return f"/{parts[1]}/.../{parts[-1]}"
+        return url[:max_length-3] + "..."
+    return url
+
+
+# Recent name -> service row lookups, cleared whenever a commit writes the graph tables
+SERVICE_LOOKUP_TTL_SECONDS = 30.0
+SERVICE_LOOKUP_CACHE_SIZE = 1024
+_service_lookup_cache: Dict[str, Tuple[float, Row]] = {}
+
+
+@on_graph_change
+def clear_service_lookup_cache() -> None:
+    """Forget cached service lookups; runs after every commit that writes the graph tables"""
+    _service_lookup_cache.clear()
+
+
+def _cached_service_lookup(service_name: str) -> Optional[Row]:
+    """Service row cached for this name within the TTL, if any"""
+    cached = _service_lookup_cache.get(service_name)
+    if cached and time.monotonic() - cached[0] < SERVICE_LOOKUP_TTL_SECONDS:
+        return cached[1]
+    return None
+
+
+# Kafka topics detected per (repo, ref) by repo scans, so repeat analyses skip the MCP fetch
+REPO_TOPICS_TTL_SECONDS = 300.0
+REPO_TOPICS_CACHE_SIZE = 128
+_repo_topics_cache: Dict[Tuple[str, str], Tuple[float, FrozenSet[str]]] = {}
+
+
+# Task description for the error analysis crew; only $log_text varies per request
+_ANALYSIS_PROMPT = string.Template("""
+            Analyze the following error log and provide a detailed analysis:
+            
+            $log_text
+            
+            From this error log, identify:
+            1. What is the error? (Describe the error clearly)
+            2. Why has it occurred? (Root cause analysis)
+            3. Which service is the source of this error? (CRITICAL: Return ONLY the exact service name where the error occurred, such as "user-service" or "order-service". Do NOT include words like "the" or "is" - just the service name itself like "user-service")
+            4. How to debug it? (Step-by-step debugging approach)
+            5. What endpoints or connections might be affected? (HTTP endpoints, Kafka topics mentioned)
+            
+            IMPORTANT: 
+            - For question 3, return ONLY the service name in the format "service-name" (e.g., "user-service", "order-service", "cart-service")
+            - Do NOT write "the user-service" or "is user-service" - just write "user-service"
+            - Extract service names from the log text directly if mentioned (look for patterns like "user-service", "order-service", etc.)
+            - Identify any HTTP endpoints mentioned (e.g., "/users/{user_id}/validate")
+            - Identify any Kafka topics mentioned
+            - Do NOT list all services in the system, only those directly mentioned or connected in the log
+            
+            Format your response with clear sections. For the service name, write it as: "Source service: user-service" (with the actual service name from the log).
+            """)
+
+
+# Shared pool for blocking CrewAI runs, so threads aren't spun up per request
+_CREW_EXECUTOR = ThreadPoolExecutor(max_workers=settings.crew_workers, thread_name_prefix="crewai")
+# Caps crew runs in flight at the pool size, so every admitted run has a free worker and the
+# rest queue here (and stay cancellable) rather than in the executor's queue
+_CREW_SEMAPHORE = asyncio.Semaphore(settings.crew_workers)
+
+
 class ErrorAgent:
     """Agent for analyzing error logs and identifying affected services"""
     
-    def __init__(self, db_session: AsyncSession, mcp_client=None):
+    # Service name patterns, each run over the whole log. Their matches overlap ("ERROR user_service",
+    # "user-service: payments"), which a single alternation would not allow, so the scans are merged
+    # by position instead
+    _SERVICE_NAME_RXS = tuple(re.compile(pattern, re.IGNORECASE) for pattern in (
+        r'([a-z][a-z-]*-service)',  # "user-service", "order-service", etc.
+        r'([a-z][a-z-]*_service)',  # "user_service", etc.
+        r'service[:\s]+([a-z][a-z-]+)',  # "service: user" or "service user"
+        r'ERROR\s+([a-z][a-z-]*(?:-service)?)',  # "ERROR user-service"
+    ))
+    # Bounds for substring lookups so vague log fragments can't match whole tables
+    MIN_PARTIAL_MATCH_LENGTH = 3
+    MIN_URL_LENGTH = 4
+    # Service names listed when the source service isn't in the database
+    SERVICE_LISTING_SIZE = 20
+    
+    _URL_RX = re.compile(r'https?://[^\s]+|/[a-z0-9/_-]+')
+    _KAFKA_TOPIC_RXS = (
+        re.compile(r'topic[:\s]+([a-z0-9._-]+)', re.IGNORECASE),
+        re.compile(r'kafka[:\s]+([a-z0-9._-]+)', re.IGNORECASE),
+    )
+    
+    # Source-service patterns for the CrewAI analysis text, tried in priority order.
+    # Each is paired with a literal it cannot match without, checked on the folded text
+    # first so patterns that can't match are never run (keeps the priority order intact,
+    # which a single alternation would not)
+    _ANALYSIS_SERVICE_RXS = tuple((literal, re.compile(pattern, re.IGNORECASE)) for literal, pattern in (
+        ('source service', r'source service[:\s]+([a-z][a-z-]*-service)'),  # "Source service: user-service"
+        ('source of this error is', r'source of this error is (?:the\s+)?[\'"]([a-z][a-z-]*(?:-service)?)[\'"]'),
+        ('source service', r'source service[:\s]+(?:is\s+)?(?:the\s+)?[\'"]?([a-z][a-z-]*(?:-service)?)[\'"]?'),
+        ('source service is', r'source service is (?:the\s+)?[\'"]?([a-z][a-z-]*(?:-service)?)[\'"]?'),
+        ('error occurred in', r'error occurred in[:\s]+(?:the\s+)?[\'"]?([a-z][a-z-]*(?:-service)?)[\'"]?'),
+        ('error originate', r'error originates? from[:\s]+(?:the\s+)?[\'"]?([a-z][a-z-]*(?:-service)?)[\'"]?'),
+        # Pattern to match "user-service" or "user_service" in quotes or after "is"
+        ('service', r'(?:is|are|the)\s+[\'"]?([a-z][a-z]+(?:[-_][a-z]+)*(?:-service|_service))[\'"]?'),
+        # Match service names that explicitly contain "service"
+        ('-service', r'[\'"]([a-z][a-z-]*-service)[\'"]'),
+        ('-service', r'([a-z][a-z-]*-service)(?:\s|$|[,.])'),
+    ))
+    # Non-ASCII characters IGNORECASE treats as equal to an ASCII letter, so the literal
+    # prefilter never rejects text one of the patterns would match
+    _ASCII_FOLD = str.maketrans({'\u0130': 'i', '\u0131': 'i', '\u017f': 's', '\u212a': 'k'})
+    # Common words to exclude from service name matches
+    _COMMON_WORDS = frozenset({'the', 'is', 'are', 'was', 'were', 'a', 'an', 'this', 'that', 'which', 'where'})
+    _DEBUG_STEPS_RX = re.compile(
+        r'(?:how to debug|debugging|debug steps?)[:\s]+(.+?)(?:\n\n|\n##|$)',
+        re.IGNORECASE | re.DOTALL,
+    )
+    
+    def __init__(
+        self,
+        db_session: AsyncSession,
+        mcp_client=None,
+        session_factory: Optional[async_sessionmaker] = None,
+    ):
         self.db_session = db_session
         self.mcp_client = mcp_client
-        self.llm = ChatOpenAI(
-            model="gpt-4o",
-            temperature=0.1,
-            openai_api_key=settings.openai_api_key,
-        )
+        # Optional factory for short-lived sessions that can run alongside db_session
+        self.session_factory = session_factory
+        # analyze() extracts service names from the same log several times; scan it once
+        self._service_names_cache: Dict[str, List[str]] = {}
+        self.llm = get_llm()
         
+        # The Agent stays per instance: CrewAI stores executor state on it while a task runs
         self.agent = Agent(
             role="Error Log Analyzer",
             goal="Analyze error logs to identify the service where error occurred, understand the error, and determine which other services are affected through HTTP calls or Kafka connections",
             backstory="You are an expert at analyzing system logs and tracing errors across microservice architectures. You understand HTTP calls, Kafka events, and service dependencies. You can identify service names, endpoints, and connection patterns from error logs.",
-            verbose=True,
+            verbose=settings.debug,
             llm=self.llm,
             allow_delegation=False,
         )
@@ -116,24 +331,36 @@ class ErrorAgent:
                 }
             
             # Step 3: Find source service in database
-            source_service = await self._find_service_by_name(source_service_name)
+            # The available-services listing is only needed on a miss; when the lookup has to go
+            # to the database and a second session is available, fetch it concurrently so a miss
+            # doesn't pay another round trip
+            source_service, service_listing = _cached_service_lookup(source_service_name), None
+            if source_service is None:
+                if self.session_factory is not None:
+                    source_service, service_listing = await asyncio.gather(
+                        self._find_service_by_name(source_service_name),
+                        self._fetch_service_names(),
+                    )
+                else:
+                    source_service = await self._find_service_by_name(source_service_name)
             if not source_service:
                 raw_reasoning = analysis_result.get("analysis", "")
-                clean_reasoning = clean_text_for_chat(raw_reasoning)
                 
                 # Get list of available services for helpful error message
-                available_services_result = await self.db_session.execute(select(Service.name))
-                available_services = [s[0] for s in available_services_result.all()]
-                available_services_list = "\n".join([f"  - {name}" for name in available_services[:20]])  # Show first 20
+                if service_listing is None:
+                    service_listing = await self._load_service_names(self.db_session)
+                available_services, total_services = service_listing
+                available_services_list = "\n".join([f"  - {name}" for name in available_services])
                 
                 # Build additional services text (avoiding backslash in f-string)
                 additional_services_text = ""
-                if len(available_services) > 20:
-                    additional_services_text = "\n  ... and " + str(len(available_services) - 20) + " more"
+                if total_services > self.SERVICE_LISTING_SIZE:
+                    additional_services_text = "\n  ... and " + str(total_services - self.SERVICE_LISTING_SIZE) + " more"
                 
                 debug_steps_text = analysis_result.get("debug_steps", "Review the error log and check service health endpoints")
                 
-                error_reasoning = f"""{clean_reasoning}
+                # Cleaned once as a whole below, so the analysis is not scanned twice
+                error_reasoning = f"""{raw_reasoning}
 
 GRAPH VISUALIZATION
 
@@ -146,7 +373,7 @@ To visualize the error impact:
 2. Run a scan to populate services in the database
 3. Try the error analyzer again
 
-Available services in database ({len(available_services)} total):
+Available services in database ({total_services} total):
 {available_services_list if available_services else "  - No services found. Please run a scan first."}{additional_services_text}
 
 HOW TO FIX THE ERROR
@@ -168,7 +395,9 @@ HOW TO FIX THE ERROR
                     "reasoning": clean_text_for_chat(error_reasoning),
                 }
             
-            source_service_id = str(source_service.id)
+            # IDs stay uuid.UUID internally and are stringified only for the response
+            source_service_uuid = source_service.id
+            source_service_id = str(source_service_uuid)
             logger.info(f"Found source service: {source_service_name} (ID: {source_service_id})")
             
             # Step 4: Find connections from database (services connected to primary service)
@@ -176,8 +405,8 @@ HOW TO FIX THE ERROR
             # These are services that CALL the primary service, so they will be affected if primary fails
             direct_connections = await self._find_connections_from_db(source_service_id)
             logger.info(f"Found {len(direct_connections)} direct connections from DB for {source_service_name}")
-            if direct_connections:
-                logger.info(f"Direct connections: {direct_connections}")
+            if direct_connections and logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Direct connections: %s", direct_connections)
             
             # Step 5: If no connections found, scan GitHub repo using MCP
             if not direct_connections and self.mcp_client:
@@ -188,36 +417,43 @@ HOW TO FIX THE ERROR
                     logger.info(f"Found {len(repo_connections)} connections from repo scan")
             
             # Step 6: Find domino effects (services affected by directly affected services)
-            domino_connections = await self._find_domino_effects(direct_connections, source_service_id)
+            domino_connections = await self._find_domino_effects(direct_connections, source_service_uuid)
             
             # Step 7: Build result structure
             # Primary service = source_service_id (BLUE)
             # Dependent services = services connected to primary (RED)
-            dependent_service_ids = set()
+            dependent_service_ids: Set[uuid.UUID] = set()
             affected_edges = []  # Edges from primary to dependent services (RED)
+            seen_edges: Set[Tuple[uuid.UUID, uuid.UUID, str]] = set()  # Dedupe edges as they stream in
             direct_dependent_services = {}  # {service_id: {type, url, topic, reason}}
             domino_dependent_services = {}  # {service_id: {type, url, topic, reason, via_service}}
             
             # Process direct connections - find services that depend on primary
             logger.info(f"Processing {len(direct_connections)} direct connections...")
+            # Per-edge detail only at DEBUG; counts are summarised once after the loop
+            debug_enabled = logger.isEnabledFor(logging.DEBUG)
+            marked_callers = marked_callees = 0
             for conn in direct_connections:
-                conn_source = str(conn["source_service_id"])
-                conn_target = str(conn["target_service_id"])
+                conn_source = conn["source_service_id"]
+                conn_target = conn["target_service_id"]
                 conn_type = conn.get("type", "HTTP")
                 conn_url = conn.get("url", "")
                 conn_topic = conn.get("topic", "")
                 
                 # Primary service is the target - services that CALL it are dependent/affected
                 # Example: cart-service calls user-service (primary) -> cart-service is dependent
-                if conn_target == source_service_id:
-                    dependent_service_id = conn_source
-                    dependent_service_ids.add(dependent_service_id)
+                if conn_target == source_service_uuid:
+                    dependent_service_ids.add(conn_source)
+                    dependent_service_id = str(conn_source)
                     # Edge from dependent service TO primary service
-                    affected_edges.append({
-                        "source": dependent_service_id,  # Dependent service (RED)
-                        "target": source_service_id,  # Primary service (BLUE)
-                        "type": conn_type,
-                    })
+                    edge_key = (conn_source, source_service_uuid, conn_type)
+                    if edge_key not in seen_edges:
+                        seen_edges.add(edge_key)
+                        affected_edges.append({
+                            "source": dependent_service_id,  # Dependent service (RED)
+                            "target": source_service_id,  # Primary service (BLUE)
+                            "type": conn_type,
+                        })
                     direct_dependent_services[dependent_service_id] = {
                         "type": conn_type,
                         "url": conn_url,
@@ -226,19 +462,24 @@ HOW TO FIX THE ERROR
                                  (f" (URL: {conn_url})" if conn_url else "") +
                                  (f" (Topic: {conn_topic})" if conn_topic else "")
                     }
-                    logger.info(f"  Marked service {dependent_service_id} as dependent (calls primary {source_service_id})")
+                    marked_callers += 1
+                    if debug_enabled:
+                        logger.debug("  Marked service %s as dependent (calls primary %s)", dependent_service_id, source_service_id)
                 
                 # Primary service is the source - services it CALLS might also be affected if primary fails
                 # Example: user-service (primary) calls payment-service -> payment-service is dependent
-                elif conn_source == source_service_id:
-                    dependent_service_id = conn_target
-                    dependent_service_ids.add(dependent_service_id)
+                elif conn_source == source_service_uuid:
+                    dependent_service_ids.add(conn_target)
+                    dependent_service_id = str(conn_target)
                     # Edge from primary service TO dependent service
-                    affected_edges.append({
-                        "source": source_service_id,  # Primary service (BLUE)
-                        "target": dependent_service_id,  # Dependent service (RED)
-                        "type": conn_type,
-                    })
+                    edge_key = (source_service_uuid, conn_target, conn_type)
+                    if edge_key not in seen_edges:
+                        seen_edges.add(edge_key)
+                        affected_edges.append({
+                            "source": source_service_id,  # Primary service (BLUE)
+                            "target": dependent_service_id,  # Dependent service (RED)
+                            "type": conn_type,
+                        })
                     direct_dependent_services[dependent_service_id] = {
                         "type": conn_type,
                         "url": conn_url,
@@ -247,40 +488,37 @@ HOW TO FIX THE ERROR
                                  (f" (URL: {conn_url})" if conn_url else "") +
                                  (f" (Topic: {conn_topic})" if conn_topic else "")
                     }
-                    logger.info(f"  Marked service {dependent_service_id} as dependent (called by primary {source_service_id})")
+                    marked_callees += 1
+                    if debug_enabled:
+                        logger.debug("  Marked service %s as dependent (called by primary %s)", dependent_service_id, source_service_id)
             
+            logger.info(f"Marked {marked_callers} callers and {marked_callees} callees of primary {source_service_id} as dependent")
             logger.info(f"Total dependent services after direct connections: {len(dependent_service_ids)}")
             
             # Process domino connections - services affected through dependent services
             for conn in domino_connections:
                 try:
-                    dependent_service_id = str(conn.get("target_service_id", ""))
-                    source_id = str(conn.get("source_service_id", ""))
+                    target_uuid = conn.get("target_service_id")
+                    source_uuid = conn.get("source_service_id")
                     conn_type = conn.get("type", "HTTP")
                     conn_url = conn.get("url", "")
                     conn_topic = conn.get("topic", "")
                     
-                    if dependent_service_id and source_id and dependent_service_id != source_service_id:
-                        dependent_service_ids.add(dependent_service_id)
+                    if target_uuid and source_uuid and target_uuid != source_service_uuid:
+                        dependent_service_ids.add(target_uuid)
                         # Edge from source service TO dependent service (through cascade)
-                        affected_edges.append({
-                            "source": source_id,
-                            "target": dependent_service_id,
-                            "type": conn_type,
-                        })
-                        # Find the name of the service that connects to this one (for domino explanation)
-                        via_service_name = "another service"
-                        try:
-                            via_result = await self.db_session.execute(
-                                select(Service).where(Service.id == uuid.UUID(source_id))
-                            )
-                            via_service = via_result.scalar_one_or_none()
-                            if via_service:
-                                via_service_name = via_service.name
-                        except:
-                            pass
+                        edge_key = (source_uuid, target_uuid, conn_type)
+                        if edge_key not in seen_edges:
+                            seen_edges.add(edge_key)
+                            affected_edges.append({
+                                "source": str(source_uuid),
+                                "target": str(target_uuid),
+                                "type": conn_type,
+                            })
+                        # Name of the service that connects to this one (joined in by the domino query)
+                        via_service_name = conn.get("source_service_name") or "another service"
                         
-                        domino_dependent_services[dependent_service_id] = {
+                        domino_dependent_services[str(target_uuid)] = {
                             "type": conn_type,
                             "url": conn_url,
                             "topic": conn_topic,
@@ -299,111 +537,67 @@ HOW TO FIX THE ERROR
             # Add primary service to mapping
             service_id_to_name[source_service_id] = source_service_name
             if dependent_service_ids:
-                # Convert string UUIDs to UUID objects
-                try:
-                    uuid_ids = [uuid.UUID(id) for id in dependent_service_ids]
-                    result = await self.db_session.execute(
-                        select(Service).where(Service.id.in_(uuid_ids))
-                    )
-                    services = result.scalars().all()
-                    dependent_service_names = [s.name for s in services]
-                    service_id_to_name.update({str(s.id): s.name for s in services})
-                except (ValueError, TypeError) as e:
-                    logger.error(f"Error converting service IDs to UUIDs: {e}, IDs: {dependent_service_ids}")
-                    dependent_service_names = []
-            
-            # Helper function to format URLs for display (truncate if too long)
-            def format_url(url: str, max_length: int = 45) -> str:
-                """Format URL to fit in chat box"""
-                if not url:
-                    return ""
-                # Extract path if it's a full URL
-                if url.startswith('http://') or url.startswith('https://'):
-                    from urllib.parse import urlparse
-                    parsed = urlparse(url)
-                    path = parsed.path
-                    if path:
-                        url = path
-                
-                # Handle template strings like {SERVICE_URL}/path/{variable}
-                if '{' in url:
-                    import re
-                    # Extract path part after variable placeholders
-                    # Example: {INVENTORY_SERVICE_URL}/inventory/{item.product_id}/reserve
-                    # Result: /inventory/{item.product_id}/reserve
-                    # Remove {VARIABLE} patterns at the start
-                    url = re.sub(r'^\{[^}]+\}', '', url)
-                    # If URL doesn't start with /, add it
-                    if url and not url.startswith('/'):
-                        url = '/' + url
-                    # Simplify variable placeholders in path
-                    # Replace {variable} with {...} for readability
-                    url = re.sub(r'\{[^}]+\}', '{...}', url)
-                
-                # Truncate if too long
-                if len(url) > max_length:
-                    # Try to keep the beginning and end
-                    if '/' in url:
-                        parts = url.split('/')
-                        if len(parts) > 2:
-                            # Keep first and last part
-                            return f"/{parts[1]}/.../{parts[-1]}"
-                    return url[:max_length-3] + "..."
-                return url
-            
-            # Build detailed proof section
-            proof_section = ""
+                result = await self.db_session.execute(
+                    select(Service.id, Service.name).where(Service.id.in_(dependent_service_ids))
+                )
+                services = result.all()
+                dependent_service_names = [s.name for s in services]
+                service_id_to_name.update({str(s.id): s.name for s in services})
+            
+            # Build detailed proof section from fragments joined once at the end
+            proof_parts: List[str] = []
             if dependent_service_names:
-                proof_section = "\nDETAILED PROOF OF DEPENDENT SERVICES\n\n"
+                proof_parts.append("\nDETAILED PROOF OF DEPENDENT SERVICES\n\n")
                 
                 # Direct connections
                 if direct_dependent_services:
-                    proof_section += "Direct Dependencies (Immediate Impact):\n\n"
+                    proof_parts.append("Direct Dependencies (Immediate Impact):\n\n")
                     for service_id, details in direct_dependent_services.items():
                         service_name = service_id_to_name.get(service_id, f"Service {service_id[:8]}...")
-                        proof_section += f"{service_name}\n"
-                        proof_section += f"  - Connection Type: {details['type']}\n"
+                        proof_parts.append(f"{service_name}\n")
+                        proof_parts.append(f"  - Connection Type: {details['type']}\n")
                         if details.get('url'):
-                            formatted_url = format_url(details['url'])
-                            proof_section += f"  - HTTP Endpoint: {formatted_url}\n"
+                            formatted_url = _format_url(details['url'])
+                            proof_parts.append(f"  - HTTP Endpoint: {formatted_url}\n")
                         if details.get('topic'):
-                            proof_section += f"  - Kafka Topic: {details['topic']}\n"
+                            proof_parts.append(f"  - Kafka Topic: {details['topic']}\n")
                         if "Calls" in details['reason']:
-                            proof_section += f"  - Impact: {service_name} calls {source_service_name}. If {source_service_name} fails, {service_name} cannot complete operations that depend on it.\n"
+                            proof_parts.append(f"  - Impact: {service_name} calls {source_service_name}. If {source_service_name} fails, {service_name} cannot complete operations that depend on it.\n")
                         else:
-                            proof_section += f"  - Impact: {service_name} is called by {source_service_name}. If {source_service_name} fails, {service_name} may not receive expected calls or events.\n"
-                        proof_section += "\n"
+                            proof_parts.append(f"  - Impact: {service_name} is called by {source_service_name}. If {source_service_name} fails, {service_name} may not receive expected calls or events.\n")
+                        proof_parts.append("\n")
                 
                 # Domino effects
                 if domino_dependent_services:
-                    proof_section += "Domino Effects (Cascading Impact):\n\n"
+                    proof_parts.append("Domino Effects (Cascading Impact):\n\n")
                     for service_id, details in domino_dependent_services.items():
                         service_name = service_id_to_name.get(service_id, f"Service {service_id[:8]}...")
                         via_service = details.get('via_service', 'another service')
-                        proof_section += f"{service_name}\n"
-                        proof_section += f"  - Connection Type: {details['type']}\n"
+                        proof_parts.append(f"{service_name}\n")
+                        proof_parts.append(f"  - Connection Type: {details['type']}\n")
                         if details.get('url'):
-                            formatted_url = format_url(details['url'])
-                            proof_section += f"  - HTTP Endpoint: {formatted_url}\n"
+                            formatted_url = _format_url(details['url'])
+                            proof_parts.append(f"  - HTTP Endpoint: {formatted_url}\n")
                         if details.get('topic'):
-                            proof_section += f"  - Kafka Topic: {details['topic']}\n"
-                        proof_section += f"  - Affected Via: {via_service} (which depends on {source_service_name})\n"
-                        proof_section += f"  - Impact: Since {via_service} is affected by {source_service_name}, {service_name} is also impacted through the dependency chain.\n"
-                        proof_section += "\n"
+                            proof_parts.append(f"  - Kafka Topic: {details['topic']}\n")
+                        proof_parts.append(f"  - Affected Via: {via_service} (which depends on {source_service_name})\n")
+                        proof_parts.append(f"  - Impact: Since {via_service} is affected by {source_service_name}, {service_name} is also impacted through the dependency chain.\n")
+                        proof_parts.append("\n")
+            proof_section = "".join(proof_parts)
             
             # Build connections list with service names (edges from primary to dependent)
-            connections_list_formatted = ""
-            if affected_edges:
-                for edge in affected_edges[:15]:  # Show up to 15 connections
-                    source_name = service_id_to_name.get(str(edge['source']), f"Service {str(edge['source'])[:8]}...")
-                    target_name = service_id_to_name.get(str(edge['target']), f"Service {str(edge['target'])[:8]}...")
-                    if edge['source'] == source_service_id:
-                        source_name = source_service_name
-                    if edge['target'] == source_service_id:
-                        target_name = source_service_name
-                    connections_list_formatted += f"  - {source_name} -> {target_name} ({edge.get('type', 'HTTP')})\n"
-                if len(affected_edges) > 15:
-                    connections_list_formatted += f"  - ... and {len(affected_edges) - 15} more connection(s)\n"
+            connection_lines: List[str] = []
+            for edge in affected_edges[:15]:  # Show up to 15 connections
+                source_name = service_id_to_name.get(str(edge['source']), f"Service {str(edge['source'])[:8]}...")
+                target_name = service_id_to_name.get(str(edge['target']), f"Service {str(edge['target'])[:8]}...")
+                if edge['source'] == source_service_id:
+                    source_name = source_service_name
+                if edge['target'] == source_service_id:
+                    target_name = source_service_name
+                connection_lines.append(f"  - {source_name} -> {target_name} ({edge.get('type', 'HTTP')})\n")
+            if len(affected_edges) > 15:
+                connection_lines.append(f"  - ... and {len(affected_edges) - 15} more connection(s)\n")
+            connections_list_formatted = "".join(connection_lines)
             
             # Build clean, non-duplicated reasoning
             # Extract error description from analysis
@@ -464,9 +658,9 @@ Recommended Actions:
                 "primary_service_name": source_service_name,
                 "source_node": source_service_id,  # Keep for backward compatibility
                 "source_service_name": source_service_name,
-                "affected_nodes": list(dependent_service_ids),  # RED - dependent services
+                "affected_nodes": [str(sid) for sid in dependent_service_ids],  # RED - dependent services
                 "affected_service_names": dependent_service_names,
-                "dependent_nodes": list(dependent_service_ids),  # RED - dependent services
+                "dependent_nodes": [str(sid) for sid in dependent_service_ids],  # RED - dependent services
                 "dependent_service_names": dependent_service_names,
                 "affected_edges": affected_edges,  # RED - edges from primary to dependent
                 "reasoning": clean_reasoning,
@@ -474,10 +668,7 @@ Recommended Actions:
                 "confidence": 0.8,
             }
         except Exception as e:
-            logger.error(f"Error in analyze method: {e}", exc_info=True)
-            import traceback
-            error_trace = traceback.format_exc()
-            logger.error(f"Full traceback: {error_trace}")
+            logger.exception("Error in analyze method: %s", e)
             # Return error response with more details
             error_reasoning = f"An error occurred while analyzing the error log.\n\nError: {str(e)}\n\nPlease check the backend logs for full details."
             clean_error_reasoning = clean_text_for_chat(error_reasoning)
@@ -493,46 +684,27 @@ Recommended Actions:
     
     async def _analyze_error_with_crewai(self, log_text: str) -> Dict[str, Any]:
         """Use CrewAI to analyze the error log"""
-        task = Task(
-            description=f"""
-            Analyze the following error log and provide a detailed analysis:
-            
-            {log_text}
-            
-            From this error log, identify:
-            1. What is the error? (Describe the error clearly)
-            2. Why has it occurred? (Root cause analysis)
-            3. Which service is the source of this error? (CRITICAL: Return ONLY the exact service name where the error occurred, such as "user-service" or "order-service". Do NOT include words like "the" or "is" - just the service name itself like "user-service")
-            4. How to debug it? (Step-by-step debugging approach)
-            5. What endpoints or connections might be affected? (HTTP endpoints, Kafka topics mentioned)
-            
-            IMPORTANT: 
-            - For question 3, return ONLY the service name in the format "service-name" (e.g., "user-service", "order-service", "cart-service")
-            - Do NOT write "the user-service" or "is user-service" - just write "user-service"
-            - Extract service names from the log text directly if mentioned (look for patterns like "user-service", "order-service", etc.)
-            - Identify any HTTP endpoints mentioned (e.g., "/users/{{user_id}}/validate")
-            - Identify any Kafka topics mentioned
-            - Do NOT list all services in the system, only those directly mentioned or connected in the log
-            
-            Format your response with clear sections. For the service name, write it as: "Source service: user-service" (with the actual service name from the log).
-            """,
-            agent=self.agent,
-        )
+        description = _ANALYSIS_PROMPT.substitute(log_text=log_text)
         
         try:
-            # Run CrewAI in a thread pool to avoid blocking async event loop
+            # Run CrewAI in a thread pool to avoid blocking async event loop;
+            # Task and Crew are wired up there too, off the request path
             def run_crew():
+                task = Task(
+                    description=description,
+                    agent=self.agent,
+                )
                 crew = Crew(
                     agents=[self.agent],
                     tasks=[task],
-                    verbose=True,
+                    verbose=settings.debug,
                 )
                 return crew.kickoff()
             
-            # Run in thread pool to avoid blocking async event loop
-            loop = asyncio.get_event_loop()
-            with ThreadPoolExecutor() as executor:
-                result_crew = await loop.run_in_executor(executor, run_crew)
+            # Run in the shared thread pool to avoid blocking async event loop
+            loop = asyncio.get_running_loop()
+            async with _CREW_SEMAPHORE:
+                result_crew = await loop.run_in_executor(_CREW_EXECUTOR, run_crew)
             
             analysis_text = str(result_crew) if result_crew else "Analysis completed."
             
@@ -557,43 +729,74 @@ Recommended Actions:
                 "debug_steps": "Review error log and check service health",
             }
     
-    async def _find_service_by_name(self, service_name: str) -> Optional[Service]:
-        """Find service in database by name"""
-        logger.info(f"Searching for service: '{service_name}'")
+    async def _fetch_service_names(self) -> Tuple[List[str], int]:
+        """Fetch the service listing on a short-lived session from session_factory"""
+        async with self.session_factory() as session:
+            return await self._load_service_names(session)
+    
+    async def _load_service_names(self, session: AsyncSession) -> Tuple[List[str], int]:
+        """Fetch the first SERVICE_LISTING_SIZE service names plus the total service count"""
+        # One extra row tells whether the list is complete, so the count is only run when it isn't
+        result = await session.execute(select(Service.name).limit(self.SERVICE_LISTING_SIZE + 1))
+        names = [row[0] for row in result.all()]
+        if len(names) <= self.SERVICE_LISTING_SIZE:
+            return names, len(names)
+        total = await session.scalar(select(func.count()).select_from(Service))
+        return names[:self.SERVICE_LISTING_SIZE], total
+    
+    async def _find_service_by_name(self, service_name: str) -> Optional[Row]:
+        """Find service in database by name, returning an (id, name, repo_id) row"""
+        if not service_name or not service_name.strip():
+            return None
         
-        # Try exact match first
-        result = await self.db_session.execute(
-            select(Service).where(Service.name == service_name)
-        )
-        service = result.scalar_one_or_none()
+        cached = _cached_service_lookup(service_name)
+        if cached is not None:
+            return cached
         
-        if service:
-            logger.info(f"Found exact match: {service.name} (ID: {service.id})")
-            return service
+        service = await self._query_service_by_name(service_name)
+        if service is not None:
+            if len(_service_lookup_cache) >= SERVICE_LOOKUP_CACHE_SIZE:
+                _service_lookup_cache.clear()
+            _service_lookup_cache[service_name] = (time.monotonic(), service)
+        return service
+    
+    async def _query_service_by_name(self, service_name: str) -> Optional[Row]:
+        """Look up a service by exact, case-insensitive, then partial name match"""
+        logger.info(f"Searching for service: '{service_name}'")
         
-        # Try case-insensitive exact match
+        # Case-insensitive match in one query, preferring the exact spelling if both exist
         result = await self.db_session.execute(
-            select(Service).where(Service.name.ilike(service_name))
+            _SERVICE_BY_NAME_STMT, {"name_lower": service_name.lower(), "name": service_name}
         )
-        service = result.scalar_one_or_none()
+        service = result.first()
         
         if service:
             logger.info(f"Found case-insensitive match: {service.name} (ID: {service.id})")
             return service
         
-        # Try partial match (e.g., "user-service" matches "applens-user-service")
+        # Very short fragments would substring-match most of the table
+        if len(service_name.strip()) < self.MIN_PARTIAL_MATCH_LENGTH:
+            logger.warning(f"Service '{service_name}' not found and too short for a partial match")
+            return None
+        
+        # Try partial match (e.g., "user-service" matches "applens-user-service"); lower(name)
+        # LIKE is served by the trigram expression index, and "_" in names is matched literally.
+        # Services ending with the name are preferred, then the shortest name, so the pick is stable
+        name_lower = func.lower(Service.name)
+        fragment = service_name.lower()
         result = await self.db_session.execute(
-            select(Service).where(Service.name.ilike(f"%{service_name}%"))
+            select(*SERVICE_LOOKUP_COLUMNS)
+            .where(name_lower.like(_like_contains(fragment), escape='\\'))
+            .order_by(
+                name_lower.like(_like_ends_with(fragment), escape='\\').desc(),
+                func.length(Service.name),
+                Service.name,
+            )
+            .limit(1)
         )
-        services = result.scalars().all()
+        services = result.all()
         
         if services:
-            # Prefer services that end with the service name (e.g., "applens-user-service" for "user-service")
-            for s in services:
-                if s.name.lower().endswith(service_name.lower()):
-                    logger.info(f"Found partial match (ends with): {s.name} (ID: {s.id})")
-                    return s
-            # Otherwise return first match
             logger.info(f"Found partial match: {services[0].name} (ID: {services[0].id})")
             return services[0]
         
@@ -601,56 +804,48 @@ Recommended Actions:
         return None
     
     async def _find_connections_from_db(self, source_service_id: str) -> List[Dict[str, Any]]:
-        """Find all connections from source service in database"""
-        connections = []
+        """Find all connections from source service in database
+        
+        Service IDs in the returned dicts are uuid.UUID values, as for the other connection finders
+        """
         try:
             source_service_id_uuid = uuid.UUID(source_service_id)
         except (ValueError, TypeError) as e:
             logger.error(f"Invalid UUID format for source_service_id: {source_service_id}, error: {e}")
             return []
         
-        # Find HTTP/Kafka connections where source_service is the target (other services call it)
-        # These are services that DEPEND on the source service (they will be affected)
-        result = await self.db_session.execute(
-            select(Interaction).where(Interaction.target_service_id == source_service_id_uuid)
-        )
-        interactions = result.scalars().all()
-        logger.info(f"Found {len(interactions)} interactions where {source_service_id} is the TARGET (other services call it)")
-        
-        for interaction in interactions:
-            conn = {
-                "source_service_id": str(interaction.source_service_id),
-                "target_service_id": str(interaction.target_service_id),
-                "type": interaction.edge_type.value,
-                "url": interaction.http_url,
-                "topic": interaction.kafka_topic,
-            }
-            connections.append(conn)
-            logger.info(f"  Connection: Service {interaction.source_service_id} -> {interaction.target_service_id} ({interaction.edge_type.value})")
-        
-        # Find HTTP/Kafka connections where source_service is the source (it calls other services)
-        # These are services that the source service DEPENDS on (they might be affected if source fails)
-        result = await self.db_session.execute(
-            select(Interaction).where(Interaction.source_service_id == source_service_id_uuid)
-        )
-        interactions = result.scalars().all()
-        logger.info(f"Found {len(interactions)} interactions where {source_service_id} is the SOURCE (it calls other services)")
-        
-        for interaction in interactions:
-            conn = {
-                "source_service_id": str(interaction.source_service_id),
-                "target_service_id": str(interaction.target_service_id),
+        # Fetch both directions in one round trip:
+        # - source_service is the target (other services call it) -> these DEPEND on it
+        # - source_service is the source (it calls other services) -> it depends on these
+        result = await self.db_session.stream(_CONNECTIONS_STMT, {"service_id": source_service_id_uuid})
+        # One pass over the rows, split by direction; incoming edges are listed first
+        incoming: List[Dict[str, Any]] = []
+        outgoing: List[Dict[str, Any]] = []
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
+        async for interaction in result:
+            if interaction.target_service_id == source_service_id_uuid:
+                bucket = incoming
+            elif interaction.source_service_id == source_service_id_uuid:
+                bucket = outgoing
+            else:
+                continue
+            bucket.append({
+                "source_service_id": interaction.source_service_id,
+                "target_service_id": interaction.target_service_id,
                 "type": interaction.edge_type.value,
                 "url": interaction.http_url,
                 "topic": interaction.kafka_topic,
-            }
-            connections.append(conn)
-            logger.info(f"  Connection: Service {interaction.source_service_id} -> {interaction.target_service_id} ({interaction.edge_type.value})")
+            })
+            if debug_enabled:
+                logger.debug("  Connection: Service %s -> %s (%s)", interaction.source_service_id, interaction.target_service_id, interaction.edge_type.value)
+        logger.info(f"Found {len(incoming)} interactions where {source_service_id} is the TARGET (other services call it)")
+        logger.info(f"Found {len(outgoing)} interactions where {source_service_id} is the SOURCE (it calls other services)")
         
+        connections = incoming + outgoing
         logger.info(f"Total connections found: {len(connections)}")
         return connections
     
-    async def _scan_repo_for_connections(self, source_service: Service) -> List[Dict[str, Any]]:
+    async def _scan_repo_for_connections(self, source_service: Row) -> List[Dict[str, Any]]:
         """Scan GitHub repo using MCP to find connections if not in DB"""
         if not self.mcp_client or not source_service.repo_id:
             return []
@@ -658,118 +853,121 @@ Recommended Actions:
         try:
             # Get repository
             result = await self.db_session.execute(
-                select(Repository).where(Repository.id == source_service.repo_id)
+                select(Repository.full_name).where(Repository.id == source_service.repo_id)
             )
-            repo = result.scalar_one_or_none()
-            if not repo:
+            repo_full_name = result.scalar_one_or_none()
+            if not repo_full_name:
                 return []
             
-            # Use MCP to get code files (similar to scan_pipeline)
-            logger.info(f"Scanning repo {repo.full_name} for connections...")
-            
-            # Import detectors
-            from app.services.code_fetch import CodeFetchService
-            from app.services.detectors.http_python import PythonHTTPDetector
-            from app.services.detectors.kafka_python import PythonKafkaDetector
-            
-            # Fetch code files
-            code_fetch = CodeFetchService(self.mcp_client)
-            files = await code_fetch.fetch_repo_files(repo.full_name, "main")
-            
-            # Run detectors
-            http_detector = PythonHTTPDetector()
-            kafka_detector = PythonKafkaDetector()
-            
             connections = []
-            for file_info in files:
-                file_path = file_info["path"]
-                content = file_info["content"]
-                
-                # Detect HTTP calls
-                http_findings = http_detector.detect(file_path, content)
-                for finding in http_findings:
-                    # Extract target service from URL
-                    url = finding.get("url", "")
-                    # Try to find target service in DB
-                    # This is simplified - you'd need to match URL to service
-                    pass
-                
-                # Detect Kafka topics
-                kafka_findings = kafka_detector.detect(file_path, content)
-                for finding in kafka_findings:
-                    topic = finding.get("topic", "")
-                    # Try to find consumer service in DB
-                    result = await self.db_session.execute(
-                        select(Interaction).where(Interaction.kafka_topic == topic)
-                    )
-                    interactions = result.scalars().all()
-                    for interaction in interactions:
-                        if str(interaction.source_service_id) != str(source_service.id):
-                            connections.append({
-                                "source_service_id": str(source_service.id),
-                                "target_service_id": str(interaction.target_service_id),
-                                "type": "Kafka",
-                                "topic": topic,
-                            })
+            topics = await self._detect_repo_kafka_topics(repo_full_name, "main")
+            if not topics:
+                return connections
+            
+            # Find consumer services for all detected topics in one query
+            result = await self.db_session.execute(
+                select(*EDGE_COLUMNS).where(
+                    Interaction.edge_type == EdgeType.KAFKA,
+                    Interaction.kafka_topic.in_(topics),
+                )
+            )
+            interactions = result.all()
+            for interaction in interactions:
+                if interaction.source_service_id != source_service.id:
+                    connections.append({
+                        "source_service_id": source_service.id,
+                        "target_service_id": interaction.target_service_id,
+                        "type": "Kafka",
+                        "topic": interaction.kafka_topic,
+                    })
             
             return connections
         except Exception as e:
             logger.error(f"Error scanning repo: {e}")
             return []
     
+    async def _detect_repo_kafka_topics(self, repo_full_name: str, ref: str) -> FrozenSet[str]:
+        """Kafka topics used in a repo's code, cached per (repo, ref) for a few minutes"""
+        cache_key = (repo_full_name, ref)
+        cached = _repo_topics_cache.get(cache_key)
+        if cached and time.monotonic() - cached[0] < REPO_TOPICS_TTL_SECONDS:
+            logger.info(f"Using cached Kafka topics for {repo_full_name}@{ref}")
+            return cached[1]
+        
+        # Use MCP to get code files (similar to scan_pipeline)
+        logger.info(f"Scanning repo {repo_full_name} for connections...")
+        code_fetch = CodeFetchService(self.mcp_client)
+        files = await code_fetch.fetch_repo_files(repo_full_name, ref)
+        
+        # Only Kafka findings can be matched to services here; URL matching isn't implemented
+        kafka_detector = PythonKafkaDetector()
+        topics: Set[str] = set()
+        for file_info in files:
+            for finding in kafka_detector.detect(file_info["path"], file_info["content"]):
+                topic = finding.get("topic", "")
+                if topic:
+                    topics.add(topic)
+        
+        if len(_repo_topics_cache) >= REPO_TOPICS_CACHE_SIZE:
+            _repo_topics_cache.clear()
+        detected = frozenset(topics)
+        _repo_topics_cache[cache_key] = (time.monotonic(), detected)
+        return detected
+    
     async def _find_domino_effects(
         self, 
         direct_connections: List[Dict[str, Any]], 
-        source_service_id: str
+        source_service_id: uuid.UUID
     ) -> List[Dict[str, Any]]:
-        """Find domino effects: services affected by directly affected services"""
+        """Find domino effects: services affected by directly affected services
+        
+        Each connection also carries source_service_name, the name of the directly affected service it goes through
+        """
         domino_connections = []
         visited_services = {source_service_id}
         
-        # Get directly affected service IDs (both source and target, excluding the source_service_id itself)
-        directly_affected_ids = set()
-        for conn in direct_connections:
-            conn_source = str(conn.get("source_service_id", ""))
-            conn_target = str(conn.get("target_service_id", ""))
-            if conn_source and conn_source != source_service_id:
-                directly_affected_ids.add(conn_source)
-            if conn_target and conn_target != source_service_id:
-                directly_affected_ids.add(conn_target)
+        # Get directly affected service IDs (both source and target, excluding the source_service_id itself);
+        # the endpoints are uuid.UUID values from the edge queries, so they go into the set as-is
+        directly_affected_ids = {conn.get("source_service_id") for conn in direct_connections}
+        directly_affected_ids.update(conn.get("target_service_id") for conn in direct_connections)
+        directly_affected_ids.discard(None)
+        directly_affected_ids.discard(source_service_id)
         visited_services.update(directly_affected_ids)
+        if not directly_affected_ids:
+            return domino_connections
         
-        # For each directly affected service, find its connections
-        for affected_id in directly_affected_ids:
-            try:
-                affected_id_uuid = uuid.UUID(affected_id)
-            except (ValueError, TypeError) as e:
-                logger.warning(f"Invalid UUID format for affected_id: {affected_id}, error: {e}, skipping")
-                continue
-            
-            # Find connections where this service is the source (it calls other services)
-            result = await self.db_session.execute(
-                select(Interaction).where(Interaction.source_service_id == affected_id_uuid)
+        # Find connections where any directly affected service is the source (it calls other services),
+        # leaving out edges back into already-visited services in SQL rather than after transfer;
+        # the source service's name is joined in so callers don't need a second lookup
+        result = await self.db_session.stream(
+            select(*EDGE_COLUMNS, Service.name.label("source_service_name"))
+            .outerjoin(Service, Service.id == Interaction.source_service_id)
+            .where(
+                Interaction.source_service_id.in_(directly_affected_ids),
+                Interaction.target_service_id.not_in(visited_services),
             )
-            interactions = result.scalars().all()
-            
-            for interaction in interactions:
-                target_id = str(interaction.target_service_id)
-                # Only add if not already visited (avoid cycles)
-                if target_id not in visited_services:
-                    domino_connections.append({
-                        "source_service_id": str(interaction.source_service_id),
-                        "target_service_id": str(interaction.target_service_id),
-                        "type": interaction.edge_type.value,
-                        "url": interaction.http_url,
-                        "topic": interaction.kafka_topic,
-                    })
-                    visited_services.add(target_id)
+            .execution_options(yield_per=EDGE_STREAM_BATCH_SIZE)
+        )
+        
+        async for interaction in result:
+            target_id = interaction.target_service_id
+            # Several affected services may reach the same target; keep the first edge only
+            if target_id not in visited_services:
+                domino_connections.append({
+                    "source_service_id": interaction.source_service_id,
+                    "target_service_id": target_id,
+                    "type": interaction.edge_type.value,
+                    "url": interaction.http_url,
+                    "topic": interaction.kafka_topic,
+                    "source_service_name": interaction.source_service_name,
+                })
+                visited_services.add(target_id)
         
         return domino_connections
     
     def _extract_service_from_analysis(self, analysis_text: str, log_text: str) -> Optional[str]:
         """Extract service name from CrewAI analysis or log text"""
-        # Common words to exclude from service name matches
-        common_words = {'the', 'is', 'are', 'was', 'were', 'a', 'an', 'this', 'that', 'which', 'where'}
+        common_words = self._COMMON_WORDS
         
         # Try to extract from analysis text with improved patterns
         # First, try direct log text extraction (more reliable)
@@ -786,22 +984,11 @@ Recommended Actions:
                 return service_names_from_log[0]
         
         # Then try patterns in analysis text
-        patterns = [
-            r'source service[:\s]+([a-z][a-z-]*-service)',  # "Source service: user-service"
-            r'source of this error is (?:the\s+)?[\'"]([a-z][a-z-]*(?:-service)?)[\'"]',
-            r'source service[:\s]+(?:is\s+)?(?:the\s+)?[\'"]?([a-z][a-z-]*(?:-service)?)[\'"]?',
-            r'source service is (?:the\s+)?[\'"]?([a-z][a-z-]*(?:-service)?)[\'"]?',
-            r'error occurred in[:\s]+(?:the\s+)?[\'"]?([a-z][a-z-]*(?:-service)?)[\'"]?',
-            r'error originates? from[:\s]+(?:the\s+)?[\'"]?([a-z][a-z-]*(?:-service)?)[\'"]?',
-            # Pattern to match "user-service" or "user_service" in quotes or after "is"
-            r'(?:is|are|the)\s+[\'"]?([a-z][a-z]+(?:[-_][a-z]+)*(?:-service|_service))[\'"]?',
-            # Match service names that explicitly contain "service"
-            r'[\'"]([a-z][a-z-]*-service)[\'"]',
-            r'([a-z][a-z-]*-service)(?:\s|$|[,.])',
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, analysis_text, re.IGNORECASE)
+        folded_analysis = analysis_text.translate(self._ASCII_FOLD).lower()
+        for literal, pattern in self._ANALYSIS_SERVICE_RXS:
+            if literal not in folded_analysis:
+                continue
+            match = pattern.search(analysis_text)
             if match:
                 service_name = match.group(1).strip().lower()
                 # Skip if it's a common word
@@ -827,51 +1014,55 @@ Recommended Actions:
     def _extract_debug_steps(self, analysis_text: str) -> str:
         """Extract debugging steps from analysis"""
         # Look for "How to debug" or "Debugging" section
-        debug_match = re.search(r'(?:how to debug|debugging|debug steps?)[:\s]+(.+?)(?:\n\n|\n##|$)', analysis_text, re.IGNORECASE | re.DOTALL)
+        debug_match = self._DEBUG_STEPS_RX.search(analysis_text)
         if debug_match:
             return debug_match.group(1).strip()
         return "Review the error log and check service health endpoints"
     
+    def _iter_service_names(self, log_text: str) -> Iterator[str]:
+        """Yield unique service names from log text in order of appearance"""
+        common_words = {'the', 'is', 'are', 'was', 'were', 'a', 'an', 'this', 'that', 'which', 'where', 'error', 'log'}
+        seen = set()
+        matches = heapq.merge(*(rx.finditer(log_text) for rx in self._SERVICE_NAME_RXS), key=lambda m: m.start(1))
+        for match in matches:
+            candidate = match.group(1).strip().lower()
+            # Skip common words, very short names and repeats
+            if candidate in seen or candidate in common_words or len(candidate) <= 3:
+                continue
+            # Prefer names with "service" or dashes
+            if 'service' in candidate or '-' in candidate or len(candidate) > 6:
+                seen.add(candidate)
+                yield candidate
+    
     def _extract_service_names(self, log_text: str) -> List[str]:
         """Extract service names from log text"""
-        common_words = {'the', 'is', 'are', 'was', 'were', 'a', 'an', 'this', 'that', 'which', 'where', 'error', 'log'}
-        patterns = [
-            r'([a-z][a-z-]*-service)',  # Match "user-service", "order-service", etc.
-            r'([a-z][a-z-]*_service)',  # Match "user_service", etc.
-            r'service[:\s]+([a-z][a-z-]+)',  # Match "service: user" or "service user"
-            r'ERROR\s+([a-z][a-z-]*(?:-service)?)',
-            r'user-service|order-service|cart-service|inventory-service|payment-service|product-service|shipping-service|review-service|notification-service|recommendation-service',
-        ]
-        names = set()
-        for pattern in patterns:
-            matches = re.findall(pattern, log_text, re.IGNORECASE)
-            for match in matches:
-                if isinstance(match, tuple):
-                    candidate = match[-1] if match[-1] else match[0]
-                else:
-                    candidate = match
-                candidate = candidate.strip().lower()
-                # Skip common words and very short names
-                if candidate not in common_words and len(candidate) > 3:
-                    # Prefer names with "service" or dashes
-                    if 'service' in candidate or '-' in candidate or len(candidate) > 6:
-                        names.add(candidate)
-        return list(names)
+        cached = self._service_names_cache.get(log_text)
+        if cached is None:
+            cached = self._service_names_cache[log_text] = list(self._iter_service_names(log_text))
+        return list(cached)
+    
+    def _iter_urls(self, log_text: str) -> Iterator[str]:
+        """Yield URLs from log text"""
+        for match in self._URL_RX.finditer(log_text):
+            url = match.group()
+            # Drop bare fragments like "/" or "/v1" that would match nearly every endpoint
+            if len(url) >= self.MIN_URL_LENGTH:
+                yield url
     
     def _extract_urls(self, log_text: str) -> List[str]:
         """Extract URLs from log text"""
-        url_pattern = r'https?://[^\s]+|/[a-z0-9/_-]+'
-        matches = re.findall(url_pattern, log_text)
-        return matches[:10]
+        # Stop scanning once the first 10 URLs are found
+        return list(islice(self._iter_urls(log_text), 10))
+    
+    def _iter_kafka_topics(self, log_text: str) -> Iterator[str]:
+        """Yield unique Kafka topic names from log text"""
+        seen = set()
+        for pattern in self._KAFKA_TOPIC_RXS:
+            for topic in pattern.findall(log_text):
+                if topic not in seen:
+                    seen.add(topic)
+                    yield topic
     
     def _extract_kafka_topics(self, log_text: str) -> List[str]:
         """Extract Kafka topic names from log text"""
-        patterns = [
-            r'topic[:\s]+([a-z0-9._-]+)',
-            r'kafka[:\s]+([a-z0-9._-]+)',
-        ]
-        topics = set()
-        for pattern in patterns:
-            matches = re.findall(pattern, log_text, re.IGNORECASE)
-            topics.update(matches)
-        return list(topics)
+        return list(self._iter_kafka_topics(log_text))
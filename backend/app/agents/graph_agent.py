@@ -1,27 +1,33 @@
 """Graph agent for deduplication and normalization"""
 from crewai import Agent
 from langchain_openai import ChatOpenAI
+from app.agents.llm import get_llm
 from app.config import settings
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 
 class GraphAgent:
     """Agent that deduplicates and normalizes edges"""
     
+    # Built on first use and shared by all instances; this agent never runs a crew task,
+    # so it carries no per-run state
+    _shared_llm: Optional[ChatOpenAI] = None
+    _shared_agent: Optional[Agent] = None
+    
     def __init__(self):
-        self.llm = ChatOpenAI(
-            model="gpt-4o",
-            temperature=0.1,
-            openai_api_key=settings.openai_api_key,
-        )
+        cls = type(self)
+        if cls._shared_agent is None:
+            cls._shared_llm = get_llm()
+            cls._shared_agent = Agent(
+                role="Graph Builder",
+                goal="Deduplicate and normalize service interactions across repositories",
+                backstory="You are a data quality expert who ensures graph consistency and removes duplicates.",
+                verbose=settings.debug,
+                llm=cls._shared_llm,
+            )
         
-        self.agent = Agent(
-            role="Graph Builder",
-            goal="Deduplicate and normalize service interactions across repositories",
-            backstory="You are a data quality expert who ensures graph consistency and removes duplicates.",
-            verbose=True,
-            llm=self.llm,
-        )
+        self.llm = cls._shared_llm
+        self.agent = cls._shared_agent
     
     async def normalize_interactions(self, interactions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Normalize and deduplicate interactions"""
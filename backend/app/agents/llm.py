@@ -0,0 +1,42 @@
+"""Shared LLM clients for the CrewAI agents"""
+from functools import lru_cache
+import logging
+from langchain_core.globals import set_llm_cache
+from langchain_openai import ChatOpenAI
+from app.config import settings
+
+try:
+    from langchain_community.cache import SQLiteCache
+except ImportError:  # Installed alongside langchain; without it the LLM cache stays off
+    SQLiteCache = None
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_MODEL = "gpt-4o"
+DEFAULT_TEMPERATURE = 0.1
+
+
+@lru_cache(maxsize=8)
+def _build_llm(model: str, temperature: float, api_key: str) -> ChatOpenAI:
+    return ChatOpenAI(
+        model=model,
+        temperature=temperature,
+        openai_api_key=api_key,
+    )
+
+
+def get_llm(model: str = DEFAULT_MODEL, temperature: float = DEFAULT_TEMPERATURE) -> ChatOpenAI:
+    """LLM client shared per (model, temperature), rebuilt only when the configured API key changes"""
+    return _build_llm(model, temperature, settings.openai_api_key)
+
+
+def enable_llm_cache() -> None:
+    """Answer repeated identical prompts from LangChain's process-wide SQLite cache"""
+    if not settings.llm_cache_path:
+        return
+    if SQLiteCache is None:
+        logger.warning("langchain_community is not installed; LLM cache disabled")
+        return
+    set_llm_cache(SQLiteCache(database_path=settings.llm_cache_path))
+    logger.info(f"LLM cache enabled at {settings.llm_cache_path}")
@@ -1,62 +1,158 @@
 """Natural Language Query agent"""
 from crewai import Agent, Task, Crew
-from langchain_openai import ChatOpenAI
+from app.agents.llm import get_llm
 from app.config import settings
+from app.db.invalidation import on_graph_change
 from app.db.models import Service, Interaction, Repository
 from app.services.mcp_client import MCPGitHubClient
 from app.services.code_fetch import CodeFetchService
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from typing import Dict, Any, Optional
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy import Select, func, or_, select
+from sqlalchemy.orm import aliased
+from typing import Awaitable, Callable, Dict, Any, List, Optional, Set, Tuple
 import logging
 import asyncio
+import inspect
 import re
+import textwrap
+import time
 from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from urllib.parse import urlparse
 
 logger = logging.getLogger(__name__)
 
 
+# Patterns used by clean_text_for_chat, compiled once at import time
+EMOJI_RE = re.compile(
+    "["
+    "\U0001F600-\U0001F64F"  # emoticons
+    "\U0001F300-\U0001F5FF"  # symbols & pictographs
+    "\U0001F680-\U0001F6FF"  # transport & map symbols
+    "\U0001F1E0-\U0001F1FF"  # flags
+    "\U00002702-\U000027B0"  # dingbats
+    "\U000024C2-\U0001F251"  # enclosed characters
+    "\U0001F900-\U0001F9FF"  # supplemental symbols
+    "\U0001FA00-\U0001FA6F"  # chess symbols
+    "\U0001FA70-\U0001FAFF"  # symbols and pictographs extended-A
+    "]+",
+    flags=re.UNICODE
+)
+TRIPLE_BACKTICK_RE = re.compile(r'```[a-z]*\n?')  # Also matches bare ```
+EMPHASIS_RUN_RE = re.compile(r'\*{2,}|_{2,}')  # Runs of asterisks or underscores
+NEWLINE_RE = re.compile(r'\n{3,}')
+SPACE_RE = re.compile(r' {2,}')
+# Whitespace (other than the newline itself) at the start or end of any line
+LINE_PADDING_RE = re.compile(r'^[^\S\n]+|[^\S\n]+$', re.MULTILINE)
+# Anything the passes above would change in ASCII text (the emoji pass never applies to it):
+# fences, emphasis runs, blank-line runs, double spaces, tabs etc., or padded line ends
+NEEDS_CLEANING_RE = re.compile(r'```|\*\*|__|\n\n\n|  |[^\S \n]| \n|\n ')
+
+# Words of a question, kept whole across hyphens so service names like order-service match as one
+QUESTION_TOKEN_RE = re.compile(r'[\w-]+')
+
+# An analysis section header the LLM sometimes writes into a follow-up answer despite the prompt.
+# Only whole upper-case header lines (optionally decorated, or followed by ": value") count, so prose
+# such as "According to the previous error analysis, ..." is never mistaken for a section
+ANALYSIS_HEADER_RE = re.compile(
+    r'^[^\S\n]*[#*=\u2550\u2500 ]*'
+    r'(?:ERROR ANALYSIS|WHAT[- ]IF ANALYSIS|PRIMARY AFFECTED SERVICE|DEPENDENT SERVICES|AFFECTED CONNECTIONS'
+    r'|BLAST RADIUS|RISK HOTSPOTS|HOW TO FIX THE ERROR|HOW TO MITIGATE RISK)'
+    r'[^\S\n]*(?::[^\n]*|[*=\u2550\u2500 ]*)$',
+    re.MULTILINE
+)
+# A follow-up answer cut down to fewer characters than this falls back to its first paragraph
+MIN_DIRECT_ANSWER_CHARS = 20
+# Lines that look like section headers or separators (ASCII "=" or the box-drawing banners the
+# analysis prompts use, which the model echoes back), matched without upper-casing the line
+SECTION_HEADER_LINE_RE = re.compile(
+    r'\s*(?:[=\u2550\u2500]|PRIMARY|DEPENDENT|AFFECTED|BLAST|RISK|HOW\s+TO\s+(?:FIX|MITIGATE))', re.IGNORECASE
+)
+# Banner lines left dangling at the end of an answer after cutting at a section header
+TRAILING_BANNERS_RE = re.compile(r'(?:(?:^|\n)[^\S\n]*[=\u2550\u2500]{3,}[^\S\n]*)+\s*\Z')
+AGENT_STOPPED_RE = re.compile(r'\s*AGENT STOPPED', re.IGNORECASE)
+
+# URLs like {SERVICE_URL}/path, http://... or /path in an answer, shortened by _format_url
+CHAT_URL_RE = re.compile(r'(\{[A-Z_]+\_SERVICE_URL\}[^\s\)]+|https?://[^\s\)]+|/[^\s\)]+)')
+# Placeholders in templated URLs such as {SERVICE_URL}/items/{item_id}
+_URL_TEMPLATE_PREFIX_RE = re.compile(r'^\{[^}]+\}')
+_URL_TEMPLATE_VAR_RE = re.compile(r'\{[^}]+\}')
+
+
+@lru_cache(maxsize=1024)
+def _format_url(url: str, max_length: int = 50) -> str:
+    """Format URL to fit in chat box (pure, so repeated service URLs are served from the cache)"""
+    if not url:
+        return ""
+    if url.startswith('http://') or url.startswith('https://'):
+        parsed = urlparse(url)
+        path = parsed.path
+        if path:
+            url = path
+    
+    if '{' in url:
+        url = _URL_TEMPLATE_PREFIX_RE.sub('', url)
+        if url and not url.startswith('/'):
+            url = '/' + url
+        url = _URL_TEMPLATE_VAR_RE.sub('{...}', url)
+    
+    if len(url) > max_length:
+        if '/' in url:
+            parts = url.split('/')
+            if len(parts) > 2:
+                return f"/{parts[1]}/.../{parts[-1]}"
+        return url[:max_length-3] + "..."
+    return url
+
+
+@lru_cache(maxsize=None)
+def _line_wrapper(width: int) -> textwrap.TextWrapper:
+    """Shared wrapper per width for chat answers; TextWrapper keeps no state between wrap() calls"""
+    # Keep hyphenated service names and long URLs whole, and leave other whitespace alone
+    return textwrap.TextWrapper(
+        width=width,
+        break_long_words=False,
+        break_on_hyphens=False,
+        expand_tabs=False,
+        replace_whitespace=False,
+    )
+
+
 def clean_text_for_chat(text: str) -> str:
     """Remove emojis and extraneous characters to make text human-readable"""
     if not text:
         return text
     
-    # Remove emojis using regex (covers most Unicode emoji ranges)
-    emoji_pattern = re.compile(
-        "["
-        "\U0001F600-\U0001F64F"  # emoticons
-        "\U0001F300-\U0001F5FF"  # symbols & pictographs
-        "\U0001F680-\U0001F6FF"  # transport & map symbols
-        "\U0001F1E0-\U0001F1FF"  # flags
-        "\U00002702-\U000027B0"  # dingbats
-        "\U000024C2-\U0001F251"  # enclosed characters
-        "\U0001F900-\U0001F9FF"  # supplemental symbols
-        "\U0001FA00-\U0001FA6F"  # chess symbols
-        "\U0001FA70-\U0001FAFF"  # symbols and pictographs extended-A
-        "]+",
-        flags=re.UNICODE
-    )
-    text = emoji_pattern.sub('', text)
+    # Plain ASCII with nothing to clean (the usual case) only needs the outer strip
+    if text.isascii() and not NEEDS_CLEANING_RE.search(text):
+        return text.strip()
+    
+    # Remove emojis using regex (covers most Unicode emoji ranges); pure ASCII text has none,
+    # so the C-level isascii() check lets typical English answers skip the pass entirely
+    if not text.isascii():
+        text = EMOJI_RE.sub('', text)
+    
+    # The remaining passes are skipped when a plain substring scan (much cheaper than a
+    # regex walk) shows they can't match, which is the usual case for short chat answers
     
     # Remove excessive markdown formatting (keep basic structure)
     # Remove triple backticks (code blocks) but keep content
-    text = re.sub(r'```[a-z]*\n?', '', text)
-    text = re.sub(r'```', '', text)
+    if '```' in text:
+        text = TRIPLE_BACKTICK_RE.sub('', text)
     
-    # Remove excessive asterisks/bold formatting (keep single asterisks for emphasis if needed)
-    # Replace multiple asterisks with single space
-    text = re.sub(r'\*{2,}', ' ', text)
-    
-    # Remove excessive underscores
-    text = re.sub(r'_{2,}', ' ', text)
+    # Remove excessive asterisks/bold formatting and underscores (keep single ones for emphasis)
+    # Replace each run with a single space
+    if '**' in text or '__' in text:
+        text = EMPHASIS_RUN_RE.sub(' ', text)
     
     # Clean up excessive whitespace
-    text = re.sub(r'\n{3,}', '\n\n', text)  # Max 2 consecutive newlines
-    text = re.sub(r' {2,}', ' ', text)  # Max 1 space between words
+    if '\n\n\n' in text:
+        text = NEWLINE_RE.sub('\n\n', text)  # Max 2 consecutive newlines
+    if '  ' in text:
+        text = SPACE_RE.sub(' ', text)  # Max 1 space between words
     
-    # Remove leading/trailing whitespace from each line
-    lines = [line.strip() for line in text.split('\n')]
-    text = '\n'.join(lines)
+    # Remove leading/trailing whitespace from each line, in place rather than split/strip/join
+    text = LINE_PADDING_RE.sub('', text)
     
     # Remove leading/trailing whitespace from entire text
     text = text.strip()
@@ -64,45 +160,253 @@ def clean_text_for_chat(text: str) -> str:
     return text
 
 
+# Database context per engine. The service graph changes far less often than chat traffic,
+# so back-to-back questions reuse one snapshot; any commit that writes the graph tables clears it
+CONTEXT_TTL_SECONDS = 30.0
+_context_cache: Dict[Any, Tuple[float, Dict[str, Any]]] = {}
+# Context tables are streamed in batches of this many rows instead of being materialized at once
+CONTEXT_STREAM_BATCH_SIZE = 500
+# Rows loaded per context table. The prompt lists fewer than this; true totals are counted
+# separately, and only for tables that hit the limit
+CONTEXT_ROW_LIMIT = 200
+
+
+@on_graph_change
+def clear_context_cache() -> None:
+    """Forget cached database context; runs after every commit that writes the graph tables"""
+    _context_cache.clear()
+
+
+async def _total_rows(session: AsyncSession, stmt: Select, loaded: int) -> int:
+    """Full row count for stmt, queried only when the limited load may have cut it short"""
+    if loaded < CONTEXT_ROW_LIMIT:
+        return loaded
+    return await session.scalar(select(func.count()).select_from(stmt.subquery()))
+
+
+# Columns of each context table the prompt uses, and a stable order for the capped loads so the
+# same rows reach the prompt on every request and cache refresh
+SERVICE_CONTEXT_COLUMNS = (Service.id, Service.name, Service.language, Service.repo_id)
+SERVICE_CONTEXT_ORDER = (Service.name, Service.id)
+REPOSITORY_CONTEXT_COLUMNS = (Repository.id, Repository.full_name, Repository.html_url, Repository.default_branch)
+REPOSITORY_CONTEXT_ORDER = (Repository.full_name, Repository.id)
+
+_source_service = aliased(Service, name="source_service")
+_target_service = aliased(Service, name="target_service")
+# Interactions with both endpoint names joined in; inner joins drop edges whose source or
+# target service no longer exists
+INTERACTION_CONTEXT_STMT = (
+    select(
+        Interaction.edge_type,
+        Interaction.http_method,
+        Interaction.http_url,
+        Interaction.kafka_topic,
+        Interaction.source_service_id,
+        Interaction.target_service_id,
+        _source_service.name.label("source_name"),
+        _target_service.name.label("target_name"),
+    )
+    .join(_source_service, Interaction.source_service_id == _source_service.id)
+    .join(_target_service, Interaction.target_service_id == _target_service.id)
+)
+INTERACTION_CONTEXT_ORDER = (
+    _source_service.name,
+    _target_service.name,
+    Interaction.edge_type,
+    Interaction.http_url,
+    Interaction.kafka_topic,
+    Interaction.id,
+)
+
+
+def _service_context_row(row: Any) -> Dict[str, Any]:
+    return {
+        "id": str(row.id),
+        "name": row.name,
+        "language": row.language,
+        "repo_id": str(row.repo_id),
+    }
+
+
+def _interaction_context_row(row: Any) -> Dict[str, Any]:
+    return {
+        "source": row.source_name,
+        "target": row.target_name,
+        "type": row.edge_type.value,
+        "http_method": row.http_method,
+        "http_url": row.http_url,
+        "kafka_topic": row.kafka_topic,
+    }
+
+
+def _snapshot_is_complete(context: Dict[str, Any]) -> bool:
+    """Whether the context snapshot holds every service and interaction, not just the first rows"""
+    return (
+        context["services_total"] <= len(context["services"])
+        and context["interactions_total"] <= len(context["interactions"])
+    )
+
+
+def _focus_from_snapshot(
+    context: Dict[str, Any], question_tokens: Set[str]
+) -> Optional[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]]:
+    """Services the question names, their edges and direct neighbours, picked from a complete snapshot"""
+    mentioned = {s["name"] for s in context["services"] if s["name"] and s["name"].lower() in question_tokens}
+    if not mentioned:
+        return None
+    
+    interactions = [i for i in context["interactions"] if i["source"] in mentioned or i["target"] in mentioned]
+    relevant = mentioned.union(*((i["source"], i["target"]) for i in interactions))
+    services = [s for s in context["services"] if s["name"] in relevant]
+    return services, interactions
+
+
+def _focus_context(
+    context: Dict[str, Any], focus: Optional[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]]
+) -> Dict[str, Any]:
+    """Swap the prompt's services and interactions for the question's focused rows, if it named any"""
+    if focus is None:
+        # Nothing to anchor on, so the prompt keeps the general view of the graph
+        return context
+    
+    focused = dict(context)
+    focused["services"], focused["interactions"] = focus
+    focused["focused"] = True
+    return focused
+
+
+# Task prompts are laid out static-first: fixed instructions, then the database or analysis
+# context, then the question. Consecutive turns then share a long identical prefix, which
+# provider-side prompt caching can reuse; only the tail differs per question.
+_ARCHITECTURE_INSTRUCTIONS = """
+Answer a question about the microservice architecture. The question is given at the end.
+
+Instructions:
+1. Use the database context provided below to answer the question
+2. If you need code details from GitHub repositories, mention that you can access them but focus on the database information first
+3. Provide a clear, helpful answer with specific details
+4. If the question asks about specific services, mention their names, connections, and relevant details
+5. If the question is about dependencies, explain the relationships clearly
+6. Be conversational and helpful - this is a chat interface
+7. Format URLs to be concise - use paths like /users/{user_id}/validate instead of full URLs
+8. Keep lines under 80 characters when possible to fit in the chat box
+9. Break long lists into multiple lines with proper indentation
+
+Answer the question directly and clearly. Format your response to be readable in a chat interface.
+"""
+
+
+def _first_paragraph(answer: str) -> str:
+    """First paragraph of an answer without header lines, cut to three sentences if long"""
+    paragraph = answer.split('\n\n')[0] if '\n\n' in answer else '\n'.join(answer.split('\n')[:3])
+    paragraph = ANALYSIS_HEADER_RE.sub('', paragraph).strip()
+    if len(paragraph) > 500:
+        sentences = [sentence.strip() for sentence in paragraph.split('. ')[:3] if sentence.strip()]
+        paragraph = '. '.join(sentences)
+        if not paragraph.endswith('.'):
+            paragraph += '.'
+    return paragraph
+
+
+def _follow_up_instructions(analysis_type: str, subject: str, analysis_name: str, inputs: str, example: str) -> str:
+    """Fixed instructions for a follow-up question about a previous analysis of the given type"""
+    return f"""
+You are answering a follow-up question about a PREVIOUS {analysis_type} that was already completed.
+The previous {analysis_type} context comes below, and the question is given at the end.
+
+CRITICAL INSTRUCTIONS:
+- This is NOT a request to analyze a new {subject}
+- This is NOT a request to run {analysis_name}
+- DO NOT write "{analysis_type.upper()}" sections
+- DO NOT include sections like "PRIMARY AFFECTED SERVICE", "DEPENDENT SERVICES", "BLAST RADIUS", etc.
+- DO NOT analyze new {inputs}
+- ONLY answer the specific question asked at the end
+
+Answer Format:
+- Start directly with your answer (no headers like "{analysis_type.upper()}")
+- Reference the PREVIOUS {analysis_type.upper()} CONTEXT below
+- Be concise and conversational
+- Just explain why the service was identified (or whatever the question asks)
+- Do not repeat the entire analysis
+
+Example answer format (EXACTLY how you should respond):
+{example}
+
+IMPORTANT:
+- Your response should look like the example above - conversational, direct, and concise
+- Do NOT start with "{analysis_type.upper()}" or any headers
+- Do NOT include sections like "PRIMARY AFFECTED SERVICE", "DEPENDENT SERVICES", "BLAST RADIUS", etc.
+- Do NOT repeat the entire analysis output
+- Just answer the question in 2-4 sentences using the context provided below
+"""
+
+
+_ERROR_FOLLOW_UP_INSTRUCTIONS = _follow_up_instructions(
+    "error analysis", "error", "error analysis", "logs",
+    "According to the previous error analysis, review-service was identified as the primary service because the error log showed a database connection timeout occurring in review-service at line 142 when attempting to execute a SELECT query. The error log explicitly states 'review-service.app' as the source of the error, which is why it was marked as the primary affected service.",
+)
+_WHAT_IF_FOLLOW_UP_INSTRUCTIONS = _follow_up_instructions(
+    "what-if analysis", "change", "what-if analysis", "changes",
+    "According to the previous what-if analysis, user-service was identified as the changed service because the change description mentioned modifying the user authentication endpoint. The analysis found that this change will affect order-service and cart-service because they depend on user-service for user validation.",
+)
+
+
+# Agent persona, built once at import rather than on every NLQAgent construction;
+# cleandoc drops the source indentation so it is not sent to the LLM as prompt tokens
+_AGENT_ROLE = "Microservice Knowledge Assistant"
+_AGENT_GOAL = "Answer questions about microservices, their dependencies, connections, and code by querying the database and GitHub repositories. When error analysis context is provided, answer questions about that analysis without running a new one."
+_AGENT_BACKSTORY = inspect.cleandoc("""
+    You are an expert assistant that helps users understand their microservice architecture.
+    You have access to:
+    1. A database containing services, interactions (HTTP and Kafka), and repositories
+    2. GitHub repositories for all microservices in the graph
+
+    You can answer questions about:
+    - Which services exist and their details
+    - How services are connected (HTTP calls, Kafka topics)
+    - Service dependencies and relationships
+    - Code details from GitHub repositories
+    - Service health, traffic patterns, and architecture
+    - Previous error analysis results (when context is provided)
+
+    IMPORTANT: When a user asks a follow-up question about a previous error analysis (indicated by PREVIOUS ERROR ANALYSIS CONTEXT), you should:
+    - Answer the specific question using ONLY the provided error analysis context
+    - Do NOT run a new error analysis
+    - Do NOT analyze new error logs
+    - Do NOT generate new ERROR ANALYSIS sections
+    - Only reference and explain what's already in the provided context
+
+    Always provide clear, helpful answers with specific details when available.
+""")
+
+
+# Shared pool for blocking CrewAI runs, so threads aren't spun up per question
+_CREW_EXECUTOR = ThreadPoolExecutor(max_workers=settings.crew_workers, thread_name_prefix="nlq-crew")
+
+
 class NLQAgent:
     """Agent for processing natural language queries with CrewAI"""
     
-    def __init__(self, db_session: AsyncSession, mcp_client: Optional[MCPGitHubClient] = None):
+    def __init__(
+        self,
+        db_session: AsyncSession,
+        mcp_client: Optional[MCPGitHubClient] = None,
+        session_factory: Optional[async_sessionmaker] = None,
+    ):
         self.db_session = db_session
         self.mcp_client = mcp_client
+        # Optional factory for short-lived sessions that can run alongside db_session
+        self.session_factory = session_factory
         self.code_fetch = CodeFetchService(mcp_client) if mcp_client else None
         
-        self.llm = ChatOpenAI(
-            model="gpt-4o",
-            temperature=0.1,
-            openai_api_key=settings.openai_api_key,
-        )
+        self.llm = get_llm()
         
+        # The Agent stays per instance: CrewAI stores executor state on it while a task runs
         self.agent = Agent(
-            role="Microservice Knowledge Assistant",
-            goal="Answer questions about microservices, their dependencies, connections, and code by querying the database and GitHub repositories. When error analysis context is provided, answer questions about that analysis without running a new one.",
-            backstory="""You are an expert assistant that helps users understand their microservice architecture. 
-            You have access to:
-            1. A database containing services, interactions (HTTP and Kafka), and repositories
-            2. GitHub repositories for all microservices in the graph
-            
-            You can answer questions about:
-            - Which services exist and their details
-            - How services are connected (HTTP calls, Kafka topics)
-            - Service dependencies and relationships
-            - Code details from GitHub repositories
-            - Service health, traffic patterns, and architecture
-            - Previous error analysis results (when context is provided)
-            
-            IMPORTANT: When a user asks a follow-up question about a previous error analysis (indicated by PREVIOUS ERROR ANALYSIS CONTEXT), you should:
-            - Answer the specific question using ONLY the provided error analysis context
-            - Do NOT run a new error analysis
-            - Do NOT analyze new error logs
-            - Do NOT generate new ERROR ANALYSIS sections
-            - Only reference and explain what's already in the provided context
-            
-            Always provide clear, helpful answers with specific details when available.""",
-            verbose=True,
+            role=_AGENT_ROLE,
+            goal=_AGENT_GOAL,
+            backstory=_AGENT_BACKSTORY,
+            verbose=settings.debug,
             llm=self.llm,
             allow_delegation=False,
         )
@@ -132,7 +436,7 @@ class NLQAgent:
             
             # Step 1: Gather context from database
             context = await self._gather_context(question)
-            logger.info(f"Gathered context: {len(context['services'])} services, {len(context['interactions'])} interactions")
+            logger.info(f"Gathered context: {context['services_total']} services, {context['interactions_total']} interactions")
             
             # Add error analysis context if provided (for follow-up questions)
             if error_analysis_context:
@@ -156,9 +460,7 @@ class NLQAgent:
                 "answer": clean_answer,
             }
         except Exception as e:
-            import traceback
-            error_trace = traceback.format_exc()
-            logger.error(f"Error in NLQ query: {e}\n{error_trace}", exc_info=True)
+            logger.exception("Error in NLQ query: %s", e)
             error_message = f"I encountered an error while processing your question: {str(e)}. Please try rephrasing it or check the backend logs for details."
             clean_error = clean_text_for_chat(error_message)
             
@@ -170,91 +472,156 @@ class NLQAgent:
     
     async def _gather_context(self, question: str) -> Dict[str, Any]:
         """Gather relevant context from database and GitHub"""
+        cache_key = self.db_session.bind
+        cached = _context_cache.get(cache_key)
+        if cached and time.monotonic() - cached[0] < CONTEXT_TTL_SECONDS:
+            # Shallow copy: callers add keys to the dict but never modify the lists
+            return dict(cached[1])
+        
+        context, complete = await self._load_context()
+        # Only cache a full snapshot, so a transient query failure isn't served for the whole TTL
+        if complete:
+            _context_cache[cache_key] = (time.monotonic(), context)
+            return dict(context)
+        return context
+    
+    async def _load_context(self) -> Tuple[Dict[str, Any], bool]:
+        """Load services, interactions and repositories; also report whether every query succeeded"""
         context = {
             "services": [],
             "interactions": [],
             "repositories": [],
+            "services_total": 0,
+            "interactions_total": 0,
+            "repositories_total": 0,
         }
         
+        if self.session_factory is not None:
+            # The three reads are independent; run two of them on short-lived sessions so
+            # the round trips overlap (one AsyncSession can't run statements concurrently)
+            results = await asyncio.gather(
+                self._load_services(self.db_session),
+                self._load_on_new_session(self._load_interactions),
+                self._load_on_new_session(self._load_repositories),
+                return_exceptions=True,
+            )
+            complete = True
+            for key, result in zip(("services", "interactions", "repositories"), results):
+                if isinstance(result, Exception):
+                    logger.error(f"Error gathering context: {result}")
+                    complete = False
+                else:
+                    context[key], context[f"{key}_total"] = result
+            return context, complete
+        
         try:
-            # Get all services
-            result = await self.db_session.execute(select(Service))
-            services = result.scalars().all()
-            context["services"] = [
-                {
-                    "id": str(s.id),
-                    "name": s.name,
-                    "language": s.language,
-                    "repo_id": str(s.repo_id),
-                }
-                for s in services
-            ]
-            
-            # Get all interactions
-            result = await self.db_session.execute(select(Interaction))
-            interactions = result.scalars().all()
-            context["interactions"] = []
-            for i in interactions:
-                # Get service names
-                source_result = await self.db_session.execute(
-                    select(Service).where(Service.id == i.source_service_id)
-                )
-                target_result = await self.db_session.execute(
-                    select(Service).where(Service.id == i.target_service_id)
-                )
-                source = source_result.scalar_one_or_none()
-                target = target_result.scalar_one_or_none()
-                
-                if source and target:
-                    context["interactions"].append({
-                        "source": source.name,
-                        "target": target.name,
-                        "type": i.edge_type.value,
-                        "http_method": i.http_method,
-                        "http_url": i.http_url,
-                        "kafka_topic": i.kafka_topic,
-                    })
-            
-            # Get all repositories
-            result = await self.db_session.execute(select(Repository))
-            repositories = result.scalars().all()
-            context["repositories"] = [
-                {
-                    "id": str(r.id),
-                    "full_name": r.full_name,
-                    "html_url": r.html_url,
-                    "default_branch": r.default_branch,
-                }
-                for r in repositories
-            ]
-            
+            context["services"], context["services_total"] = await self._load_services(self.db_session)
+            context["interactions"], context["interactions_total"] = await self._load_interactions(self.db_session)
+            context["repositories"], context["repositories_total"] = await self._load_repositories(self.db_session)
         except Exception as e:
             logger.error(f"Error gathering context: {e}")
+            return context, False
         
-        return context
+        return context, True
+    
+    async def _load_on_new_session(
+        self, loader: Callable[[AsyncSession], Awaitable[Tuple[List[Dict[str, Any]], int]]]
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """Run a context loader on a short-lived session from session_factory"""
+        async with self.session_factory() as session:
+            return await loader(session)
+    
+    async def _load_services(self, session: AsyncSession) -> Tuple[List[Dict[str, Any]], int]:
+        """Get the first CONTEXT_ROW_LIMIT services by name (prompt columns only) and the total"""
+        stmt = select(*SERVICE_CONTEXT_COLUMNS)
+        result = await session.stream(
+            stmt.order_by(*SERVICE_CONTEXT_ORDER)
+            .limit(CONTEXT_ROW_LIMIT)
+            .execution_options(yield_per=CONTEXT_STREAM_BATCH_SIZE)
+        )
+        services = [_service_context_row(s) async for s in result]
+        return services, await _total_rows(session, stmt, len(services))
+    
+    async def _load_interactions(self, session: AsyncSession) -> Tuple[List[Dict[str, Any]], int]:
+        """Get the first CONTEXT_ROW_LIMIT interactions by endpoint names, and the total"""
+        result = await session.stream(
+            INTERACTION_CONTEXT_STMT.order_by(*INTERACTION_CONTEXT_ORDER)
+            .limit(CONTEXT_ROW_LIMIT)
+            .execution_options(yield_per=CONTEXT_STREAM_BATCH_SIZE)
+        )
+        interactions = [_interaction_context_row(row) async for row in result]
+        return interactions, await _total_rows(session, INTERACTION_CONTEXT_STMT, len(interactions))
+    
+    async def _load_repositories(self, session: AsyncSession) -> Tuple[List[Dict[str, Any]], int]:
+        """Get the first CONTEXT_ROW_LIMIT repositories by name and the total"""
+        stmt = select(*REPOSITORY_CONTEXT_COLUMNS)
+        result = await session.stream(
+            stmt.order_by(*REPOSITORY_CONTEXT_ORDER)
+            .limit(CONTEXT_ROW_LIMIT)
+            .execution_options(yield_per=CONTEXT_STREAM_BATCH_SIZE)
+        )
+        repositories = [
+            {
+                "id": str(r.id),
+                "full_name": r.full_name,
+                "html_url": r.html_url,
+                "default_branch": r.default_branch,
+            }
+            async for r in result
+        ]
+        return repositories, await _total_rows(session, stmt, len(repositories))
+    
+    async def _load_focus(
+        self, question: str, context: Dict[str, Any]
+    ) -> Optional[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]]:
+        """Services the question names, their edges and direct neighbours, or None if it names none
+        
+        Picked from the context snapshot when it holds the whole graph. Only when the snapshot
+        was capped at CONTEXT_ROW_LIMIT rows is the database queried, so a service outside the
+        first rows still brings its connections into the prompt
+        """
+        question_tokens = set(QUESTION_TOKEN_RE.findall(question.lower()))
+        if not question_tokens:
+            return None
+        if _snapshot_is_complete(context):
+            return _focus_from_snapshot(context, question_tokens)
+        try:
+            result = await self.db_session.execute(
+                select(Service.id).where(func.lower(Service.name).in_(question_tokens))
+            )
+            mentioned_ids = set(result.scalars().all())
+            if not mentioned_ids:
+                return None
+            
+            result = await self.db_session.stream(
+                INTERACTION_CONTEXT_STMT.where(or_(
+                    Interaction.source_service_id.in_(mentioned_ids),
+                    Interaction.target_service_id.in_(mentioned_ids),
+                ))
+                .order_by(*INTERACTION_CONTEXT_ORDER)
+                .limit(CONTEXT_ROW_LIMIT)
+                .execution_options(yield_per=CONTEXT_STREAM_BATCH_SIZE)
+            )
+            interactions = []
+            relevant_ids = set(mentioned_ids)
+            async for row in result:
+                interactions.append(_interaction_context_row(row))
+                relevant_ids.update((row.source_service_id, row.target_service_id))
+            
+            result = await self.db_session.stream(
+                select(*SERVICE_CONTEXT_COLUMNS)
+                .where(Service.id.in_(relevant_ids))
+                .order_by(*SERVICE_CONTEXT_ORDER)
+            )
+            services = [_service_context_row(s) async for s in result]
+        except Exception as e:
+            # The unfocused snapshot still answers the question, just less precisely
+            logger.error(f"Error loading focused context: {e}")
+            return None
+        return services, interactions
     
     async def _answer_with_crewai(self, question: str, context: Dict[str, Any], error_analysis_context: Optional[Dict[str, Any]] = None, what_if_context: Optional[Dict[str, Any]] = None) -> str:
         """Use CrewAI to answer the question with context"""
-        # Format context for the agent
-        context_text = f"""
-DATABASE CONTEXT:
-
-Services ({len(context['services'])} total):
-{chr(10).join([f"  - {s['name']} (ID: {s['id']}, Language: {s.get('language', 'unknown')})" for s in context['services'][:50]])}
-{f"... and {len(context['services']) - 50} more services" if len(context['services']) > 50 else ""}
-
-Interactions ({len(context['interactions'])} total):
-{chr(10).join([f"  - {i['source']} -> {i['target']} ({i['type']})" + (f" - {i.get('http_url', i.get('kafka_topic', ''))}" if i.get('http_url') or i.get('kafka_topic') else "") for i in context['interactions'][:50]])}
-{f"... and {len(context['interactions']) - 50} more interactions" if len(context['interactions']) > 50 else ""}
-
-Repositories ({len(context['repositories'])} total):
-{chr(10).join([f"  - {r['full_name']} (Branch: {r.get('default_branch', 'main')})" for r in context['repositories'][:20]])}
-{f"... and {len(context['repositories']) - 20} more repositories" if len(context['repositories']) > 20 else ""}
-
-GITHUB ACCESS:
-{"Available - Can fetch code from repositories" if self.mcp_client else "Not available - No GitHub access token"}
-"""
-
         # Add error analysis context if available (for follow-up questions about error analysis)
         error_analysis_text = ""
         if context.get("error_analysis"):
@@ -324,62 +691,21 @@ Full What-If Analysis Reasoning and Explanation:
             # When analysis context is provided, use a much simpler, direct prompt
             analysis_type = "error analysis" if error_analysis_text else "what-if analysis"
             analysis_context_text = error_analysis_text if error_analysis_text else what_if_analysis_text
+            instructions = _ERROR_FOLLOW_UP_INSTRUCTIONS if error_analysis_text else _WHAT_IF_FOLLOW_UP_INSTRUCTIONS
             
-            task_description = f"""
-You are answering a follow-up question about a PREVIOUS {analysis_type} that was already completed.
-
-Question: {question}
-
+            task_description = f"""{instructions}
 PREVIOUS {analysis_type.upper()} CONTEXT (use this to answer):
 {analysis_context_text}
 
-CRITICAL INSTRUCTIONS:
-- This is NOT a request to analyze a new {"error" if error_analysis_text else "change"}
-- This is NOT a request to run {"error analysis" if error_analysis_text else "what-if analysis"}
-- DO NOT write "{analysis_type.upper()}" sections
-- DO NOT include sections like "PRIMARY AFFECTED SERVICE", "DEPENDENT SERVICES", "BLAST RADIUS", etc.
-- DO NOT analyze new {"logs" if error_analysis_text else "changes"}
-- ONLY answer the specific question asked: "{question}"
-
-Answer Format:
-- Start directly with your answer (no headers like "{analysis_type.upper()}")
-- Reference the PREVIOUS {analysis_type.upper()} CONTEXT above
-- Be concise and conversational
-- Just explain why the service was identified (or whatever the question asks)
-- Do not repeat the entire analysis
-
-Example answer format (EXACTLY how you should respond):
-{"According to the previous error analysis, review-service was identified as the primary service because the error log showed a database connection timeout occurring in review-service at line 142 when attempting to execute a SELECT query. The error log explicitly states 'review-service.app' as the source of the error, which is why it was marked as the primary affected service." if error_analysis_text else "According to the previous what-if analysis, user-service was identified as the changed service because the change description mentioned modifying the user authentication endpoint. The analysis found that this change will affect order-service and cart-service because they depend on user-service for user validation."}
-
-IMPORTANT:
-- Your response should look like the example above - conversational, direct, and concise
-- Do NOT start with "{analysis_type.upper()}" or any headers
-- Do NOT include sections like "PRIMARY AFFECTED SERVICE", "DEPENDENT SERVICES", "BLAST RADIUS", etc.
-- Do NOT repeat the entire analysis output
-- Just answer the question in 2-4 sentences using the context provided above
-
 Now answer this question in the format shown above: {question}
 """
         else:
-            task_description = f"""
-Answer the following question about the microservice architecture:
-
-Question: {question}
-
+            # Format context for the agent, narrowed to the services the question names
+            context_text = self._format_database_context(_focus_context(context, await self._load_focus(question, context)))
+            task_description = f"""{_ARCHITECTURE_INSTRUCTIONS}
 {context_text}{what_if_analysis_text}
 
-Instructions:
-1. Use the database context provided above to answer the question
-2. If you need code details from GitHub repositories, mention that you can access them but focus on the database information first
-3. Provide a clear, helpful answer with specific details
-4. If the question asks about specific services, mention their names, connections, and relevant details
-5. If the question is about dependencies, explain the relationships clearly
-6. Be conversational and helpful - this is a chat interface
-7. Format URLs to be concise - use paths like /users/{{user_id}}/validate instead of full URLs
-8. Keep lines under 80 characters when possible to fit in the chat box
-9. Break long lists into multiple lines with proper indentation
-
-Answer the question directly and clearly. Format your response to be readable in a chat interface.
+Question: {question}
 """
         
         # Create task - must be outside if/else so it's always defined
@@ -395,18 +721,26 @@ Answer the question directly and clearly. Format your response to be readable in
                     crew = Crew(
                         agents=[self.agent],
                         tasks=[task],
-                        verbose=True,
+                        verbose=settings.debug,
                         max_iter=2 if (error_analysis_text or what_if_analysis_text) else 3,  # Limit iterations for follow-up questions to prevent over-analysis
                     )
                     result = crew.kickoff()
                     return result
                 except Exception as e:
-                    logger.error(f"Error in CrewAI execution: {e}", exc_info=True)
+                    logger.exception("Error in CrewAI execution: %s", e)
                     raise
             
-            loop = asyncio.get_event_loop()
-            with ThreadPoolExecutor() as executor:
-                result_crew = await loop.run_in_executor(executor, run_crew)
+            loop = asyncio.get_running_loop()
+            try:
+                result_crew = await asyncio.wait_for(
+                    loop.run_in_executor(_CREW_EXECUTOR, run_crew),
+                    timeout=settings.crew_timeout_seconds,
+                )
+            except asyncio.TimeoutError:
+                # The worker thread can't be interrupted and finishes in the background;
+                # the caller just stops waiting for it
+                logger.warning("CrewAI run exceeded %.0fs, giving up on the answer", settings.crew_timeout_seconds)
+                return "I couldn't answer that in time. Please try again or ask a narrower question."
             
             if not result_crew:
                 logger.warning("CrewAI returned None result")
@@ -421,70 +755,27 @@ Answer the question directly and clearly. Format your response to be readable in
             if error_analysis_context or what_if_context or context.get("error_analysis") or context.get("what_if_analysis"):
                 analysis_type = "error analysis" if (error_analysis_context or context.get("error_analysis")) else "what-if analysis"
                 logger.info(f"Cleaning answer to remove {analysis_type} sections if present")
-                # Remove common error analysis section headers and content if present
-                original_answer = answer
-                
-                # Extract just the direct answer part (before any ERROR ANALYSIS sections)
-                lines = answer.split('\n')
-                cleaned_lines = []
-                in_error_analysis_section = False
-                
-                for line in lines:
-                    line_stripped = line.strip()
-                    line_upper = line_stripped.upper()
-                    
-                    # Detect start of analysis sections (error analysis or what-if)
-                    if any(header in line_upper for header in ['ERROR ANALYSIS', 'WHAT-IF ANALYSIS', 'WHAT IF ANALYSIS', 'PRIMARY AFFECTED SERVICE', 'DEPENDENT SERVICES', 'AFFECTED CONNECTIONS', 'BLAST RADIUS', 'RISK HOTSPOTS', 'HOW TO FIX THE ERROR', 'HOW TO MITIGATE RISK']):
-                        in_error_analysis_section = True
-                        continue
-                    
-                    # Stop collecting if we hit another section header
-                    if in_error_analysis_section and line_stripped == '':
-                        continue
-                    
-                    # Skip lines that look like section headers
-                    if line_stripped and (line_stripped.startswith('=') or line_upper.startswith('PRIMARY') or line_upper.startswith('DEPENDENT') or line_upper.startswith('AFFECTED') or line_upper.startswith('BLAST') or line_upper.startswith('RISK') or line_upper.startswith('HOW TO FIX') or line_upper.startswith('HOW TO MITIGATE')):
-                        continue
-                    
-                    # Include lines that look like actual answers
-                    if not in_error_analysis_section or (line_stripped and not line_upper.startswith('AGENT STOPPED')):
-                        cleaned_lines.append(line)
-                    else:
-                        break
-                
-                # If we cleaned the answer, use it
-                if cleaned_lines and len(cleaned_lines) < len(lines):
-                    answer = '\n'.join(cleaned_lines).strip()
-                    logger.info(f"Cleaned answer from {len(lines)} lines to {len(cleaned_lines)} lines")
-                elif any(header in original_answer.upper() for header in ['ERROR ANALYSIS', 'WHAT-IF ANALYSIS', 'WHAT IF ANALYSIS', 'PRIMARY AFFECTED SERVICE', 'BLAST RADIUS', 'RISK HOTSPOTS']):
-                    # If the answer still contains analysis sections, extract just the first few sentences
-                    logger.warning("Answer still contains analysis sections, extracting direct answer")
-                    # Try to extract just the first meaningful paragraph (before analysis sections)
-                    parts = original_answer.split('ERROR ANALYSIS')
-                    if len(parts) == 1:
-                        parts = original_answer.split('WHAT-IF ANALYSIS')
-                    if len(parts) == 1:
-                        parts = original_answer.split('WHAT IF ANALYSIS')
-                    if len(parts) > 1:
-                        # Take everything before analysis section
-                        answer = parts[0].strip()
-                    else:
-                        # Take first 3 lines or first paragraph
-                        first_paragraph = original_answer.split('\n\n')[0] if '\n\n' in original_answer else '\n'.join(original_answer.split('\n')[0:3])
-                        answer = first_paragraph.strip()
-                    
-                    # If answer is still too long or contains section headers, take just first 200 chars
-                    if len(answer) > 500 or any(header in answer.upper() for header in ['PRIMARY AFFECTED', 'DEPENDENT SERVICES', 'AFFECTED CONNECTIONS', 'BLAST RADIUS', 'RISK HOTSPOTS']):
-                        # Extract just the first sentence(s) that directly answer the question
-                        sentences = answer.split('. ')
-                        relevant_sentences = []
-                        for sentence in sentences[:3]:  # Take first 3 sentences
-                            if sentence.strip() and not any(header in sentence.upper() for header in ['ERROR ANALYSIS', 'WHAT-IF ANALYSIS', 'WHAT IF ANALYSIS', 'PRIMARY AFFECTED', 'DEPENDENT SERVICES', 'AFFECTED CONNECTIONS', 'BLAST RADIUS', 'RISK HOTSPOTS']):
-                                relevant_sentences.append(sentence.strip())
-                        if relevant_sentences:
-                            answer = '. '.join(relevant_sentences)
-                            if not answer.endswith('.'):
-                                answer += '.'
+                # Keep just the direct answer: cut once at the first analysis section header
+                header = ANALYSIS_HEADER_RE.search(answer)
+                if header:
+                    direct_answer = TRAILING_BANNERS_RE.sub('', answer[:header.start()]).strip()
+                    if len(direct_answer) < MIN_DIRECT_ANSWER_CHARS:
+                        # Little or nothing comes before the first section; drop the header lines
+                        # and stop at CrewAI's "Agent stopped" notice instead
+                        cleaned_lines = []
+                        for line in answer.split('\n'):
+                            if AGENT_STOPPED_RE.match(line):
+                                break
+                            if line.isspace() or not line or SECTION_HEADER_LINE_RE.match(line) or ANALYSIS_HEADER_RE.search(line):
+                                continue
+                            cleaned_lines.append(line)
+                        direct_answer = '\n'.join(cleaned_lines).strip()
+                    if len(direct_answer) < MIN_DIRECT_ANSWER_CHARS:
+                        logger.warning("Answer is mostly analysis sections, extracting direct answer")
+                        direct_answer = _first_paragraph(answer)
+                    if direct_answer:
+                        answer = direct_answer
+                        logger.info(f"Cut answer before {analysis_type} section at character {header.start()}")
             
             # Format the answer to fit in chat box
             try:
@@ -493,89 +784,79 @@ Answer the question directly and clearly. Format your response to be readable in
                 logger.warning(f"Error formatting answer, using unformatted: {e}")
                 # Continue with unformatted answer if formatting fails
             
-            # Clean text to remove emojis and extraneous characters
-            clean_answer = clean_text_for_chat(answer)
-            
-            return clean_answer
+            # Emoji and whitespace cleanup happens once, in query()
+            return answer
         except Exception as e:
-            import traceback
-            error_trace = traceback.format_exc()
-            logger.error(f"Error running CrewAI agent: {e}\n{error_trace}", exc_info=True)
+            logger.exception("Error running CrewAI agent: %s", e)
             return f"I encountered an error while processing your question: {str(e)}. Please try rephrasing it."
     
-    def _format_url(self, url: str, max_length: int = 50) -> str:
-        """Format URL to fit in chat box"""
-        if not url:
-            return ""
-        if url.startswith('http://') or url.startswith('https://'):
-            from urllib.parse import urlparse
-            parsed = urlparse(url)
-            path = parsed.path
-            if path:
-                url = path
+    def _format_database_context(self, context: Dict[str, Any]) -> str:
+        """Render the database context block, listing only the rows the prompt shows"""
+        services_total = context["services_total"]
+        interactions_total = context["interactions_total"]
+        repositories_total = context["repositories_total"]
+        services = context["services"][:50]
+        interactions = context["interactions"][:50]
+        focus_note = "; showing those in the question and their direct connections" if context.get("focused") else ""
         
-        if '{' in url:
-            url = re.sub(r'^\{[^}]+\}', '', url)
-            if url and not url.startswith('/'):
-                url = '/' + url
-            url = re.sub(r'\{[^}]+\}', '{...}', url)
+        parts = ["\nDATABASE CONTEXT:\n\n", f"Services ({services_total} total{focus_note}):\n"]
+        parts.append("\n".join(
+            f"  - {s['name']} (ID: {s['id']}, Language: {s.get('language', 'unknown')})"
+            for s in services
+        ))
+        hidden = services_total - len(services)
+        parts.append(f"\n... and {hidden} more services\n\n" if hidden > 0 else "\n\n\n")
         
-        if len(url) > max_length:
-            if '/' in url:
-                parts = url.split('/')
-                if len(parts) > 2:
-                    return f"/{parts[1]}/.../{parts[-1]}"
-            return url[:max_length-3] + "..."
-        return url
+        parts.append(f"Interactions ({interactions_total} total{focus_note}):\n")
+        parts.append("\n".join(
+            f"  - {i['source']} -> {i['target']} ({i['type']})"
+            + (f" - {i.get('http_url', i.get('kafka_topic', ''))}" if i.get('http_url') or i.get('kafka_topic') else "")
+            for i in interactions
+        ))
+        hidden = interactions_total - len(interactions)
+        parts.append(f"\n... and {hidden} more interactions\n\n" if hidden > 0 else "\n\n\n")
+        
+        parts.append(f"Repositories ({repositories_total} total):\n")
+        parts.append("\n".join(
+            f"  - {r['full_name']} (Branch: {r.get('default_branch', 'main')})"
+            for r in context["repositories"][:20]
+        ))
+        parts.append(f"\n... and {repositories_total - 20} more repositories\n\n" if repositories_total > 20 else "\n\n\n")
+        
+        parts.append("GITHUB ACCESS:\n")
+        parts.append("Available - Can fetch code from repositories" if self.mcp_client else "Not available - No GitHub access token")
+        parts.append("\n")
+        return "".join(parts)
     
     def _format_answer_for_chat(self, answer: str, max_line_length: int = 80) -> str:
         """Format answer to fit within chat box by wrapping long lines and formatting URLs"""
         if not answer:
             return answer
         
+        # Nothing URL-like to shorten and no line to wrap: the answer already fits the chat box
+        if '/' not in answer and '{' not in answer and all(len(line) <= max_line_length for line in answer.split('\n')):
+            return answer
+        
+        def replace_url(match):
+            try:
+                url = match.group(1)
+                formatted = _format_url(url, max_length=50)
+                return formatted
+            except Exception:
+                return match.group(0)  # Return original if formatting fails
+        
         try:
-            lines = answer.split('\n')
+            wrapper = _line_wrapper(max_line_length)
             formatted_lines = []
             
-            for line in lines:
-                try:
-                    # Format URLs in the line
-                    # Match URLs like {SERVICE_URL}/path or http://... or /path
-                    url_pattern = r'(\{[A-Z_]+\_SERVICE_URL\}[^\s\)]+|https?://[^\s\)]+|/[^\s\)]+)'
-                    
-                    def replace_url(match):
-                        try:
-                            url = match.group(1)
-                            formatted = self._format_url(url, max_length=50)
-                            return formatted
-                        except Exception:
-                            return match.group(0)  # Return original if formatting fails
-                    
-                    line = re.sub(url_pattern, replace_url, line)
-                    
-                    # Wrap long lines
-                    if len(line) > max_line_length:
-                        words = line.split(' ')
-                        current_line = []
-                        current_length = 0
-                        
-                        for word in words:
-                            word_length = len(word)
-                            if current_length + word_length + 1 > max_line_length and current_line:
-                                formatted_lines.append(' '.join(current_line))
-                                current_line = [word]
-                                current_length = word_length
-                            else:
-                                current_line.append(word)
-                                current_length += word_length + 1
-                        
-                        if current_line:
-                            formatted_lines.append(' '.join(current_line))
-                    else:
-                        formatted_lines.append(line)
-                except Exception as e:
-                    # If formatting a line fails, just add it as-is
-                    logger.warning(f"Error formatting line, using as-is: {e}")
+            for line in answer.split('\n'):
+                # Format URLs in the line
+                line = CHAT_URL_RE.sub(replace_url, line)
+                
+                # Wrap long lines
+                if len(line) > max_line_length:
+                    formatted_lines.extend(wrapper.wrap(line))
+                else:
                     formatted_lines.append(line)
             
             return '\n'.join(formatted_lines)
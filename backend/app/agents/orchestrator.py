@@ -1,6 +1,6 @@
 """Orchestrator agent for coordinating scan phases"""
 from crewai import Agent
-from langchain_openai import ChatOpenAI
+from app.agents.llm import get_llm
 from app.config import settings
 
 
@@ -8,17 +8,13 @@ class OrchestratorAgent:
     """Orchestrator agent that coordinates scan phases"""
     
     def __init__(self):
-        self.llm = ChatOpenAI(
-            model="gpt-4o",
-            temperature=0.1,
-            openai_api_key=settings.openai_api_key,
-        )
+        self.llm = get_llm()
         
         self.agent = Agent(
             role="Scan Orchestrator",
             goal="Coordinate the scanning pipeline phases: fetch, parse, normalize, and store",
             backstory="You are an experienced system architect who coordinates complex code analysis workflows.",
-            verbose=True,
+            verbose=settings.debug,
             llm=self.llm,
         )
     
@@ -1,6 +1,6 @@
 """Parser agent for running detectors"""
 from crewai import Agent
-from langchain_openai import ChatOpenAI
+from app.agents.llm import get_llm
 from app.config import settings
 from typing import List, Dict, Any
 
@@ -9,17 +9,13 @@ class ParserAgent:
     """Agent that runs language-aware detectors"""
     
     def __init__(self):
-        self.llm = ChatOpenAI(
-            model="gpt-4o",
-            temperature=0.1,
-            openai_api_key=settings.openai_api_key,
-        )
+        self.llm = get_llm()
         
         self.agent = Agent(
             role="Code Parser",
             goal="Extract inter-service calls (HTTP, Kafka) from code using language-aware detectors",
             backstory="You are a static analysis expert who understands multiple programming languages and can identify service interactions.",
-            verbose=True,
+            verbose=settings.debug,
             llm=self.llm,
         )
     
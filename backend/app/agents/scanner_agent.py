@@ -1,6 +1,6 @@
 """Scanner agent for driving MCP GitHub tools"""
 from crewai import Agent, Task
-from langchain_openai import ChatOpenAI
+from app.agents.llm import get_llm
 from app.config import settings
 from app.services.mcp_client import MCPGitHubClient
 
@@ -10,17 +10,13 @@ class ScannerAgent:
     
     def __init__(self, mcp_client: MCPGitHubClient):
         self.mcp_client = mcp_client
-        self.llm = ChatOpenAI(
-            model="gpt-4o",
-            temperature=0.1,
-            openai_api_key=settings.openai_api_key,
-        )
+        self.llm = get_llm()
         
         self.agent = Agent(
             role="Code Scanner",
             goal="Fetch code files from GitHub repositories using MCP tools",
             backstory="You are a code scanning specialist who efficiently retrieves code from version control systems.",
-            verbose=True,
+            verbose=settings.debug,
             llm=self.llm,
         )
     
@@ -1,6 +1,6 @@
 """What-if simulator agent"""
 from crewai import Agent, Task, Crew
-from langchain_openai import ChatOpenAI
+from app.agents.llm import get_llm
 from app.config import settings
 from app.services.mcp_client import MCPGitHubClient
 from app.services.code_fetch import CodeFetchService
@@ -11,9 +11,9 @@ from app.services.detectors.kafka_python import PythonKafkaDetector
 from app.services.detectors.kafka_java import JavaKafkaDetector
 from app.services.detectors.kafka_node import NodeKafkaDetector
 from app.db.models import Service, Interaction, Repository
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_
-from typing import Dict, Any, List, Optional, Set
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy import Row, Select, func, select, and_, or_
+from typing import Dict, Any, List, Optional, Set, Tuple
 import logging
 import asyncio
 import uuid
@@ -22,6 +22,15 @@ from concurrent.futures import ThreadPoolExecutor
 
 logger = logging.getLogger(__name__)
 
+# Interaction columns needed to describe an edge; selecting them directly skips ORM hydration
+EDGE_COLUMNS = (
+    Interaction.source_service_id,
+    Interaction.target_service_id,
+    Interaction.edge_type,
+    Interaction.http_url,
+    Interaction.kafka_topic,
+)
+
 
 def clean_text_for_chat(text: str) -> str:
     """Remove emojis and extraneous characters to make text human-readable"""
@@ -74,10 +83,20 @@ def clean_text_for_chat(text: str) -> str:
 class WhatIfAgent:
     """Agent for simulating impact of code changes and predicting blast radius"""
     
-    def __init__(self, db_session: AsyncSession, mcp_client: Optional[MCPGitHubClient] = None):
+    def __init__(
+        self,
+        db_session: AsyncSession,
+        mcp_client: Optional[MCPGitHubClient] = None,
+        session_factory: Optional[async_sessionmaker] = None,
+    ):
         self.db_session = db_session
         self.mcp_client = mcp_client
+        # Optional factory for short-lived sessions that can run alongside db_session
+        self.session_factory = session_factory
         self.code_fetch = CodeFetchService(mcp_client) if mcp_client else None
+        # All services, loaded on the first name lookup and reused for the rest of the simulation
+        self._services: Optional[List[Service]] = None
+        self._services_by_lower_name: Dict[str, List[Service]] = {}
         
         # Initialize detectors
         self.detectors = {
@@ -99,17 +118,13 @@ class WhatIfAgent:
             },
         }
         
-        self.llm = ChatOpenAI(
-            model="gpt-4o",
-            temperature=0.1,
-            openai_api_key=settings.openai_api_key,
-        )
+        self.llm = get_llm()
         
         self.agent = Agent(
             role="What-If Impact Analyzer",
             goal="Analyze code changes and predict blast radius and risk hotspots across microservices by analyzing GitHub repositories",
             backstory="You are an expert at analyzing code changes, understanding their impact on distributed systems, and predicting which services will be affected. You understand HTTP APIs, Kafka events, database changes, and service dependencies. You analyze code from GitHub repositories to identify actual connections between services.",
-            verbose=True,
+            verbose=settings.debug,
             llm=self.llm,
             allow_delegation=False,
         )
@@ -140,10 +155,12 @@ class WhatIfAgent:
                 # Otherwise, prioritize description extraction as it's more explicit
                 if not changed_service_names or any(s in analysis_changed_services for s in changed_service_names):
                     # Merge but prioritize description matches
+                    # ("update/change/modify <name>" all contain <name>, so one substring check covers them)
+                    change_description_lower = change_description.lower()
                     for service in analysis_changed_services:
                         if service not in changed_service_names:
                             # Only add if it's explicitly mentioned as being changed
-                            if any(keyword in change_description.lower() for keyword in [service.lower(), f"update {service.lower()}", f"change {service.lower()}", f"modify {service.lower()}"]):
+                            if service.lower() in change_description_lower:
                                 changed_service_names.append(service)
             
             if not changed_service_names:
@@ -162,9 +179,12 @@ class WhatIfAgent:
             
             # Step 3: Find changed services in database
             changed_services = []
+            # Names that match a service exactly are resolved by one indexed IN() query; only
+            # the misses load the full service list for partial matching
+            exact_matches = await self._find_services_by_exact_names(changed_service_names)
             for service_name in changed_service_names:
                 logger.info(f"Attempting to find service in database: '{service_name}'")
-                service = await self._find_service_by_name(service_name)
+                service = exact_matches.get(service_name) or await self._find_service_by_name(service_name)
                 if service:
                     logger.info(f"✅ Found service: '{service.name}' (ID: {service.id})")
                     changed_services.append(service)
@@ -193,8 +213,12 @@ class WhatIfAgent:
             # First, get all connected services from interactions table
             logger.info(f"Step 4: Analyzing impact on dependent services for: {[s.name for s in changed_services]}")
             
+            # Every edge touching a changed service, fetched in one round trip and shared by the
+            # connected-services summary, the impact filter and the database fallback below
+            changed_service_edges = await self._fetch_changed_service_edges(changed_services)
+            
             # Get all interactions involving the changed service
-            all_connected_services = await self._get_all_connected_services(changed_services)
+            all_connected_services = await self._get_all_connected_services(changed_services, changed_service_edges)
             logger.info(f"Found {len(all_connected_services)} connected services from interactions table")
             
             # Use CrewAI to determine which connected services will be harmed by this change
@@ -207,9 +231,18 @@ class WhatIfAgent:
             
             # Step 5: Filter blast radius to only include services that will be harmed
             blast_radius_nodes = set()
-            blast_radius_edges = []
+            blast_radius_edges = {}  # {(source_id, target_id): edge}; a repeated pair keeps its first edge
             blast_radius_details = {}  # {service_id: {type, url, topic, reason, file_path, line}}
             
+            # Repositories of all changed services in one query rather than one per service
+            repo_ids = {s.repo_id for s in changed_services if s.repo_id is not None}
+            repositories_by_id = {}
+            if repo_ids:
+                repo_result = await self.db_session.execute(
+                    select(Repository).where(Repository.id.in_(repo_ids))
+                )
+                repositories_by_id = {r.id: r for r in repo_result.scalars().all()}
+            
             for changed_service in changed_services:
                 logger.info(f"Analyzing service: {changed_service.name}")
                 
@@ -220,13 +253,11 @@ class WhatIfAgent:
                     blast_radius_nodes,
                     blast_radius_edges,
                     blast_radius_details,
+                    interactions=changed_service_edges,
                 )
                 
                 # Also check outgoing connections (what this service calls)
-                repo_result = await self.db_session.execute(
-                    select(Repository).where(Repository.id == changed_service.repo_id)
-                )
-                repository = repo_result.scalar_one_or_none()
+                repository = repositories_by_id.get(changed_service.repo_id)
                 
                 if repository and self.mcp_client:
                     logger.info(f"Scanning repository for outgoing connections: {repository.full_name}")
@@ -245,6 +276,7 @@ class WhatIfAgent:
                         blast_radius_nodes,
                         blast_radius_edges,
                         blast_radius_details,
+                        interactions=changed_service_edges,
                     )
             
             # Step 6: Deduplicate and filter blast radius edges
@@ -252,15 +284,12 @@ class WhatIfAgent:
             # An edge should have: one end = changed service, other end = blast radius service
             changed_service_ids_set = {str(s.id) for s in changed_services}
             deduplicated_blast_radius_edges = []
-            seen_edges = set()
+            excluded_edges = 0
             
             logger.info(f"Before deduplication: {len(blast_radius_edges)} edges, changed services: {changed_service_ids_set}, blast radius: {blast_radius_nodes}")
             
-            for edge in blast_radius_edges:
-                source_id = str(edge['source'])
-                target_id = str(edge['target'])
-                edge_key = f"{source_id}-{target_id}"
-                
+            # Edges are already unique per (source, target), so this pass only filters
+            for (source_id, target_id), edge in blast_radius_edges.items():
                 # Only include edges where:
                 # - Source is changed service AND target is in blast radius, OR
                 # - Target is changed service AND source is in blast radius
@@ -274,15 +303,14 @@ class WhatIfAgent:
                 # Exclude edges where both ends are in blast radius but neither is changed
                 if ((source_is_changed and target_is_blast) or 
                     (target_is_changed and source_is_blast)):
-                    if edge_key not in seen_edges:
-                        deduplicated_blast_radius_edges.append(edge)
-                        seen_edges.add(edge_key)
-                        logger.info(f"  Included edge: {source_id} -> {target_id} (source_changed={source_is_changed}, target_changed={target_is_changed})")
+                    deduplicated_blast_radius_edges.append(edge)
+                    logger.debug("  Included edge: %s -> %s (source_changed=%s, target_changed=%s)", source_id, target_id, source_is_changed, target_is_changed)
                 else:
-                    logger.info(f"  Excluded edge: {source_id} -> {target_id} (not connecting changed to blast radius)")
+                    excluded_edges += 1
+                    logger.debug("  Excluded edge: %s -> %s (not connecting changed to blast radius)", source_id, target_id)
             
             blast_radius_edges = deduplicated_blast_radius_edges
-            logger.info(f"After deduplication: {len(blast_radius_edges)} edges connecting changed services to blast radius")
+            logger.info(f"After deduplication: {len(blast_radius_edges)} edges connecting changed services to blast radius ({excluded_edges} excluded)")
             
             # Step 7: Find risk hotspots (services with high impact potential)
             risk_hotspot_nodes = set()
@@ -293,18 +321,34 @@ class WhatIfAgent:
             # 2. Have many incoming connections (high in-degree) - many services depend on them
             # 3. Have critical dependencies
             
+            # Parse the blast radius IDs once, dropping malformed ones, and reuse them below
+            blast_radius_uuids: Dict[str, uuid.UUID] = {}
             for node_id in blast_radius_nodes:
-                # Count how many services depend on this service
-                result = await self.db_session.execute(
-                    select(Interaction).where(Interaction.target_service_id == uuid.UUID(node_id))
-                )
-                incoming_count = len(result.scalars().all())
-                
-                # Count how many services this service depends on
-                result = await self.db_session.execute(
-                    select(Interaction).where(Interaction.source_service_id == uuid.UUID(node_id))
-                )
-                outgoing_count = len(result.scalars().all())
+                try:
+                    blast_radius_uuids[node_id] = uuid.UUID(node_id)
+                except (ValueError, TypeError) as e:
+                    logger.error(f"Error converting service ID to UUID: {node_id}, error: {e}")
+            
+            # Load the blast radius services once; their names serve the hotspot reasons below
+            blast_radius_services = []
+            if blast_radius_uuids:
+                try:
+                    result = await self.db_session.execute(
+                        select(Service).where(Service.id.in_(list(blast_radius_uuids.values())))
+                    )
+                    blast_radius_services = result.scalars().all()
+                except Exception as e:
+                    logger.error(f"Error loading blast radius services: {e}")
+            blast_radius_names_by_id = {str(s.id): s.name for s in blast_radius_services}
+            
+            # In- and out-degree of every blast radius service, counted by the database in two
+            # grouped queries instead of two queries per service
+            incoming_counts, outgoing_counts = await self._count_connections(list(blast_radius_uuids.values()))
+            
+            for node_id, node_uuid in blast_radius_uuids.items():
+                # How many services depend on this service, and how many it depends on
+                incoming_count = incoming_counts.get(node_uuid, 0)
+                outgoing_count = outgoing_counts.get(node_uuid, 0)
                 
                 # Calculate risk score (high in-degree = high risk)
                 risk_score = incoming_count + (outgoing_count * 0.5)  # Incoming is more critical
@@ -314,8 +358,7 @@ class WhatIfAgent:
                     risk_hotspot_nodes.add(node_id)
                     
                     if node_id not in risk_hotspot_details:
-                        service = await self._get_service_by_id(node_id)
-                        service_name = service.name if service else f"Service {node_id[:8]}"
+                        service_name = blast_radius_names_by_id.get(node_id, f"Service {node_id[:8]}")
                         risk_hotspot_details[node_id] = {
                             "risk_score": risk_score,
                             "incoming_connections": incoming_count,
@@ -333,31 +376,10 @@ class WhatIfAgent:
             logger.info(f"Changed service names (from database): {changed_service_names_list}")
             logger.info(f"Changed service IDs: {[str(s.id) for s in changed_services]}")
             
-            blast_radius_service_names = []
-            if blast_radius_nodes:
-                try:
-                    uuid_ids = [uuid.UUID(id) for id in blast_radius_nodes]
-                    result = await self.db_session.execute(
-                        select(Service).where(Service.id.in_(uuid_ids))
-                    )
-                    services = result.scalars().all()
-                    blast_radius_service_names = [s.name for s in services]
-                    service_id_to_name.update({str(s.id): s.name for s in services})
-                except Exception as e:
-                    logger.error(f"Error converting service IDs to UUIDs: {e}")
-            
-            risk_hotspot_service_names = []
-            if risk_hotspot_nodes:
-                try:
-                    uuid_ids = [uuid.UUID(id) for id in risk_hotspot_nodes]
-                    result = await self.db_session.execute(
-                        select(Service).where(Service.id.in_(uuid_ids))
-                    )
-                    services = result.scalars().all()
-                    risk_hotspot_service_names = [s.name for s in services]
-                    service_id_to_name.update({str(s.id): s.name for s in services})
-                except Exception as e:
-                    logger.error(f"Error converting service IDs to UUIDs: {e}")
+            # Hotspots are a subset of the blast radius, so both name lists come from the services loaded above
+            blast_radius_service_names = [s.name for s in blast_radius_services]
+            risk_hotspot_service_names = [s.name for s in blast_radius_services if str(s.id) in risk_hotspot_nodes]
+            service_id_to_name.update(blast_radius_names_by_id)
             
             # Step 9: Build reasoning with detailed proof
             reasoning = self._build_reasoning(
@@ -417,10 +439,7 @@ class WhatIfAgent:
                 "confidence": 0.8,
             }
         except Exception as e:
-            logger.error(f"Error in simulate method: {e}", exc_info=True)
-            import traceback
-            error_trace = traceback.format_exc()
-            logger.error(f"Full traceback: {error_trace}")
+            logger.exception("Error in simulate method: %s", e)
             error_reasoning = f"An error occurred while analyzing the change.\n\nError: {str(e)}\n\nPlease check the backend logs for full details."
             clean_error_reasoning = clean_text_for_chat(error_reasoning)
             
@@ -438,7 +457,7 @@ class WhatIfAgent:
         changed_service: Service,
         repository: Repository,
         blast_radius_nodes: Set[str],
-        blast_radius_edges: List[Dict],
+        blast_radius_edges: Dict[Tuple[str, str], Dict],
         blast_radius_details: Dict[str, Dict],
     ):
         """Scan a service's GitHub repository to find actual connections"""
@@ -473,7 +492,6 @@ class WhatIfAgent:
             logger.info(f"Found {len(all_findings)} findings in {repository.full_name}")
             
             # Match findings to services in database
-            seen_edges = set()  # Track edges by (source, target) tuple
             for finding in all_findings:
                 # For HTTP findings, try to match URL to target service
                 if finding.get("type") == "HTTP":
@@ -482,14 +500,11 @@ class WhatIfAgent:
                     if target_service and str(target_service.id) != changed_service_id:
                         target_id = str(target_service.id)
                         blast_radius_nodes.add(target_id)
-                        edge_key = (changed_service_id, target_id)
-                        if edge_key not in seen_edges:
-                            blast_radius_edges.append({
-                                "source": changed_service_id,
-                                "target": target_id,
-                                "type": "HTTP",
-                            })
-                            seen_edges.add(edge_key)
+                        blast_radius_edges.setdefault((changed_service_id, target_id), {
+                            "source": changed_service_id,
+                            "target": target_id,
+                            "type": "HTTP",
+                        })
                         
                         if target_id not in blast_radius_details:
                             blast_radius_details[target_id] = {
@@ -511,14 +526,11 @@ class WhatIfAgent:
                             if str(consumer_service.id) != changed_service_id:
                                 consumer_id = str(consumer_service.id)
                                 blast_radius_nodes.add(consumer_id)
-                                edge_key = (changed_service_id, consumer_id)
-                                if edge_key not in seen_edges:
-                                    blast_radius_edges.append({
-                                        "source": changed_service_id,
-                                        "target": consumer_id,
-                                        "type": "KAFKA",
-                                    })
-                                    seen_edges.add(edge_key)
+                                blast_radius_edges.setdefault((changed_service_id, consumer_id), {
+                                    "source": changed_service_id,
+                                    "target": consumer_id,
+                                    "type": "KAFKA",
+                                })
                                 
                                 if consumer_id not in blast_radius_details:
                                     blast_radius_details[consumer_id] = {
@@ -536,14 +548,11 @@ class WhatIfAgent:
                             if str(producer_service.id) != changed_service_id:
                                 producer_id = str(producer_service.id)
                                 blast_radius_nodes.add(producer_id)
-                                edge_key = (producer_id, changed_service_id)
-                                if edge_key not in seen_edges:
-                                    blast_radius_edges.append({
-                                        "source": producer_id,
-                                        "target": changed_service_id,
-                                        "type": "KAFKA",
-                                    })
-                                    seen_edges.add(edge_key)
+                                blast_radius_edges.setdefault((producer_id, changed_service_id), {
+                                    "source": producer_id,
+                                    "target": changed_service_id,
+                                    "type": "KAFKA",
+                                })
                                 
                                 if producer_id not in blast_radius_details:
                                     blast_radius_details[producer_id] = {
@@ -560,32 +569,37 @@ class WhatIfAgent:
             # Fallback to database for outgoing connections
             await self._find_outgoing_connections_from_db(changed_service, blast_radius_nodes, blast_radius_edges, blast_radius_details)
     
-    async def _get_all_connected_services(self, changed_services: List[Service]) -> Dict[str, List[Dict]]:
-        """Get all services connected to the changed service(s) from interactions table
+    async def _fetch_changed_service_edges(self, changed_services: List[Service]) -> List[Row]:
+        """Fetch incoming and outgoing connections of every changed service in one query"""
+        if not changed_services:
+            return []
+        changed_uuids = [s.id for s in changed_services]
+        return await self._fetch_rows(
+            select(*EDGE_COLUMNS, Interaction.http_method).where(
+                or_(
+                    Interaction.target_service_id.in_(changed_uuids),
+                    Interaction.source_service_id.in_(changed_uuids),
+                )
+            )
+        )
+    
+    async def _get_all_connected_services(self, changed_services: List[Service], interactions: List[Row]) -> Dict[str, List[Dict]]:
+        """Get all services connected to the changed service(s) from their prefetched interactions
         
         Returns:
             Dict mapping service_id -> [list of interactions with details]
         """
         connected_services = {}  # {service_id: [interaction_details]}
-        changed_service_ids = {str(s.id) for s in changed_services}
+        if not changed_services:
+            return connected_services
         
         for changed_service in changed_services:
             changed_service_id = str(changed_service.id)
             
-            # Find incoming connections (services that call the changed service)
-            result = await self.db_session.execute(
-                select(Interaction).where(Interaction.target_service_id == uuid.UUID(changed_service_id))
-            )
-            incoming_interactions = result.scalars().all()
-            
-            # Find outgoing connections (services that the changed service calls)
-            result = await self.db_session.execute(
-                select(Interaction).where(Interaction.source_service_id == uuid.UUID(changed_service_id))
-            )
-            outgoing_interactions = result.scalars().all()
-            
-            # Process incoming connections
-            for interaction in incoming_interactions:
+            # Process incoming connections (services that call the changed service)
+            for interaction in interactions:
+                if interaction.target_service_id != changed_service.id:
+                    continue
                 caller_id = str(interaction.source_service_id)
                 if caller_id not in connected_services:
                     connected_services[caller_id] = []
@@ -599,8 +613,10 @@ class WhatIfAgent:
                     "target_service_name": changed_service.name,
                 })
             
-            # Process outgoing connections
-            for interaction in outgoing_interactions:
+            # Process outgoing connections (services that the changed service calls)
+            for interaction in interactions:
+                if interaction.source_service_id != changed_service.id:
+                    continue
                 target_id = str(interaction.target_service_id)
                 if target_id not in connected_services:
                     connected_services[target_id] = []
@@ -614,15 +630,16 @@ class WhatIfAgent:
                     "source_service_name": changed_service.name,
                 })
         
-        # Get service names for each connected service
-        for service_id in connected_services.keys():
+        # Get service names for all connected services in one query
+        if connected_services:
             result = await self.db_session.execute(
-                select(Service).where(Service.id == uuid.UUID(service_id))
+                select(Service.id, Service.name).where(
+                    Service.id.in_([uuid.UUID(service_id) for service_id in connected_services])
+                )
             )
-            service = result.scalar_one_or_none()
-            if service:
-                for conn in connected_services[service_id]:
-                    conn["service_name"] = service.name
+            for service_id, service_name in result.all():
+                for conn in connected_services[str(service_id)]:
+                    conn["service_name"] = service_name
         
         return connected_services
     
@@ -710,7 +727,7 @@ IMPORTANT:
                 crew = Crew(
                     agents=[self.agent],
                     tasks=[task],
-                    verbose=True,
+                    verbose=settings.debug,
                 )
                 return crew.kickoff()
             
@@ -745,7 +762,7 @@ IMPORTANT:
                     match = re.search(pattern, analysis_text, re.IGNORECASE | re.DOTALL)
                     if match:
                         will_be_harmed = match.group(1).upper() == "YES"
-                        logger.info(f"✅ Service {service_name} ({service_id[:8]}): Will be harmed = {will_be_harmed}")
+                        logger.debug("✅ Service %s (%s): Will be harmed = %s", service_name, service_id[:8], will_be_harmed)
                         break
                 
                 if will_be_harmed is None:
@@ -760,11 +777,11 @@ IMPORTANT:
                             no_match = re.search(r'harmed:\s*(NO)', context, re.IGNORECASE)
                             if yes_match and (not no_match or yes_match.start() < no_match.start()):
                                 will_be_harmed = True
-                                logger.info(f"✅ Service {service_name} ({service_id[:8]}): Will be harmed = YES (found in context)")
+                                logger.debug("✅ Service %s (%s): Will be harmed = YES (found in context)", service_name, service_id[:8])
                                 break
                             elif no_match:
                                 will_be_harmed = False
-                                logger.info(f"✅ Service {service_name} ({service_id[:8]}): Will be harmed = NO (found in context)")
+                                logger.debug("✅ Service %s (%s): Will be harmed = NO (found in context)", service_name, service_id[:8])
                                 break
                 
                 if will_be_harmed is None:
@@ -774,6 +791,7 @@ IMPORTANT:
                 else:
                     impact_map[service_id] = will_be_harmed
             
+            logger.info(f"Impact analysis: {sum(impact_map.values())} of {len(impact_map)} connected services will be harmed")
             return impact_map
         except Exception as e:
             logger.error(f"Error analyzing impact with CrewAI: {e}", exc_info=True)
@@ -785,17 +803,22 @@ IMPORTANT:
         changed_service: Service,
         impact_analysis: Dict[str, bool],
         blast_radius_nodes: Set[str],
-        blast_radius_edges: List[Dict],
+        blast_radius_edges: Dict[Tuple[str, str], Dict],
         blast_radius_details: Dict[str, Dict],
+        interactions: List[Row],
     ):
-        """Find services that will be harmed by the change based on impact analysis"""
+        """Find services that will be harmed by the change based on impact analysis
+        
+        interactions are the prefetched edges (any superset of this service's) to pick from.
+        """
         changed_service_id = str(changed_service.id)
+        changed_service_uuid = uuid.UUID(changed_service_id)
         
-        # Find incoming connections (services that call the changed service)
-        result = await self.db_session.execute(
-            select(Interaction).where(Interaction.target_service_id == uuid.UUID(changed_service_id))
-        )
-        interactions = result.scalars().all()
+        # Incoming: services that call the changed service; outgoing: what the changed service calls
+        incoming_interactions = [i for i in interactions if i.target_service_id == changed_service_uuid]
+        outgoing_interactions = [i for i in interactions if i.source_service_id == changed_service_uuid]
+        
+        interactions = incoming_interactions
         
         logger.info(f"Found {len(interactions)} incoming connections for {changed_service.name}")
         
@@ -805,7 +828,7 @@ IMPORTANT:
             # Only include if impact analysis says this service will be harmed
             if impact_analysis.get(caller_id, True):  # Default to True if not in analysis
                 blast_radius_nodes.add(caller_id)
-                blast_radius_edges.append({
+                blast_radius_edges.setdefault((caller_id, changed_service_id), {
                     "source": caller_id,
                     "target": changed_service_id,
                     "type": interaction.edge_type.value,
@@ -823,10 +846,7 @@ IMPORTANT:
                         blast_radius_details[caller_id]["topic"] = interaction.kafka_topic
         
         # Also check outgoing connections (what changed service calls)
-        result = await self.db_session.execute(
-            select(Interaction).where(Interaction.source_service_id == uuid.UUID(changed_service_id))
-        )
-        interactions = result.scalars().all()
+        interactions = outgoing_interactions
         
         logger.info(f"Found {len(interactions)} outgoing connections for {changed_service.name}")
         
@@ -836,7 +856,7 @@ IMPORTANT:
             # Only include if impact analysis says this service will be harmed
             if impact_analysis.get(target_id, True):  # Default to True if not in analysis
                 blast_radius_nodes.add(target_id)
-                blast_radius_edges.append({
+                blast_radius_edges.setdefault((changed_service_id, target_id), {
                     "source": changed_service_id,
                     "target": target_id,
                     "type": interaction.edge_type.value,
@@ -853,11 +873,48 @@ IMPORTANT:
                     if interaction.kafka_topic:
                         blast_radius_details[target_id]["topic"] = interaction.kafka_topic
     
+    async def _count_connections(
+        self, service_uuids: List[uuid.UUID]
+    ) -> Tuple[Dict[uuid.UUID, int], Dict[uuid.UUID, int]]:
+        """Count incoming and outgoing interactions per service, keyed by service UUID"""
+        if not service_uuids:
+            return {}, {}
+        incoming_stmt = (
+            select(Interaction.target_service_id, func.count())
+            .where(Interaction.target_service_id.in_(service_uuids))
+            .group_by(Interaction.target_service_id)
+        )
+        outgoing_stmt = (
+            select(Interaction.source_service_id, func.count())
+            .where(Interaction.source_service_id.in_(service_uuids))
+            .group_by(Interaction.source_service_id)
+        )
+        if self.session_factory is not None:
+            incoming_rows, outgoing_rows = await asyncio.gather(
+                self._fetch_rows(incoming_stmt),
+                self._fetch_rows_on_new_session(outgoing_stmt),
+            )
+        else:
+            incoming_rows = await self._fetch_rows(incoming_stmt)
+            outgoing_rows = await self._fetch_rows(outgoing_stmt)
+        return dict(incoming_rows), dict(outgoing_rows)
+    
+    async def _fetch_rows(self, stmt: Select) -> List[Row]:
+        """Run a read-only select on db_session"""
+        result = await self.db_session.execute(stmt)
+        return result.all()
+    
+    async def _fetch_rows_on_new_session(self, stmt: Select) -> List[Row]:
+        """Run a read-only select on a short-lived session from session_factory"""
+        async with self.session_factory() as session:
+            result = await session.execute(stmt)
+            return result.all()
+    
     async def _find_incoming_connections_from_db(
         self,
         changed_service: Service,
         blast_radius_nodes: Set[str],
-        blast_radius_edges: List[Dict],
+        blast_radius_edges: Dict[Tuple[str, str], Dict],
         blast_radius_details: Dict[str, Dict],
     ):
         """Find services that call the changed service (incoming connections) from database"""
@@ -865,16 +922,16 @@ IMPORTANT:
         
         # Find services that depend on the changed service (callers)
         result = await self.db_session.execute(
-            select(Interaction).where(Interaction.target_service_id == uuid.UUID(changed_service_id))
+            select(*EDGE_COLUMNS).where(Interaction.target_service_id == uuid.UUID(changed_service_id))
         )
-        interactions = result.scalars().all()
+        interactions = result.all()
         
         logger.info(f"Found {len(interactions)} incoming connections for {changed_service.name}")
         
         for interaction in interactions:
             caller_id = str(interaction.source_service_id)
             blast_radius_nodes.add(caller_id)
-            blast_radius_edges.append({
+            blast_radius_edges.setdefault((caller_id, changed_service_id), {
                 "source": caller_id,
                 "target": changed_service_id,
                 "type": interaction.edge_type.value,
@@ -891,24 +948,32 @@ IMPORTANT:
         self,
         changed_service: Service,
         blast_radius_nodes: Set[str],
-        blast_radius_edges: List[Dict],
+        blast_radius_edges: Dict[Tuple[str, str], Dict],
         blast_radius_details: Dict[str, Dict],
+        interactions: Optional[List[Row]] = None,
     ):
-        """Find services that the changed service calls (outgoing connections) from database"""
+        """Find services that the changed service calls (outgoing connections) from database
+        
+        interactions, when given, are prefetched edges to pick this service's outgoing ones from.
+        """
         changed_service_id = str(changed_service.id)
+        changed_service_uuid = uuid.UUID(changed_service_id)
         
         # Find services that the changed service depends on (targets)
-        result = await self.db_session.execute(
-            select(Interaction).where(Interaction.source_service_id == uuid.UUID(changed_service_id))
-        )
-        interactions = result.scalars().all()
+        if interactions is not None:
+            interactions = [i for i in interactions if i.source_service_id == changed_service_uuid]
+        else:
+            result = await self.db_session.execute(
+                select(*EDGE_COLUMNS).where(Interaction.source_service_id == changed_service_uuid)
+            )
+            interactions = result.all()
         
         logger.info(f"Found {len(interactions)} outgoing connections for {changed_service.name}")
         
         for interaction in interactions:
             target_id = str(interaction.target_service_id)
             blast_radius_nodes.add(target_id)
-            blast_radius_edges.append({
+            blast_radius_edges.setdefault((changed_service_id, target_id), {
                 "source": changed_service_id,
                 "target": target_id,
                 "type": interaction.edge_type.value,
@@ -938,6 +1003,17 @@ IMPORTANT:
         if not url:
             return None
         
+        # A URL already recorded on an edge identifies its target directly
+        result = await self.db_session.execute(
+            select(Service)
+            .join(Interaction, Interaction.target_service_id == Service.id)
+            .where(Interaction.http_url_lower == url.lower())
+            .limit(1)
+        )
+        service = result.scalar_one_or_none()
+        if service:
+            return service
+        
         # Extract service name from URL patterns
         # Patterns: http://user-service/..., {USER_SERVICE_URL}/..., /users/...
         service_name_patterns = [
@@ -974,14 +1050,14 @@ IMPORTANT:
         """Find services that consume a Kafka topic"""
         from app.db.models import EdgeType
         result = await self.db_session.execute(
-            select(Interaction).where(
+            select(Interaction.target_service_id).where(
                 and_(
                     Interaction.kafka_topic == topic,
                     Interaction.edge_type == EdgeType.KAFKA
                 )
             )
         )
-        interactions = result.scalars().all()
+        interactions = result.all()
         
         consumer_services = []
         seen_service_ids = set()
@@ -1002,14 +1078,14 @@ IMPORTANT:
         """Find services that produce to a Kafka topic"""
         from app.db.models import EdgeType
         result = await self.db_session.execute(
-            select(Interaction).where(
+            select(Interaction.source_service_id).where(
                 and_(
                     Interaction.kafka_topic == topic,
                     Interaction.edge_type == EdgeType.KAFKA
                 )
             )
         )
-        interactions = result.scalars().all()
+        interactions = result.all()
         
         producer_services = []
         seen_service_ids = set()
@@ -1076,7 +1152,7 @@ IMPORTANT:
                 crew = Crew(
                     agents=[self.agent],
                     tasks=[task],
-                    verbose=True,
+                    verbose=settings.debug,
                 )
                 return crew.kickoff()
             
@@ -1099,59 +1175,70 @@ IMPORTANT:
                 "changed_services": changed_services,
             }
     
+    async def _load_services(self) -> List[Service]:
+        """Load every service once and index it by lowercased name"""
+        if self._services is None:
+            result = await self.db_session.execute(select(Service))
+            self._services = list(result.scalars().all())
+            self._services_by_lower_name = {}
+            for service in self._services:
+                self._services_by_lower_name.setdefault(service.name.lower(), []).append(service)
+        return self._services
+    
+    async def _find_services_by_exact_names(self, service_names: List[str]) -> Dict[str, Service]:
+        """Resolve names matching a service exactly (ignoring case) in one query, preferring the exact spelling"""
+        if not service_names:
+            return {}
+        if self._services is not None:
+            services_by_lower_name = self._services_by_lower_name
+        else:
+            # lower(name) IN (...) is served by the ix_services_name_lower expression index
+            result = await self.db_session.execute(
+                select(Service).where(func.lower(Service.name).in_({name.lower() for name in service_names}))
+            )
+            services_by_lower_name = {}
+            for service in result.scalars().all():
+                services_by_lower_name.setdefault(service.name.lower(), []).append(service)
+        
+        matches = {}
+        for service_name in service_names:
+            candidates = services_by_lower_name.get(service_name.lower(), [])
+            exact = next((s for s in candidates if s.name == service_name), None)
+            if exact or candidates:
+                matches[service_name] = exact or candidates[0]
+        return matches
+    
     async def _find_service_by_name(self, service_name: str) -> Optional[Service]:
-        """Find service in database by name"""
+        """Find service by name using the in-memory service index"""
         logger.info(f"Searching for service: '{service_name}'")
-        
-        # Try exact match first
-        result = await self.db_session.execute(
-            select(Service).where(Service.name == service_name)
-        )
-        service = result.scalar_one_or_none()
-        
-        if service:
-            logger.info(f"Found exact match: {service.name} (ID: {service.id})")
-            return service
-        
-        # Try case-insensitive exact match
-        result = await self.db_session.execute(
-            select(Service).where(Service.name.ilike(service_name))
-        )
-        service = result.scalar_one_or_none()
-        
-        if service:
+        services = await self._load_services()
+        service_name_lower = service_name.lower()
+        
+        # Case-insensitive match, preferring the exact spelling
+        candidates = self._services_by_lower_name.get(service_name_lower, [])
+        for service in candidates:
+            if service.name == service_name:
+                logger.info(f"Found exact match: {service.name} (ID: {service.id})")
+                return service
+        if candidates:
+            service = candidates[0]
             logger.info(f"Found case-insensitive match: {service.name} (ID: {service.id})")
             return service
         
-        # Try partial match
-        result = await self.db_session.execute(
-            select(Service).where(Service.name.ilike(f"%{service_name}%"))
-        )
-        services = result.scalars().all()
-        
-        if services:
-            # Prefer services that end with the service name
-            for s in services:
-                if s.name.lower().endswith(service_name.lower()):
-                    logger.info(f"Found partial match (ends with): {s.name} (ID: {s.id})")
-                    return s
-            logger.info(f"Found partial match: {services[0].name} (ID: {services[0].id})")
-            return services[0]
+        # Try partial match, in the error agent's order: names ending with the fragment first,
+        # then the shortest name, then alphabetical, so the pick doesn't depend on load order
+        partial_matches = [s for s in services if service_name_lower in s.name.lower()]
+        if partial_matches:
+            service = min(
+                partial_matches,
+                key=lambda s: (not s.name.lower().endswith(service_name_lower), len(s.name), s.name),
+            )
+            logger.info(f"Found partial match: {service.name} (ID: {service.id})")
+            return service
         
         logger.warning(f"Service '{service_name}' not found in database")
         return None
     
-    async def _get_service_by_id(self, service_id: str) -> Optional[Service]:
-        """Get service by ID"""
-        try:
-            result = await self.db_session.execute(
-                select(Service).where(Service.id == uuid.UUID(service_id))
-            )
-            return result.scalar_one_or_none()
-        except Exception as e:
-            logger.error(f"Error getting service by ID: {e}")
-            return None
-    
     def _extract_changed_services_from_analysis(self, analysis_text: str, change_description: str) -> List[str]:
         """Extract changed service names from CrewAI analysis - prioritize services explicitly mentioned as being changed"""
         services = set()
@@ -1198,6 +1285,7 @@ IMPORTANT:
                 r'services? being changed[:\s]+(?:is\s+)?(?:the\s+)?["\']?([a-z-]+(?:-service)?)["\']?',
                 r'changed services?[:\s]+(?:is\s+)?(?:the\s+)?["\']?([a-z-]+(?:-service)?)["\']?',
             ]
+            change_description_lower = change_description.lower()
             for pattern in general_patterns:
                 matches = re.findall(pattern, analysis_text, re.IGNORECASE)
                 for match in matches:
@@ -1205,8 +1293,9 @@ IMPORTANT:
                         match = match[0] if match[0] else match[-1]
                     if match and match not in ['the', 'is', 'are', 'being', 'changed', 'service']:
                         # Only add if it's also mentioned in the change description
-                        if any(keyword in change_description.lower() for keyword in [match.lower(), f"update {match.lower()}", f"change {match.lower()}", f"modify {match.lower()}"]):
-                            services.add(match.lower())
+                        match_lower = match.lower()
+                        if match_lower in change_description_lower:
+                            services.add(match_lower)
         
         logger.info(f"Extracted services from analysis (filtered): {services}")
         
@@ -1,63 +1,130 @@
 """GitHub OAuth implementation"""
+import asyncio
 import httpx
 from typing import Optional
 from app.config import settings
 
+# One client for the app's lifetime so GitHub calls reuse pooled
+# keep-alive connections instead of a new TCP+TLS handshake each time.
+_client: Optional[httpx.AsyncClient] = None
+
+
+async def get_client() -> httpx.AsyncClient:
+    """Return the shared GitHub HTTP client, creating it on first use"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=10.0,
+            limits=httpx.Limits(max_keepalive_connections=50, max_connections=100),
+        )
+    return _client
+
+
+async def close_client() -> None:
+    """Close the shared GitHub HTTP client"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
 
 async def get_github_access_token(code: str) -> Optional[str]:
     """Exchange GitHub OAuth code for access token"""
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            "https://github.com/login/oauth/access_token",
-            data={
-                "client_id": settings.github_client_id,
-                "client_secret": settings.github_client_secret,
-                "code": code,
-            },
-            headers={"Accept": "application/json"},
-        )
-        if response.status_code == 200:
-            data = response.json()
-            return data.get("access_token")
+    client = await get_client()
+    response = await client.post(
+        "https://github.com/login/oauth/access_token",
+        data={
+            "client_id": settings.github_client_id,
+            "client_secret": settings.github_client_secret,
+            "code": code,
+        },
+        headers={"Accept": "application/json"},
+    )
+    if response.status_code == 200:
+        data = response.json()
+        return data.get("access_token")
     return None
 
 
 async def get_github_user(access_token: str) -> Optional[dict]:
     """Get GitHub user information"""
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            "https://api.github.com/user",
-            headers={
-                "Authorization": f"token {access_token}",
-                "Accept": "application/vnd.github.v3+json",
-            },
-        )
-        if response.status_code == 200:
-            return response.json()
+    client = await get_client()
+    response = await client.get(
+        "https://api.github.com/user",
+        headers={
+            "Authorization": f"token {access_token}",
+            "Accept": "application/vnd.github.v3+json",
+        },
+    )
+    if response.status_code == 200:
+        return response.json()
     return None
 
 
-async def get_github_user_repos(access_token: str, username: Optional[str] = None) -> list:
-    """Get GitHub repositories for a user"""
+async def _get_repos_page(
+    client: httpx.AsyncClient, url: str, headers: dict, params: dict, page: int
+) -> httpx.Response:
+    return await client.get(
+        url,
+        headers=headers,
+        params={"page": page, "per_page": 100, **params},
+    )
+
+
+def _last_page(response: httpx.Response) -> Optional[int]:
+    """Total page count from the Link rel="last" URL, if GitHub sent one"""
+    last_url = response.links.get("last", {}).get("url")
+    if not last_url:
+        return None
+    page = httpx.URL(last_url).params.get("page")
+    return int(page) if page and page.isdigit() else None
+
+
+async def get_github_user_repos(
+    access_token: str, username: Optional[str] = None, visibility: str = "public"
+) -> list:
+    """Get GitHub repositories for a user, filtered by visibility on GitHub's side"""
     url = f"https://api.github.com/user/repos" if not username else f"https://api.github.com/users/{username}/repos"
-    async with httpx.AsyncClient() as client:
-        repos = []
-        page = 1
-        while True:
-            response = await client.get(
-                url,
-                headers={
-                    "Authorization": f"token {access_token}",
-                    "Accept": "application/vnd.github.v3+json",
-                },
-                params={"page": page, "per_page": 100, "type": "all"},
-            )
+    # /user/repos rejects visibility combined with type; /users/{username}/repos only lists public repos
+    params = {"visibility": visibility} if not username else {"type": "all"}
+    headers = {
+        "Authorization": f"token {access_token}",
+        "Accept": "application/vnd.github.v3+json",
+    }
+    client = await get_client()
+    repos = []
+    response = await _get_repos_page(client, url, headers, params, 1)
+    if response.status_code != 200:
+        return repos
+    page_repos = response.json()
+    if not page_repos:
+        return repos
+    repos.extend(page_repos)
+
+    last_page = _last_page(response)
+    if last_page is not None:
+        # The Link header tells us how many pages there are, so fetch the
+        # rest concurrently and keep them in page order.
+        responses = await asyncio.gather(
+            *(_get_repos_page(client, url, headers, params, page) for page in range(2, last_page + 1))
+        )
+        for response in responses:
             if response.status_code != 200:
                 break
             page_repos = response.json()
             if not page_repos:
                 break
             repos.extend(page_repos)
-            page += 1
         return repos
 
+    page = 2
+    while True:
+        response = await _get_repos_page(client, url, headers, params, page)
+        if response.status_code != 200:
+            break
+        page_repos = response.json()
+        if not page_repos:
+            break
+        repos.extend(page_repos)
+        page += 1
+    return repos
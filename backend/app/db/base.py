@@ -3,11 +3,18 @@ from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sess
 from sqlalchemy.orm import declarative_base
 from app.config import settings
 
+# asyncpg prepares each distinct statement per connection; keep enough of them cached
+# that the agents' repeated lookups skip re-parsing and re-planning
+connect_args = {}
+if settings.postgres_url.startswith("postgresql+asyncpg"):
+    connect_args["prepared_statement_cache_size"] = settings.db_statement_cache_size
+
 # Create async engine
 engine = create_async_engine(
     settings.postgres_url,
     echo=settings.debug,
     future=True,
+    connect_args=connect_args,
 )
 
 # Create async session factory
@@ -0,0 +1,55 @@
+"""Invalidation hooks for in-process caches derived from the service graph"""
+from typing import Callable, List
+from sqlalchemy import event
+from sqlalchemy.orm import ORMExecuteState, Session
+from app.db.models import Interaction, Repository, Service
+
+# Tables whose rows feed the graph caches (service lookups, NLQ context snapshots)
+GRAPH_MODELS = (Service, Interaction, Repository)
+
+_graph_cache_clearers: List[Callable[[], None]] = []
+
+
+def on_graph_change(clear: Callable[[], None]) -> Callable[[], None]:
+    """Register a cache-clearing function to run after any commit that writes the graph tables
+
+    Returns the function unchanged, so it can be used as a decorator.
+    """
+    _graph_cache_clearers.append(clear)
+    return clear
+
+
+def invalidate_graph_caches() -> None:
+    """Clear every registered graph cache"""
+    for clear in _graph_cache_clearers:
+        clear()
+
+
+# AsyncSession runs on a sync Session underneath, so these listeners cover both. A session is
+# flagged when it writes a graph table, and the caches are cleared once that write commits.
+
+@event.listens_for(Session, "after_flush")
+def _flag_graph_flush(session: Session, flush_context) -> None:
+    if any(isinstance(obj, GRAPH_MODELS) for obj in (*session.new, *session.dirty, *session.deleted)):
+        session.info["graph_changed"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _flag_graph_statement(orm_execute_state: ORMExecuteState) -> None:
+    # Bulk insert/update/delete statements bypass the unit of work, so after_flush never sees them
+    if orm_execute_state.is_select:
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and issubclass(mapper.class_, GRAPH_MODELS):
+        orm_execute_state.session.info["graph_changed"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session) -> None:
+    if session.info.pop("graph_changed", False):
+        invalidate_graph_caches()
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_rolled_back_writes(session: Session, previous_transaction) -> None:
+    session.info.pop("graph_changed", None)
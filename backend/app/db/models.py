@@ -10,15 +10,68 @@ from sqlalchemy import (
     Enum,
     JSON,
     Index,
+    LargeBinary,
+    CheckConstraint,
+    Computed,
+    DDL,
+    event,
+    func,
+    text,
 )
+from sqlalchemy.types import TypeDecorator
 from sqlalchemy.orm import relationship
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import UUID, JSONB
+from pgvector.sqlalchemy import Vector
 from datetime import datetime
+import os
+import time
 import uuid
 import enum
 
 from app.db.base import Base
 
+# Dimensions of text-embedding-ada-002 vectors (see app.services.embeddings)
+EMBEDDING_DIMENSIONS = 1536
+
+# Number of hash partitions for the interactions table
+INTERACTION_PARTITIONS = 8
+
+
+def uuid7() -> uuid.UUID:
+    """Generate a time-ordered UUIDv7 for primary keys"""
+    # 48-bit millisecond timestamp first so new rows append to the right of the PK index
+    unix_ts_ms = time.time_ns() // 1_000_000
+    rand = int.from_bytes(os.urandom(10), "big")
+    rand_a = rand >> 68  # 12 bits
+    rand_b = rand & ((1 << 62) - 1)  # 62 bits
+    value = (
+        (unix_ts_ms & 0xFFFFFFFFFFFF) << 80
+        | 0x7 << 76  # version
+        | rand_a << 64
+        | 0b10 << 62  # variant
+        | rand_b
+    )
+    return uuid.UUID(int=value)
+
+
+class CommitSha(TypeDecorator):
+    """Git SHA-1 stored as 20 raw bytes, exposed to Python as a hex string"""
+    impl = LargeBinary(20)
+    cache_ok = True
+    
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, bytes):
+            return value
+        try:
+            raw = bytes.fromhex(value)
+        except ValueError:
+            # Placeholders such as "unknown" are not real commits
+            return None
+        return raw if len(raw) == 20 else None
+    
+    def process_result_value(self, value, dialect):
+        return value.hex() if value is not None else None
+
 
 class EdgeType(str, enum.Enum):
     """Edge type enumeration"""
@@ -56,7 +109,7 @@ class Repository(Base):
     """Repository model"""
     __tablename__ = "repositories"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     full_name = Column(String(255), unique=True, nullable=False, index=True)
     html_url = Column(String(512), nullable=False)
     default_branch = Column(String(100), default="main")
@@ -74,14 +127,14 @@ class Service(Base):
     """Service model"""
     __tablename__ = "services"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     name = Column(String(255), nullable=False, index=True)
     repo_id = Column(UUID(as_uuid=True), ForeignKey("repositories.id"), nullable=False)
     language = Column(String(50), nullable=True)
     path_hint = Column(String(512), nullable=True)
     description = Column(Text, nullable=True)
     homepage = Column(String(512), nullable=True)
-    last_commit_sha = Column(String(40), nullable=True)
+    last_commit_sha = Column(CommitSha, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     repo = relationship("Repository", back_populates="services")
@@ -96,13 +149,27 @@ class Service(Base):
         foreign_keys="Interaction.target_service_id",
         back_populates="target_service"
     )
+    
+    __table_args__ = (
+        CheckConstraint("length(last_commit_sha) = 20", name="ck_services_last_commit_sha_len"),
+        # Case-insensitive name equality and prefix LIKE, as used by the error analyzer's service lookup
+        Index(
+            "ix_services_name_lower", func.lower(name).label("name_lower"),
+            postgresql_ops={"name_lower": "text_pattern_ops"},
+        ),
+        # Trigram index so lower(name) LIKE '%name%' lookups avoid a sequential scan (requires pg_trgm)
+        Index(
+            "ix_services_name_trgm", func.lower(name).label("name_lower_trgm"),
+            postgresql_using="gin", postgresql_ops={"name_lower_trgm": "gin_trgm_ops"},
+        ),
+    )
 
 
 class Endpoint(Base):
     """Endpoint model"""
     __tablename__ = "endpoints"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     service_id = Column(UUID(as_uuid=True), ForeignKey("services.id"), nullable=False)
     kind = Column(Enum(EndpointKind), nullable=False)
     method = Column(String(10), nullable=True)  # GET, POST, etc. for HTTP
@@ -112,14 +179,13 @@ class Endpoint(Base):
     protocol = Column(String(50), nullable=True)
     code_ref_file = Column(String(512), nullable=True)
     code_ref_line = Column(Integer, nullable=True)
-    example_payload_json = Column(JSON, nullable=True)
+    example_payload_json = Column(JSON().with_variant(JSONB(), "postgresql"), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     service = relationship("Service", back_populates="endpoints")
     
     __table_args__ = (
         Index("idx_endpoint_service_kind", "service_id", "kind", "url_path"),
-        Index("idx_endpoint_topic", "topic"),
     )
 
 
@@ -127,16 +193,19 @@ class Interaction(Base):
     """Interaction (edge) model"""
     __tablename__ = "interactions"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    source_service_id = Column(UUID(as_uuid=True), ForeignKey("services.id"), nullable=False)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
+    # Partition key, so it has to be part of the primary key
+    source_service_id = Column(UUID(as_uuid=True), ForeignKey("services.id"), primary_key=True)
     target_service_id = Column(UUID(as_uuid=True), ForeignKey("services.id"), nullable=False)
     edge_type = Column(Enum(EdgeType), nullable=False)
     http_method = Column(String(10), nullable=True)
     http_url = Column(String(512), nullable=True)
+    # Normalised at write time so case-insensitive URL lookups can use a plain index
+    http_url_lower = Column(String(512), Computed("lower(http_url)", persisted=True))
     kafka_topic = Column(String(255), nullable=True)
     confidence = Column(Float, default=0.5)
     evidence = Column(Text, nullable=True)
-    source_repo_commit_sha = Column(String(40), nullable=True)
+    source_repo_commit_sha = Column(CommitSha, nullable=True)
     detected_at = Column(DateTime, default=datetime.utcnow)
     detector_name = Column(String(100), nullable=True)
     
@@ -144,10 +213,52 @@ class Interaction(Base):
     target_service = relationship("Service", foreign_keys=[target_service_id], back_populates="target_interactions")
     
     __table_args__ = (
-        Index("idx_interaction_source", "source_service_id"),
-        Index("idx_interaction_target", "target_service_id"),
-        Index("idx_interaction_edge_type", "edge_type", "kafka_topic"),
-        Index("idx_interaction_http", "http_method", "http_url"),
+        CheckConstraint(
+            "length(source_repo_commit_sha) = 20", name="ck_interactions_source_repo_commit_sha_len"
+        ),
+        # Compound indexes for both traversal directions, each covering the edge attributes the
+        # agents project (source, target, type, URL, topic) so either walk is an index-only scan
+        Index(
+            "idx_interaction_src_tgt", "source_service_id", "target_service_id",
+            postgresql_include=["edge_type", "kafka_topic", "http_url"],
+        ),
+        Index(
+            "idx_interaction_tgt_src", "target_service_id", "source_service_id",
+            postgresql_include=["edge_type", "kafka_topic", "http_url"],
+        ),
+        # Partial covering indexes: lookups by topic/URL are answered from the index
+        # alone (Enum(EdgeType) persists member names, hence 'KAFKA'/'HTTP')
+        Index(
+            "idx_interaction_kafka", "kafka_topic",
+            postgresql_include=["source_service_id", "target_service_id"],
+            postgresql_where=text("edge_type = 'KAFKA'"),
+        ),
+        Index(
+            "idx_interaction_http", "http_url",
+            postgresql_include=["source_service_id", "target_service_id", "http_method"],
+            postgresql_where=text("edge_type = 'HTTP'"),
+        ),
+        Index(
+            "ix_interaction_url_lower", "http_url_lower",
+            postgresql_ops={"http_url_lower": "text_pattern_ops"},
+        ),
+        Index(
+            "ix_interactions_http_url_trgm", "http_url",
+            postgresql_using="gin", postgresql_ops={"http_url": "gin_trgm_ops"},
+        ),
+        {"postgresql_partition_by": "HASH (source_service_id)"},
+    )
+
+
+# Postgres needs the hash partitions to exist before rows can be inserted
+for _remainder in range(INTERACTION_PARTITIONS):
+    event.listen(
+        Interaction.__table__,
+        "after_create",
+        DDL(
+            f"CREATE TABLE interactions_p{_remainder} PARTITION OF interactions "
+            f"FOR VALUES WITH (MODULUS {INTERACTION_PARTITIONS}, REMAINDER {_remainder})"
+        ).execute_if(dialect="postgresql"),
     )
 
 
@@ -155,7 +266,7 @@ class Scan(Base):
     """Scan model"""
     __tablename__ = "scans"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     user_id = Column(String(255), nullable=False, index=True)  # GitHub user ID
     status = Column(Enum(ScanStatus), default=ScanStatus.QUEUED)
     started_at = Column(DateTime, nullable=True)
@@ -170,22 +281,26 @@ class ScanTarget(Base):
     """Scan target model"""
     __tablename__ = "scan_targets"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     scan_id = Column(UUID(as_uuid=True), ForeignKey("scans.id"), nullable=False)
     repo_id = Column(UUID(as_uuid=True), ForeignKey("repositories.id"), nullable=False)
     branch = Column(String(100), default="main")
-    commit_sha = Column(String(40), nullable=True)
+    commit_sha = Column(CommitSha, nullable=True)
     subpath = Column(String(512), nullable=True)
     
     scan = relationship("Scan", back_populates="targets")
     repo = relationship("Repository", back_populates="scan_targets")
+    
+    __table_args__ = (
+        CheckConstraint("length(commit_sha) = 20", name="ck_scan_targets_commit_sha_len"),
+    )
 
 
 class LogPaste(Base):
     """Log paste model"""
     __tablename__ = "log_pastes"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     user_id = Column(String(255), nullable=False, index=True)
     content = Column(Text, nullable=False)
     parsed_at = Column(DateTime, nullable=True)
@@ -198,7 +313,7 @@ class Implication(Base):
     """Implication model"""
     __tablename__ = "implications"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     log_id = Column(UUID(as_uuid=True), ForeignKey("log_pastes.id"), nullable=False)
     service_id = Column(UUID(as_uuid=True), ForeignKey("services.id"), nullable=False)
     reason = Column(Text, nullable=True)
@@ -213,19 +328,29 @@ class DocChunk(Base):
     """Document chunk model for embeddings"""
     __tablename__ = "doc_chunks"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     repo_id = Column(UUID(as_uuid=True), ForeignKey("repositories.id"), nullable=True)
     service_id = Column(UUID(as_uuid=True), ForeignKey("services.id"), nullable=True)
     file_path = Column(String(512), nullable=False)
     content = Column(Text, nullable=False)
-    sha = Column(String(40), nullable=True)
+    sha = Column(CommitSha, nullable=True)
     chunk_index = Column(Integer, default=0)
-    embedding = Column(Text, nullable=True)  # JSON array or pgvector type
+    embedding = Column(
+        Text().with_variant(Vector(EMBEDDING_DIMENSIONS), "postgresql"), nullable=True
+    )  # pgvector on Postgres, JSON array text elsewhere
     created_at = Column(DateTime, default=datetime.utcnow)
     
     __table_args__ = (
+        CheckConstraint("length(sha) = 20", name="ck_doc_chunks_sha_len"),
         Index("idx_doc_chunk_repo", "repo_id"),
+        Index("ix_doc_chunks_sha", "sha"),
         Index("idx_doc_chunk_service", "service_id"),
+        Index(
+            "ix_doc_chunks_embedding", "embedding",
+            postgresql_using="ivfflat",
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+            postgresql_with={"lists": 100},
+        ),
     )
 
 
@@ -233,7 +358,7 @@ class ServiceGraph(Base):
     """Materialized view for graph statistics"""
     __tablename__ = "service_graph"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     service_id = Column(UUID(as_uuid=True), ForeignKey("services.id"), unique=True, nullable=False)
     in_degree = Column(Integer, default=0)
     out_degree = Column(Integer, default=0)
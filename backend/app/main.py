@@ -2,9 +2,12 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
+from sqlalchemy import text
 from app.config import settings
 from app.routes import auth, repos, scan, graph, chat, nlq, coverage
 from app.db.base import engine, Base
+from app.agents.llm import enable_llm_cache
+from app.auth.github_oauth import get_client as get_github_client, close_client as close_github_client
 import logging
 import sys
 
@@ -48,13 +51,29 @@ app.include_router(nlq.router, prefix="/nlq", tags=["nlq"])
 async def startup():
     """Initialize database on startup"""
     logger.info("Starting AppLens backend...")
+    try:
+        enable_llm_cache()
+    except Exception as e:
+        # A broken cache only costs repeat LLM calls, so it must not stop the app from booting
+        logger.warning(f"LLM cache disabled: {e}")
     try:
         # Create tables (in production, use Alembic migrations)
         async with engine.begin() as conn:
+            if conn.dialect.name == "postgresql":
+                # Trigram indexes need pg_trgm; doc chunk embeddings need pgvector
+                await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                await conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
             await conn.run_sync(Base.metadata.create_all)
         logger.info("Database initialized")
     except Exception as e:
         logger.warning(f"Database initialization skipped: {e}. Tables may already exist.")
+    await get_github_client()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Release the shared GitHub HTTP client"""
+    await close_github_client()
 
 
 @app.get("/health")
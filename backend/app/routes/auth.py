@@ -3,6 +3,7 @@ from fastapi import APIRouter, HTTPException, Request, Response
 from fastapi.responses import RedirectResponse
 from jose import jwt
 from datetime import datetime, timedelta
+from urllib.parse import urlencode
 from app.config import settings
 from app.auth.github_oauth import get_github_access_token, get_github_user
 
@@ -26,8 +27,7 @@ async def github_login():
         "state": state,
     }
     
-    params_str = "&".join([f"{k}={v}" for k, v in params.items()])
-    github_oauth_url = f"https://github.com/login/oauth/authorize?{params_str}"
+    github_oauth_url = f"https://github.com/login/oauth/authorize?{urlencode(params)}"
     
     return RedirectResponse(url=github_oauth_url)
 
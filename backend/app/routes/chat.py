@@ -1,5 +1,5 @@
 """Chat routes for AI agents"""
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
 from typing import Optional, Dict, Any
 import logging
@@ -7,7 +7,7 @@ from app.routes.auth import get_current_user
 from app.agents.error_agent import ErrorAgent
 from app.agents.whatif_agent import WhatIfAgent
 from app.agents.nlq_agent import NLQAgent
-from app.db.base import get_db
+from app.db.base import get_db, AsyncSessionLocal
 from app.services.mcp_client import MCPGitHubClient
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -40,24 +40,24 @@ class NLQRequest(BaseModel):
 async def error_analyzer(
     request_body: ErrorAnalyzerRequest,
     request: Request,
+    session: AsyncSession = Depends(get_db),
 ):
     """Analyze error logs and identify affected services"""
     try:
         user = get_current_user(request)
         access_token = user.get("access_token")
         
-        async for session in get_db():
-            # Create MCP client for GitHub scanning if needed
-            mcp_client = None
-            if access_token:
-                try:
-                    mcp_client = MCPGitHubClient(access_token)
-                except Exception as e:
-                    logger.warning(f"Could not create MCP client: {e}")
-            
-            agent = ErrorAgent(session, mcp_client=mcp_client)
-            result = await agent.analyze(request_body.log_text)
-            return result
+        # Create MCP client for GitHub scanning if needed
+        mcp_client = None
+        if access_token:
+            try:
+                mcp_client = MCPGitHubClient(access_token)
+            except Exception as e:
+                logger.warning(f"Could not create MCP client: {e}")
+        
+        agent = ErrorAgent(session, mcp_client=mcp_client, session_factory=AsyncSessionLocal)
+        result = await agent.analyze(request_body.log_text)
+        return result
     except Exception as e:
         logger.error(f"Error in error_analyzer endpoint: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error analyzing log: {str(e)}")
@@ -67,29 +67,29 @@ async def error_analyzer(
 async def what_if(
     request_body: WhatIfRequest,
     request: Request,
+    session: AsyncSession = Depends(get_db),
 ):
     """Simulate impact of code changes and predict blast radius"""
     try:
         user = get_current_user(request)
         access_token = user.get("access_token")
         
-        async for session in get_db():
-            mcp_client = None
-            if access_token:
-                try:
-                    mcp_client = MCPGitHubClient(access_token)
-                except Exception as e:
-                    logger.warning(f"Could not create MCP client: {e}")
-            
-            agent = WhatIfAgent(session, mcp_client=mcp_client)
-            result = await agent.simulate(
-                change_description=request_body.change_description,
-                repo=request_body.repo,
-                file_path=request_body.file_path,
-                diff=request_body.diff,
-                pr_url=request_body.pr_url,
-            )
-            return result
+        mcp_client = None
+        if access_token:
+            try:
+                mcp_client = MCPGitHubClient(access_token)
+            except Exception as e:
+                logger.warning(f"Could not create MCP client: {e}")
+        
+        agent = WhatIfAgent(session, mcp_client=mcp_client, session_factory=AsyncSessionLocal)
+        result = await agent.simulate(
+            change_description=request_body.change_description,
+            repo=request_body.repo,
+            file_path=request_body.file_path,
+            diff=request_body.diff,
+            pr_url=request_body.pr_url,
+        )
+        return result
     except Exception as e:
         logger.error(f"Error in what_if endpoint: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error analyzing change: {str(e)}")
@@ -99,27 +99,27 @@ async def what_if(
 async def nlq(
     request_body: NLQRequest,
     request: Request,
+    session: AsyncSession = Depends(get_db),
 ):
     """Answer questions about microservices using CrewAI"""
     try:
         user = get_current_user(request)
         access_token = user.get("access_token")
         
-        async for session in get_db():
-            mcp_client = None
-            if access_token:
-                try:
-                    mcp_client = MCPGitHubClient(access_token)
-                except Exception as e:
-                    logger.warning(f"Could not create MCP client: {e}")
-            
-            agent = NLQAgent(session, mcp_client=mcp_client)
-            result = await agent.query(
-                request_body.question,
-                error_analysis_context=request_body.error_analysis_context,
-                what_if_context=request_body.what_if_context
-            )
-            return result
+        mcp_client = None
+        if access_token:
+            try:
+                mcp_client = MCPGitHubClient(access_token)
+            except Exception as e:
+                logger.warning(f"Could not create MCP client: {e}")
+        
+        agent = NLQAgent(session, mcp_client=mcp_client, session_factory=AsyncSessionLocal)
+        result = await agent.query(
+            request_body.question,
+            error_analysis_context=request_body.error_analysis_context,
+            what_if_context=request_body.what_if_context
+        )
+        return result
     except Exception as e:
         logger.error(f"Error in nlq endpoint: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error processing question: {str(e)}")
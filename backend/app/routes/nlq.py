@@ -1,9 +1,9 @@
 """Natural Language Query routes"""
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
 from app.routes.auth import get_current_user
 from app.agents.nlq_agent import NLQAgent
-from app.db.base import get_db
+from app.db.base import get_db, AsyncSessionLocal
 from sqlalchemy.ext.asyncio import AsyncSession
 
 router = APIRouter()
@@ -18,13 +18,12 @@ class NLQRequest(BaseModel):
 async def nlq_query(
     request_body: NLQRequest,
     request: Request,
+    session: AsyncSession = Depends(get_db),
 ):
     """Process natural language query"""
     user = get_current_user(request)
     
-    async for session in get_db():
-        agent = NLQAgent(session)
-        result = await agent.query(request_body.question)
-        return result
-        break
+    agent = NLQAgent(session, session_factory=AsyncSessionLocal)
+    result = await agent.query(request_body.question)
+    return result
 
@@ -1,15 +1,57 @@
 """Repository routes"""
-from fastapi import APIRouter, HTTPException, Request
-from typing import List, Optional
+import asyncio
+import hashlib
+import time
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, Query
+from typing import Dict, List, Optional, Tuple
 from app.routes.auth import get_current_user
 from app.auth.github_oauth import get_github_user_repos
 from app.db.base import get_db
 from app.db.models import Repository
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, func
 
 router = APIRouter()
 
+# A user's GitHub repo list, keyed on (user id, token hash), so repeat searches skip the paginated fetch
+GITHUB_REPOS_TTL_SECONDS = 60.0
+GITHUB_REPOS_CACHE_SIZE = 1000
+_github_repos_cache: Dict[Tuple[str, str], Tuple[float, list]] = {}
+# One lock per cache key, so concurrent misses for the same user share a single fetch
+_github_repos_locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+# Filtered search results per (user id, token hash, query) on top of the repo list
+_repo_search_cache: Dict[Tuple[str, str, str], Tuple[float, List[str]]] = {}
+
+
+def clear_github_repos_cache() -> None:
+    """Forget cached GitHub repo lists and search results, and the locks of idle keys"""
+    _github_repos_cache.clear()
+    _repo_search_cache.clear()
+    # A held lock has a fetch in flight; dropping it would let the next miss start a second one
+    for key in [key for key, lock in _github_repos_locks.items() if not lock.locked()]:
+        del _github_repos_locks[key]
+
+
+async def _get_cached_user_repos(cache_key: Tuple[str, str], access_token: str) -> list:
+    """The user's GitHub repos, fetched at most once per TTL"""
+    cached = _github_repos_cache.get(cache_key)
+    if cached and time.monotonic() - cached[0] < GITHUB_REPOS_TTL_SECONDS:
+        return cached[1]
+    
+    async with _github_repos_locks.setdefault(cache_key, asyncio.Lock()):
+        # Another request may have filled the cache while we waited
+        cached = _github_repos_cache.get(cache_key)
+        if cached and time.monotonic() - cached[0] < GITHUB_REPOS_TTL_SECONDS:
+            return cached[1]
+        
+        repos = await get_github_user_repos(access_token)
+        # An empty list may be a failed fetch, so don't pin it for the whole TTL
+        if repos:
+            if len(_github_repos_cache) >= GITHUB_REPOS_CACHE_SIZE:
+                clear_github_repos_cache()
+            _github_repos_cache[cache_key] = (time.monotonic(), repos)
+        return repos
+
 
 @router.get("/search")
 async def search_repos(q: Optional[str] = None, request: Request = None):
@@ -20,8 +62,14 @@ async def search_repos(q: Optional[str] = None, request: Request = None):
     if not access_token:
         raise HTTPException(status_code=401, detail="No access token")
     
-    # Get user's repositories
-    repos = await get_github_user_repos(access_token)
+    cache_key = (str(user.get("sub")), hashlib.sha256(access_token.encode()).hexdigest()[:16])
+    search_key = (*cache_key, (q or "").lower())
+    cached = _repo_search_cache.get(search_key)
+    if cached and time.monotonic() - cached[0] < GITHUB_REPOS_TTL_SECONDS:
+        return {"repos": cached[1]}
+    
+    # Get user's public repositories
+    repos = await _get_cached_user_repos(cache_key, access_token)
     
     # Filter by query if provided
     if q:
@@ -31,30 +79,54 @@ async def search_repos(q: Optional[str] = None, request: Request = None):
             if q_lower in r["full_name"].lower() or q_lower in (r.get("description") or "").lower()
         ]
     
-    # Return simplified repo info
-    return {
-        "repos": [
-            r["full_name"]
-            for r in repos
-            if not r.get("private", False)  # Only public repos
-        ]
-    }
+    # Return simplified repo info (GitHub already filtered to public repos)
+    names = [r["full_name"] for r in repos]
+    listed = _github_repos_cache.get(cache_key)
+    if listed:
+        if len(_repo_search_cache) >= GITHUB_REPOS_CACHE_SIZE:
+            _repo_search_cache.clear()
+        # Share the repo list's timestamp, so a search never outlives the list it came from
+        _repo_search_cache[search_key] = (listed[0], names)
+    return {"repos": names}
 
 
 @router.get("/")
-async def list_repos(request: Request):
-    """List all repositories in database"""
-    from app.db.base import get_db
-    async for session in get_db():
-        result = await session.execute(select(Repository))
-        repos = result.scalars().all()
-        return [
-            {
-                "id": str(r.id),
-                "full_name": r.full_name,
-                "html_url": r.html_url,
-                "last_scanned_at": r.last_scanned_at.isoformat() if r.last_scanned_at else None,
-            }
-            for r in repos
-        ]
-
+async def list_repos(
+    request: Request,
+    response: Response,
+    session: AsyncSession = Depends(get_db),
+    q: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    include_total: bool = False,
+):
+    """List repositories in database, one page at a time"""
+    stmt = select(
+        Repository.id,
+        Repository.full_name,
+        Repository.html_url,
+        Repository.last_scanned_at,
+    )
+    if q:
+        stmt = stmt.where(Repository.full_name.ilike(f"%{q}%"))
+    
+    if include_total:
+        # Total matching rows goes in a header so the body stays a plain list
+        total = await session.scalar(select(func.count()).select_from(stmt.subquery()))
+        response.headers["X-Total-Count"] = str(total)
+    
+    result = await session.stream(
+        stmt.order_by(Repository.full_name)
+        .limit(limit)
+        .offset(offset)
+        .execution_options(stream_results=True)
+    )
+    return [
+        {
+            "id": str(r.id),
+            "full_name": r.full_name,
+            "html_url": r.html_url,
+            "last_scanned_at": r.last_scanned_at.isoformat() if r.last_scanned_at else None,
+        }
+        async for r in result
+    ]
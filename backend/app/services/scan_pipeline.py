@@ -261,6 +261,7 @@ class ScanPipeline:
                 )
                 self.db_session.add(interaction)
         
+        # Committing graph rows clears the agents' graph caches (see app.db.invalidation)
         await self.db_session.commit()
     
     def _detect_language(self, file_path: str) -> str:
@@ -2,14 +2,17 @@
 import pytest
 import pytest_asyncio
 from unittest.mock import Mock, AsyncMock, patch, MagicMock
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy import delete, select
+import time
 import uuid
 
-from app.agents.error_agent import ErrorAgent
+from app.agents.error_agent import ErrorAgent, _service_lookup_cache, clear_service_lookup_cache
 from app.agents.whatif_agent import WhatIfAgent
-from app.agents.nlq_agent import NLQAgent
+from app.agents.nlq_agent import CONTEXT_ROW_LIMIT, NLQAgent, _focus_context, clear_context_cache
 from app.agents.graph_agent import GraphAgent
+from app.db.base import Base
+from app.db.invalidation import invalidate_graph_caches
 from app.db.models import Service, Interaction, EdgeType, Repository
 
 
@@ -30,16 +33,17 @@ class TestErrorAgent:
     @pytest.fixture
     def error_agent(self, mock_db_session, mock_mcp_client):
         """Create ErrorAgent instance with mocked dependencies"""
-        with patch('app.agents.error_agent.ChatOpenAI') as mock_llm:
+        with patch('app.agents.error_agent.get_llm') as mock_llm:
             mock_llm_instance = Mock()
             mock_llm.return_value = mock_llm_instance
             
+            clear_service_lookup_cache()
             agent = ErrorAgent(mock_db_session, mock_mcp_client)
             return agent
     
     def test_init(self, mock_db_session, mock_mcp_client):
         """Test ErrorAgent initialization"""
-        with patch('app.agents.error_agent.ChatOpenAI') as mock_llm:
+        with patch('app.agents.error_agent.get_llm') as mock_llm:
             mock_llm_instance = Mock()
             mock_llm.return_value = mock_llm_instance
             
@@ -85,6 +89,25 @@ class TestErrorAgent:
             result = error_agent._extract_service_names(log_text)
             assert all(name in result for name in expected)
     
+    def test_extract_service_names_overlapping_patterns(self, mock_db_session, mock_mcp_client):
+        """Test that overlapping service name patterns each still find their names"""
+        with patch('app.agents.error_agent.get_llm'), patch('app.agents.error_agent.Agent'):
+            agent = ErrorAgent(mock_db_session, mock_mcp_client)
+        
+        test_cases = [
+            ("ERROR user_service failed", ["user_service"]),
+            ("service: checkout-api is down", ["checkout-api"]),
+            ("service: payments rejected the call", ["payments"]),
+            ("user-service: payments unavailable", ["user-service", "payments"]),
+            (
+                "ERROR order-service timed out calling cart_service\nuser-service down",
+                ["order-service", "cart_service", "user-service"],
+            ),
+        ]
+        
+        for log_text, expected in test_cases:
+            assert agent._extract_service_names(log_text) == expected
+    
     @pytest.mark.asyncio
     async def test_extract_urls(self, error_agent):
         """Test URL extraction from log text"""
@@ -169,13 +192,64 @@ class TestErrorAgent:
         mock_service.name = "user-service"
         
         mock_result = AsyncMock()
-        mock_result.scalar_one_or_none.return_value = mock_service
+        mock_result.first.return_value = mock_service
         mock_db_session.execute.return_value = mock_result
         
         with patch('app.agents.error_agent.logger'):
             result = await error_agent._find_service_by_name("user-service")
             assert result == mock_service
     
+    @pytest.mark.asyncio
+    async def test_find_service_by_name_cached(self, error_agent, mock_db_session):
+        """Test repeated lookups are served from the cache"""
+        mock_service = Mock()
+        mock_service.id = uuid.uuid4()
+        mock_service.name = "user-service"
+        
+        mock_result = AsyncMock()
+        mock_result.first.return_value = mock_service
+        mock_db_session.execute.return_value = mock_result
+        
+        with patch('app.agents.error_agent.logger'):
+            first = await error_agent._find_service_by_name("user-service")
+            second = await error_agent._find_service_by_name("user-service")
+            assert first == second == mock_service
+            assert mock_db_session.execute.call_count == 1
+    
+    @pytest.mark.asyncio
+    async def test_service_lookup_cache_cleared_on_graph_commit(self):
+        """Test that any commit writing services clears cached lookups, including bulk deletes"""
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_maker = async_sessionmaker(engine, expire_on_commit=False)
+        
+        async with session_maker() as session:
+            repo = Repository(full_name="org/shop", html_url="https://github.com/org/shop", owner="org")
+            session.add(repo)
+            await session.commit()
+            
+            _service_lookup_cache["user-service"] = (0.0, Mock())
+            session.add(Service(name="user-service", repo_id=repo.id))
+            await session.commit()
+            assert "user-service" not in _service_lookup_cache
+            
+            _service_lookup_cache["user-service"] = (0.0, Mock())
+            await session.execute(delete(Service).where(Service.name == "user-service"))
+            await session.commit()
+            assert "user-service" not in _service_lookup_cache
+            
+            # Writes that roll back leave the cache alone
+            _service_lookup_cache["user-service"] = (0.0, Mock())
+            session.add(Service(name="cart-service", repo_id=repo.id))
+            await session.flush()
+            await session.rollback()
+            await session.commit()
+            assert "user-service" in _service_lookup_cache
+        
+        clear_service_lookup_cache()
+        await engine.dispose()
+    
     @pytest.mark.asyncio
     async def test_find_service_by_name_case_insensitive(self, error_agent, mock_db_session):
         """Test finding service with case-insensitive match"""
@@ -183,12 +257,10 @@ class TestErrorAgent:
         mock_service.id = uuid.uuid4()
         mock_service.name = "User-Service"
         
-        # First call returns None (exact match failed)
-        # Second call returns service (case-insensitive match)
-        mock_results = [AsyncMock(), AsyncMock()]
-        mock_results[0].scalar_one_or_none.return_value = None
-        mock_results[1].scalar_one_or_none.return_value = mock_service
-        mock_db_session.execute.side_effect = mock_results
+        # A single case-insensitive query covers the exact match too
+        mock_result = AsyncMock()
+        mock_result.first.return_value = mock_service
+        mock_db_session.execute.return_value = mock_result
         
         with patch('app.agents.error_agent.logger'):
             result = await error_agent._find_service_by_name("user-service")
@@ -201,12 +273,11 @@ class TestErrorAgent:
         mock_service.id = uuid.uuid4()
         mock_service.name = "applens-user-service"
         
-        # First two calls return None
-        # Third call returns partial match
-        mock_results = [AsyncMock(), AsyncMock(), AsyncMock()]
-        mock_results[0].scalar_one_or_none.return_value = None
-        mock_results[1].scalar_one_or_none.return_value = None
-        mock_results[2].scalars.return_value.all.return_value = [mock_service]
+        # First call returns None (no case-insensitive match)
+        # Second call returns partial match
+        mock_results = [AsyncMock(), AsyncMock()]
+        mock_results[0].first.return_value = None
+        mock_results[1].all.return_value = [mock_service]
         mock_db_session.execute.side_effect = mock_results
         
         with patch('app.agents.error_agent.logger'):
@@ -216,7 +287,8 @@ class TestErrorAgent:
     @pytest.mark.asyncio
     async def test_find_service_by_name_not_found(self, error_agent, mock_db_session):
         """Test service not found"""
-        mock_db_session.execute.return_value.scalars.return_value.all.return_value = []
+        mock_db_session.execute.return_value.first.return_value = None
+        mock_db_session.execute.return_value.all.return_value = []
         
         with patch('app.agents.error_agent.logger'):
             result = await error_agent._find_service_by_name("nonexistent-service")
@@ -234,14 +306,14 @@ class TestErrorAgent:
         mock_interaction.http_url = "/api/test"
         mock_interaction.kafka_topic = None
         
-        mock_result = AsyncMock()
-        mock_result.scalars.return_value.all.return_value = [mock_interaction]
-        mock_db_session.execute.return_value = mock_result
+        mock_result = MagicMock()
+        mock_result.__aiter__.return_value = [mock_interaction]
+        mock_db_session.stream.return_value = mock_result
         
         connections = await error_agent._find_connections_from_db(source_service_id)
         
         assert len(connections) == 1
-        assert connections[0]["target_service_id"] == source_service_id
+        assert connections[0]["target_service_id"] == uuid.UUID(source_service_id)
         assert connections[0]["type"] == "HTTP"
         assert connections[0]["url"] == "/api/test"
     
@@ -286,6 +358,28 @@ class TestErrorAgent:
                         assert "reasoning" in result
                         assert result["source_node"] == str(mock_service.id)
     
+    @pytest.mark.asyncio
+    async def test_analyze_cached_service_skips_listing(self, mock_db_session, mock_mcp_client):
+        """Test that a cached service lookup doesn't start the concurrent service listing"""
+        with patch('app.agents.error_agent.get_llm'), patch('app.agents.error_agent.Agent'):
+            error_agent = ErrorAgent(mock_db_session, mock_mcp_client, session_factory=Mock())
+        mock_analysis = {"analysis": "Error occurred in user-service", "source_service": "user-service"}
+        mock_service = Mock()
+        mock_service.id = uuid.uuid4()
+        mock_service.name = "user-service"
+        _service_lookup_cache["user-service"] = (time.monotonic(), mock_service)
+        
+        with patch.object(error_agent, '_analyze_error_with_crewai', return_value=mock_analysis):
+            with patch.object(error_agent, '_fetch_service_names') as mock_listing:
+                with patch.object(error_agent, '_find_connections_from_db', return_value=[]):
+                    with patch.object(error_agent, '_find_domino_effects', return_value=[]):
+                        result = await error_agent.analyze("Error in user-service")
+                        
+                        assert result["source_node"] == str(mock_service.id)
+                        mock_listing.assert_not_called()
+        
+        clear_service_lookup_cache()
+    
     @pytest.mark.asyncio
     async def test_analyze_error_log_no_service_identified(self, error_agent):
         """Test error analysis when no service can be identified"""
@@ -327,7 +421,7 @@ class TestWhatIfAgent:
     
     @pytest.fixture
     def whatif_agent(self, mock_db_session):
-        with patch('app.agents.whatif_agent.ChatOpenAI') as mock_llm:
+        with patch('app.agents.whatif_agent.get_llm') as mock_llm:
             mock_llm_instance = Mock()
             mock_llm.return_value = mock_llm_instance
             
@@ -340,7 +434,7 @@ class TestWhatIfAgent:
     
     def test_init(self, mock_db_session):
         """Test WhatIfAgent initialization"""
-        with patch('app.agents.whatif_agent.ChatOpenAI') as mock_llm:
+        with patch('app.agents.whatif_agent.get_llm') as mock_llm:
             mock_llm_instance = Mock()
             mock_llm.return_value = mock_llm_instance
             
@@ -371,6 +465,24 @@ class TestWhatIfAgent:
             
             assert "changed_service_ids" in result
             assert "reasoning" in result
+    
+    @pytest.mark.asyncio
+    async def test_find_service_by_name_partial_match_order(self, mock_db_session):
+        """Test that partial matches are picked by suffix, then length, then name, whatever the load order"""
+        with patch('app.agents.whatif_agent.get_llm'), patch('app.agents.whatif_agent.Agent'):
+            agent = WhatIfAgent(mock_db_session)
+        
+        names = ["payment-service-admin", "new-payment-service", "old-payment-service", "payment-service-v2"]
+        for order in (names, names[::-1]):
+            agent._services = []
+            for name in order:
+                service = Mock(id=uuid.uuid4())
+                service.name = name
+                agent._services.append(service)
+            agent._services_by_lower_name = {}
+            
+            service = await agent._find_service_by_name("payment-service")
+            assert service.name == "new-payment-service"
 
 
 class TestNLQAgent:
@@ -382,7 +494,7 @@ class TestNLQAgent:
     
     @pytest.fixture
     def nlq_agent(self, mock_db_session):
-        with patch('app.agents.nlq_agent.ChatOpenAI') as mock_llm:
+        with patch('app.agents.nlq_agent.get_llm') as mock_llm:
             mock_llm_instance = Mock()
             mock_llm.return_value = mock_llm_instance
             
@@ -390,12 +502,13 @@ class TestNLQAgent:
                 mock_agent = Mock()
                 mock_agent_class.return_value = mock_agent
                 
+                clear_context_cache()
                 agent = NLQAgent(mock_db_session)
                 return agent
     
     def test_init(self, mock_db_session):
         """Test NLQAgent initialization"""
-        with patch('app.agents.nlq_agent.ChatOpenAI') as mock_llm:
+        with patch('app.agents.nlq_agent.get_llm') as mock_llm:
             mock_llm_instance = Mock()
             mock_llm.return_value = mock_llm_instance
             
@@ -438,6 +551,122 @@ class TestNLQAgent:
             
             assert "results" in result
             assert result["results"]["answer"] == "General system information"
+    
+    @pytest.mark.asyncio
+    async def test_gather_context_cached(self, nlq_agent):
+        """Test that repeated questions reuse the cached database context"""
+        context = {"services": [{"name": "user-service"}], "interactions": [], "repositories": []}
+        with patch.object(nlq_agent, '_load_context', return_value=(context, True)) as mock_load:
+            first = await nlq_agent._gather_context("Which services exist?")
+            first["error_analysis"] = {"primary_service_name": "user-service"}
+            second = await nlq_agent._gather_context("What calls user-service?")
+            
+            assert mock_load.call_count == 1
+            assert second["services"] == context["services"]
+            assert "error_analysis" not in second
+            
+            clear_context_cache()
+            await nlq_agent._gather_context("Which services exist?")
+            assert mock_load.call_count == 2
+            
+            # Commits that write the graph tables clear the snapshot too
+            invalidate_graph_caches()
+            await nlq_agent._gather_context("Which services exist?")
+            assert mock_load.call_count == 3
+    
+    def test_focus_context_on_mentioned_services(self):
+        """Test that focused rows replace the prompt's services and interactions"""
+        context = {
+            "services": [{"name": name} for name in ("order-service", "user-service", "cart-service")],
+            "interactions": [{"source": "cart-service", "target": "user-service"}],
+        }
+        focus = ([{"name": "order-service"}, {"name": "user-service"}], [{"source": "order-service", "target": "user-service"}])
+        
+        focused = _focus_context(context, focus)
+        assert [s["name"] for s in focused["services"]] == ["order-service", "user-service"]
+        assert focused["interactions"] == focus[1]
+        assert focused["focused"]
+        
+        assert _focus_context(context, None) is context
+    
+    @pytest.mark.asyncio
+    async def test_load_focus_from_complete_snapshot(self, nlq_agent, mock_db_session):
+        """Test that a snapshot holding the whole graph is narrowed without querying the database"""
+        context = {
+            "services": [{"name": name} for name in ("cart-service", "order-service", "user-service")],
+            "interactions": [
+                {"source": "order-service", "target": "user-service"},
+                {"source": "cart-service", "target": "user-service"},
+            ],
+            "services_total": 3,
+            "interactions_total": 2,
+        }
+        
+        services, interactions = await nlq_agent._load_focus("What does order-service call?", context)
+        assert [s["name"] for s in services] == ["order-service", "user-service"]
+        assert interactions == [{"source": "order-service", "target": "user-service"}]
+        assert await nlq_agent._load_focus("Which services exist?", context) is None
+        mock_db_session.execute.assert_not_called()
+        mock_db_session.stream.assert_not_called()
+    
+    @pytest.mark.asyncio
+    async def test_load_focus_outside_context_snapshot(self):
+        """Test that a named service past the capped context snapshot still brings in its edges"""
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_maker = async_sessionmaker(engine, expire_on_commit=False)
+        
+        async with session_maker() as session:
+            repo = Repository(full_name="org/shop", html_url="https://github.com/org/shop", owner="org")
+            session.add(repo)
+            await session.flush()
+            # Names sort so the queried services fall outside the first CONTEXT_ROW_LIMIT rows
+            fillers = [Service(name=f"a-service-{i:03}", repo_id=repo.id) for i in range(CONTEXT_ROW_LIMIT)]
+            zulu = Service(name="zulu-service", repo_id=repo.id)
+            yankee = Service(name="yankee-service", repo_id=repo.id)
+            session.add_all([*fillers, zulu, yankee])
+            await session.flush()
+            session.add(Interaction(
+                source_service_id=zulu.id, target_service_id=yankee.id,
+                edge_type=EdgeType.HTTP, http_method="GET", http_url="/orders",
+            ))
+            await session.commit()
+            
+            with patch('app.agents.nlq_agent.get_llm'), patch('app.agents.nlq_agent.Agent'):
+                agent = NLQAgent(session)
+            clear_context_cache()
+            context = await agent._gather_context("What does zulu-service call?")
+            assert "zulu-service" not in [s["name"] for s in context["services"]]
+            
+            services, interactions = await agent._load_focus("What does zulu-service call?", context)
+            assert [s["name"] for s in services] == ["yankee-service", "zulu-service"]
+            assert [(i["source"], i["target"]) for i in interactions] == [("zulu-service", "yankee-service")]
+            assert await agent._load_focus("Which services exist?", context) is None
+        
+        clear_context_cache()
+        await engine.dispose()
+    
+    @pytest.mark.asyncio
+    async def test_follow_up_answer_keeps_prose_mentioning_analysis(self, nlq_agent):
+        """Test that a follow-up answer is only cut at real section headers, not at prose about the analysis"""
+        context = {
+            "services": [], "interactions": [], "repositories": [],
+            "services_total": 0, "interactions_total": 0, "repositories_total": 0,
+            "error_analysis": {"primary_service_name": "review-service", "reasoning": "Timeouts"},
+        }
+        prose = (
+            "According to the previous error analysis, review-service was identified as the primary "
+            "service because its timeouts started the failures."
+        )
+        with patch('app.agents.nlq_agent.Task'), patch('app.agents.nlq_agent.Crew') as mock_crew:
+            mock_crew.return_value.kickoff.return_value = prose
+            answer = await nlq_agent._answer_with_crewai("Why review-service?", context)
+            assert " ".join(answer.split()) == prose
+            
+            mock_crew.return_value.kickoff.return_value = prose + "\n\nERROR ANALYSIS\nPRIMARY AFFECTED SERVICE: review-service"
+            answer = await nlq_agent._answer_with_crewai("Why review-service?", context)
+            assert " ".join(answer.split()) == prose
 
 
 class TestGraphAgent:
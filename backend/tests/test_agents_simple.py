@@ -19,7 +19,7 @@ class TestErrorAgent:
     
     @pytest.fixture
     def error_agent(self, mock_db_session):
-        with patch('app.agents.error_agent.ChatOpenAI') as mock_llm:
+        with patch('app.agents.error_agent.get_llm') as mock_llm:
             mock_llm_instance = Mock()
             mock_llm.return_value = mock_llm_instance
             
@@ -31,7 +31,7 @@ class TestErrorAgent:
                 return agent
     
     def test_init(self, mock_db_session):
-        with patch('app.agents.error_agent.ChatOpenAI') as mock_llm:
+        with patch('app.agents.error_agent.get_llm') as mock_llm:
             mock_llm_instance = Mock()
             mock_llm.return_value = mock_llm_instance
             
@@ -86,7 +86,7 @@ class TestNLQAgent:
     
     @pytest.fixture
     def nlq_agent(self, mock_db_session):
-        with patch('app.agents.nlq_agent.ChatOpenAI') as mock_llm:
+        with patch('app.agents.nlq_agent.get_llm') as mock_llm:
             mock_llm_instance = Mock()
             mock_llm.return_value = mock_llm_instance
             
@@ -98,7 +98,7 @@ class TestNLQAgent:
                 return agent
     
     def test_init(self, mock_db_session):
-        with patch('app.agents.nlq_agent.ChatOpenAI') as mock_llm:
+        with patch('app.agents.nlq_agent.get_llm') as mock_llm:
             mock_llm_instance = Mock()
             mock_llm.return_value = mock_llm_instance
             
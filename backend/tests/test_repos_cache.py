@@ -0,0 +1,98 @@
+"""Unit tests for the GitHub repo list cache behind /repos/search"""
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from app.routes import repos
+
+
+USER = {"sub": 1, "access_token": "token"}
+GITHUB_REPOS = [
+    {"full_name": "owner/api", "description": "Public API"},
+    {"full_name": "owner/web", "description": None},
+]
+
+
+@pytest.fixture(autouse=True)
+def github_repos():
+    """Patch the GitHub fetch with a counted fake and start every test with empty caches"""
+    calls = []
+    
+    async def fake_get_github_user_repos(access_token):
+        calls.append(access_token)
+        # Yield so concurrent searches overlap while the fetch is in flight
+        await asyncio.sleep(0.01)
+        return list(fake_get_github_user_repos.repos)
+    
+    fake_get_github_user_repos.repos = GITHUB_REPOS
+    repos.clear_github_repos_cache()
+    with patch.object(repos, "get_current_user", return_value=USER), \
+         patch.object(repos, "get_github_user_repos", fake_get_github_user_repos):
+        yield fake_get_github_user_repos, calls
+    repos.clear_github_repos_cache()
+
+
+@pytest.mark.asyncio
+async def test_search_reuses_cached_repo_list(github_repos):
+    """Test that searches within the TTL are answered without refetching from GitHub"""
+    _, calls = github_repos
+    
+    assert await repos.search_repos(q=None, request=None) == {"repos": ["owner/api", "owner/web"]}
+    assert await repos.search_repos(q="API", request=None) == {"repos": ["owner/api"]}
+    assert await repos.search_repos(q="api", request=None) == {"repos": ["owner/api"]}
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_search_refetches_after_ttl(github_repos):
+    """Test that the repo list and the searches built on it expire together"""
+    fake, calls = github_repos
+    
+    await repos.search_repos(q="owner", request=None)
+    fake.repos = GITHUB_REPOS + [{"full_name": "owner/worker", "description": ""}]
+    assert await repos.search_repos(q="owner", request=None) == {"repos": ["owner/api", "owner/web"]}
+    assert len(calls) == 1
+    
+    with patch.object(repos, "GITHUB_REPOS_TTL_SECONDS", 0.0):
+        result = await repos.search_repos(q="owner", request=None)
+    assert result == {"repos": ["owner/api", "owner/web", "owner/worker"]}
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_empty_repo_list_not_cached(github_repos):
+    """Test that an empty list, which may be a failed fetch, is fetched again on the next search"""
+    fake, calls = github_repos
+    fake.repos = []
+    
+    assert await repos.search_repos(q=None, request=None) == {"repos": []}
+    fake.repos = GITHUB_REPOS
+    assert await repos.search_repos(q=None, request=None) == {"repos": ["owner/api", "owner/web"]}
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_fetch(github_repos):
+    """Test that concurrent searches for the same user wait on a single GitHub fetch"""
+    _, calls = github_repos
+    
+    results = await asyncio.gather(*(repos.search_repos(q=q, request=None) for q in ("api", "web", None, "api")))
+    
+    assert [r["repos"] for r in results] == [["owner/api"], ["owner/web"], ["owner/api", "owner/web"], ["owner/api"]]
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_cache_eviction_keeps_in_flight_locks(github_repos):
+    """Test that evicting the cache doesn't drop the lock a pending fetch is holding"""
+    _, calls = github_repos
+    
+    first = asyncio.ensure_future(repos.search_repos(q=None, request=None))
+    await asyncio.sleep(0)
+    # As when another user's store finds the cache full while this fetch is in flight
+    repos.clear_github_repos_cache()
+    second = asyncio.ensure_future(repos.search_repos(q=None, request=None))
+    
+    assert (await first) == (await second)
+    assert len(calls) == 1